@@ -1,98 +1,155 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify
 from datetime import datetime
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 import os
-from dotenv import load_dotenv
-from database import db
-from routes import routes
-
-# Load environment variables from .env file
-load_dotenv()
-
-app = Flask(__name__)
-
-# Database configuration
-# Get values from .env file
-DB_USER = os.getenv('DB_USER')
-DB_PASSWORD = os.getenv('DB_PASSWORD')
-DB_HOST = os.getenv('DB_HOST')
-DB_PORT = os.getenv('DB_PORT')
-DB_NAME = os.getenv('DB_NAME')
-
-# Configure SQLAlchemy
-# URL encode the password to handle special characters
-from urllib.parse import quote_plus
-encoded_password = quote_plus(DB_PASSWORD)
-app.config['SQLALCHEMY_DATABASE_URI'] = f'postgresql://{DB_USER}:{encoded_password}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Initialize SQLAlchemy
-db.init_app(app)
-from models import User  # Import after db.init_app(app)
-
-# Register the routes blueprint
-app.register_blueprint(routes)
-
-migrate = Migrate(app, db)
-
-# Flag to track database availability
-db_available = True
-
-# For Flask 2.0+ we need to use app.before_request instead
-# and run the check only once
-_db_check_performed = False
-
-@app.before_request
-def check_db_connection():
-    global db_available, _db_check_performed
-    
-    # Only run this check once
-    if _db_check_performed:
-        return None
-    
-    _db_check_performed = True
-    try:
-        from sqlalchemy import text
-        # Try a simple database query
-        db.session.execute(text("SELECT 1"))
-        db_available = True
-        print("Database connection successful")
-    except Exception as e:
-        db_available = False
-        print(f"Database connection failed: {e}")
-        print("Application will continue running with limited functionality")
-
-@app.route("/")
-def hello():
-    return jsonify({
-        "message": "Hello, Flask!",
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    })
-
-@app.route("/health")
-def health_check():
-    # Check database connection
-    db_status = "healthy"
-    db_error = None
-    
-    try:
-        # Execute a simple query to check connection
-        from sqlalchemy import text
-        db.session.execute(text("SELECT 1"))
-    except Exception as e:
-        db_status = "unhealthy"
-        db_error = str(e)
-    
-    return jsonify({
-        "status": "healthy" if db_error is None else "unhealthy",
-        "service": "breaking-into-tech-backend",
-        "database": {
-            "status": db_status,
-            "error": db_error
-        },
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    })
+
+# Blueprints, models and extensions are imported inside create_app, so
+# importing this module is cheap and .env is loaded (and validated) before any
+# module reads its settings. `api.app` is built on first access, which keeps
+# `gunicorn api:app` and `from api import app` working.
+
+
+def create_app(config=None):
+    """Build the app; ``config`` overrides the settings from the environment."""
+    # Load .env and validate every setting once (raises config.ConfigError)
+    from config import load_config
+    settings = load_config(config)
+
+    app = Flask(__name__)
+    app.config.update(settings)
+
+    # orjson-backed jsonify/get_json (stdlib fallback), see json_provider.py
+    from json_provider import FastJSONProvider
+    app.json = FastJSONProvider(app)
+
+    # Request metrics are registered first so they time every other hook
+    import metrics
+    metrics.init_app(app)
+
+    # JSON logs written by a background thread, plus the access log (see logs.py)
+    import logs
+    logs.init_app(app)
+
+    # Opt-in SQL profiling (SQL_PROFILING=true)
+    from query_profiler import profiler
+    profiler.init_app(app)
+
+    # Initialize SQLAlchemy
+    from database import db
+    db.init_app(app)
+    import models  # noqa: F401  Import after db.init_app(app)
+
+    # Register the routes blueprints
+    from routes import routes
+    from bulk_import import bulk
+    from bulk_export import export
+    from directory import directory
+    from media import media
+    app.register_blueprint(routes)
+    app.register_blueprint(bulk)
+    app.register_blueprint(export)
+    app.register_blueprint(directory)
+    app.register_blueprint(media)
+    register_core_routes(app)
+
+    # Flask-Migrate (and alembic) is only needed by `flask db`; MIGRATIONS=True forces it
+    if app.config.get('MIGRATIONS', _running_cli()):
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    # Database availability is tracked by a background prober thread
+    from health import db_prober
+    db_prober.init_app(app, db)
+
+    # Read replicas are probed the same way and leave the rotation when they lag
+    from replicas import replica_router
+    replica_router.init_app(app, db)
+
+    # Revoked access tokens are polled from the database into every worker
+    from revocation import revocations
+    revocations.init_app(app, db)
+
+    # Time a hash on this machine to pick the cost for PASSWORD_HASH_TARGET_MS
+    from password_policy import policy
+    policy.calibrate()
+
+    return app
+
+
+def _running_cli():
+    # True while the app is being loaded by the `flask` command line
+    import click
+    return click.get_current_context(silent=True) is not None
+
+
+def register_core_routes(app):
+    import metrics
+    from database import db
+    from db_pool import pool_stats
+    from health import db_prober
+    from replicas import replica_router
+
+    @app.route("/")
+    def hello():
+        return jsonify({
+            "message": "Hello, Flask!",
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        })
+
+    @app.route("/health")
+    def health_check():
+        # Serve the result of the last background probe; never query the database here
+        db_status = db_prober.status()
+
+        return jsonify({
+            "status": "healthy" if db_status == "healthy" else "unhealthy",
+            "service": "breaking-into-tech-backend",
+            "database": {
+                "status": db_status,
+                "error": db_prober.error,
+                "latency_ms": db_prober.latency_ms,
+                "checked_at": datetime.fromtimestamp(db_prober.checked_at).strftime("%Y-%m-%d %H:%M:%S") if db_prober.checked_at else None
+            },
+            # Replicas only take reads; the service stays healthy without them
+            "replicas": replica_router.status(),
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        })
+
+    @app.route("/health/live")
+    def liveness_check():
+        # The process is up and serving requests
+        return jsonify({"status": "alive"})
+
+    @app.route("/health/ready")
+    def readiness_check():
+        # Ready to take traffic only while the database is reachable
+        if db_prober.is_ready():
+            return jsonify({"status": "ready"})
+        return jsonify({"status": "not ready", "database": db_prober.status(), "error": db_prober.error}), 503
+
+    @app.route("/health/pool")
+    def pool_health():
+        # Connection pool usage and checkout wait times for this worker
+        return jsonify({
+            "pid": os.getpid(),
+            "pool": pool_stats(db.engine),
+            "replicas": {key: pool_stats(db.engines[key]) for key in replica_router.status()},
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        })
+
+    @app.route("/metrics")
+    def metrics_endpoint():
+        # Prometheus text format, merged across workers when METRICS_DIR is set
+        return Response(metrics.exporter.collect(), mimetype='text/plain; version=0.0.4')
+
+
+def __getattr__(name):
+    # Build the module-level app on first access (gunicorn api:app, from api import app)
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000)
+    create_app().run(host="0.0.0.0", port=5000)
@@ -0,0 +1,577 @@
+"""Asyncio (ASGI) serving mode.
+
+Exposes the same endpoints as ``api.py`` on Quart with an async SQLAlchemy
+session, so a slow database call parks a coroutine instead of a whole thread.
+Password hashing still goes through ``hashing.hasher``, called from an executor
+so it never blocks the event loop.
+
+Run it with any ASGI server, e.g.::
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import datetime
+import logging
+import os
+import tempfile
+from functools import wraps
+import jwt
+from dotenv import load_dotenv
+from quart import Quart, jsonify, make_response, redirect, request, g, send_file
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from database import database_uri
+from hashing import hasher, HashingOverloaded
+from auth import (decode_access_token, decode_token, token_cache, invalidate_user_tokens, mint_reset_token,
+                  new_reset_token_claims, reset_token_digest)
+from health import AsyncDBProber
+from password_policy import policy
+from rate_limit import limiter, RateLimited
+from models import User, Profile
+from repository import (email_matches, profile_row_query, profile_version_query, user_with_profile_query,
+                        serialize_profile, invalidate_user_cache)
+from http_cache import profile_etag, cache_headers
+from media import (CHUNK_SIZE, MEDIA_URL_PREFIX, MIMETYPES, UnsupportedImage, UploadTooLarge, immutable, storage,
+                   stored_object, thumbnail_sizes, thumbnail_urls, thumbnails)
+from metrics import MEDIA_UPLOADS
+from outbox import new_job, password_reset_payload, signup_payload, RESET_TOKEN_IN_RESPONSE
+from revocation import revocations
+from tokens import issue_tokens, rotate_refresh_token, revoke_session, revoke_user_tokens
+import logs
+from logs import audit
+
+# Load environment variables from .env file
+load_dotenv()
+
+# JSON logs through the background writer (the access log is Flask-only)
+logs.configure()
+logger = logging.getLogger('asgi')
+
+# Async drivers for the URLs database_uri() produces
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def async_database_uri():
+    uri = os.getenv('ASYNC_DATABASE_URL') or database_uri()
+    scheme, sep, rest = uri.partition('://')
+    return ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+app = Quart(__name__)
+
+# Time a hash on this machine to pick the cost for PASSWORD_HASH_TARGET_MS
+policy.calibrate()
+
+engine = None
+Session = None
+db_prober = AsyncDBProber()
+
+
+@app.before_serving
+async def startup():
+    global engine, Session
+    engine = create_async_engine(async_database_uri(), pool_pre_ping=True)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    db_prober.start(engine)
+    # The revocation set polls from its own thread, so it gets a small sync engine
+    revocations.init_engine(create_engine(database_uri(), pool_pre_ping=True, pool_size=1, max_overflow=0))
+    await asyncio.get_running_loop().run_in_executor(None, revocations.ensure_started)
+
+
+@app.after_serving
+async def shutdown():
+    revocations.stop()
+    await db_prober.stop_async()
+    await engine.dispose()
+
+
+@app.errorhandler(HashingOverloaded)
+async def hashing_overloaded(e):
+    response = jsonify({"error": "Server is busy, please retry shortly"})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+
+@app.errorhandler(RateLimited)
+async def rate_limited(e):
+    response = jsonify({"error": "Too many requests, please retry later"})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+
+def rate_limit(endpoint):
+    """Async counterpart of ``RateLimiter.limit``; the backend call runs in an executor."""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(*args, **kwargs):
+            if limiter.enabled:
+                data = await request.get_json(silent=True)
+                data = data if isinstance(data, dict) else {}
+                await asyncio.get_running_loop().run_in_executor(None, limiter.check, endpoint, {
+                    'ip': request.remote_addr,
+                    'email': data.get('email'),
+                    'entity': data.get('entity'),
+                })
+            return await view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def run_hash(fn, *args):
+    # Keeps the event loop free while the hashing pool does the work
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+async def run_tokens(session, fn, *args):
+    """Run a ``tokens`` function on the sync session behind ``session``; the caller commits."""
+    return await session.run_sync(lambda sync_session: fn(*args, db_session=sync_session))
+
+
+async def invalidate_cached_user(user_id):
+    # Keeps a shared (Redis) lookup cache consistent with writes made here
+    await asyncio.get_running_loop().run_in_executor(None, invalidate_user_cache, user_id)
+
+
+# Rehash tasks in flight; the event loop only keeps weak references to tasks
+rehash_tasks = set()
+
+
+async def rehash_password(user_id, old_hash, password):
+    """Upgrade a hash made with outdated parameters; see ``password_policy``."""
+    try:
+        new_hash = await run_hash(hasher.generate, password)
+        async with Session() as session:
+            # Only replace the hash we verified; a concurrent password change wins
+            await session.execute(
+                update(User)
+                .where(User.id == user_id, User.password_hash == old_hash)
+                .values(password_hash=new_hash)
+            )
+            await session.commit()
+    except HashingOverloaded:
+        pass  # Busy; the next signin tries again
+    except Exception as e:
+        logger.warning("Password rehash for user %s failed: %s", user_id, e)
+
+
+def require_auth(view):
+    """Async counterpart of ``auth.require_auth`` sharing the same token cache."""
+    @wraps(view)
+    async def wrapper(*args, **kwargs):
+        auth_header = request.headers.get('Authorization')
+
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return jsonify({"error": "Bearer token is missing or invalid"}), 401
+
+        token = auth_header.split(' ')[1]  # Extract the token part
+
+        claims = token_cache.get(token)
+        if claims is None:
+            claims, error = decode_access_token(token)
+            if error:
+                return jsonify({"error": error}), 401
+
+            async with Session() as session:
+                exists = await session.scalar(select(User.id).where(User.id == claims['user_id']))
+            if not exists:
+                return jsonify({"error": "User not found"}), 404
+
+            token_cache.put(token, claims)
+
+        # Checked on cache hits too: logout doesn't clear the cache in other workers
+        if revocations.is_revoked(claims):
+            return jsonify({"error": "Token has been revoked"}), 401
+
+        g.user_id = claims['user_id']
+        g.token_claims = claims
+        return await view(*args, **kwargs)
+
+    return wrapper
+
+
+@app.route("/")
+async def hello():
+    return jsonify({
+        "message": "Hello, Flask!",
+        "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    })
+
+
+@app.route("/health")
+async def health_check():
+    db_status = db_prober.status()
+
+    return jsonify({
+        "status": "healthy" if db_status == "healthy" else "unhealthy",
+        "service": "breaking-into-tech-backend",
+        "database": {
+            "status": db_status,
+            "error": db_prober.error,
+            "latency_ms": db_prober.latency_ms,
+            "checked_at": datetime.datetime.fromtimestamp(db_prober.checked_at).strftime("%Y-%m-%d %H:%M:%S") if db_prober.checked_at else None
+        },
+        "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    })
+
+
+@app.route("/health/live")
+async def liveness_check():
+    return jsonify({"status": "alive"})
+
+
+@app.route("/health/ready")
+async def readiness_check():
+    if db_prober.is_ready():
+        return jsonify({"status": "ready"})
+    return jsonify({"status": "not ready", "database": db_prober.status(), "error": db_prober.error}), 503
+
+
+@app.route('/signup', methods=['POST'])
+@rate_limit('signup')
+async def signup():
+    data = await request.get_json()
+    required_fields = ['firstname', 'lastname', 'email', 'password', 'entity']
+    for field in required_fields:
+        if field not in data or not data[field]:
+            return jsonify({'error': f'Missing required field: {field}'}), 400
+
+    async with Session() as session:
+        # Check if user already exists
+        if await session.scalar(select(User.id).where(email_matches(data['email']))):
+            return jsonify({'error': 'Email already registered'}), 409
+
+        hashed_password = await run_hash(hasher.generate, data['password'])
+
+        # Create User and Profile entries
+        user = User(
+            email=data['email'],
+            password_hash=hashed_password,
+            entity=data['entity']
+        )
+        session.add(user)
+        await session.flush()  # Flush to get the user ID for the profile
+
+        profile = Profile(
+            user_id=user.id,
+            firstname=data['firstname'],
+            lastname=data['lastname'],
+            bio=data.get('bio'),
+            profile_picture=data.get('profile_picture')
+        )
+        session.add(profile)
+
+        # Post-signup hooks run in the outbox worker; the job commits with the user
+        session.add(new_job('user_signed_up', signup_payload(user, profile)))
+        await session.commit()
+
+    return jsonify({'message': 'User registered successfully', 'user_id': user.id}), 201
+
+
+@app.route('/signin', methods=['POST'])
+@rate_limit('signin')
+async def signin():
+    data = await request.get_json()
+
+    # Validate input
+    if not data or not data.get('email') or not data.get('password'):
+        return jsonify({"error": "Email and password are required"}), 400
+
+    async with Session() as session:
+        row = (await session.execute(
+            select(User.id, User.password_hash).where(email_matches(data['email']))
+        )).first()
+
+    if not row or not await run_hash(hasher.check, row.password_hash, data['password']):
+        audit('signin_failed', email=data['email'], user_id=row.id if row else None, ip=request.remote_addr)
+        return jsonify({"error": "Invalid email or password"}), 401
+
+    # Upgrade a hash made with outdated parameters in the background
+    if policy.needs_rehash(row.password_hash):
+        task = asyncio.create_task(rehash_password(row.id, row.password_hash, data['password']))
+        rehash_tasks.add(task)
+        task.add_done_callback(rehash_tasks.discard)
+
+    # Start a session: a short-lived access token and a refresh token
+    async with Session() as session:
+        tokens = await run_tokens(session, issue_tokens, row.id)
+        await session.commit()
+
+    audit('signin', user_id=row.id, ip=request.remote_addr)
+    return jsonify({"message": "Login successful", **tokens})
+
+
+@app.route('/token/refresh', methods=['POST'])
+async def refresh_token():
+    data = await request.get_json()
+    if not data or not data.get('refresh_token'):
+        return jsonify({"error": "refresh_token is required"}), 400
+
+    async with Session() as session:
+        rotated = await run_tokens(session, rotate_refresh_token, data['refresh_token'])
+        # Also commits the session being ended when a used token comes back
+        await session.commit()
+    if rotated is None:
+        return jsonify({"error": "Invalid or expired refresh token"}), 401
+
+    _, tokens = rotated
+    return jsonify({"message": "Token refreshed", **tokens})
+
+
+@app.route('/logout', methods=['POST'])
+@require_auth
+async def logout():
+    # Ends the session: its refresh token and current access token stop working
+    async with Session() as session:
+        await run_tokens(session, revoke_session, g.token_claims['sid'])
+        await session.commit()
+    audit('logout', user_id=g.user_id, ip=request.remote_addr)
+
+    return jsonify({"message": "Logged out successfully"})
+
+
+@app.route('/profile', methods=['GET'])
+@require_auth
+async def get_profile():
+    async with Session() as session:
+        # Revalidating a cached copy only needs the updated_at columns
+        if request.if_none_match:
+            version = (await session.execute(profile_version_query(g.user_id))).first()
+            if version and version.profile_id is not None:
+                etag = profile_etag(g.user_id, version.profile_updated_at, version.user_updated_at)
+                if request.if_none_match.contains_weak(etag):
+                    return '', 304, cache_headers(etag)
+
+        row = (await session.execute(profile_row_query(g.user_id))).first()
+
+    if not row:
+        return jsonify({"error": "User not found"}), 404
+
+    if row.profile_id is None:
+        return jsonify({"error": "Profile not found"}), 404
+
+    etag = profile_etag(g.user_id, row.profile_updated_at, row.user_updated_at)
+    return jsonify(serialize_profile(row)), 200, cache_headers(etag)
+
+
+@app.route('/profile', methods=['PUT'])
+@require_auth
+async def update_profile():
+    data = await request.get_json()
+
+    async with Session() as session:
+        user = (await session.execute(user_with_profile_query(g.user_id))).scalars().first()
+        if not user:
+            return jsonify({"error": "User not found"}), 404
+
+        profile = user.profile
+        if not profile:
+            return jsonify({"error": "Profile not found"}), 404
+
+        # Update profile fields
+        profile.firstname = data.get('firstname', profile.firstname)
+        profile.lastname = data.get('lastname', profile.lastname)
+        profile.bio = data.get('bio', profile.bio)
+        profile.profile_picture = data.get('profile_picture', profile.profile_picture)
+
+        # Bump updated_at on every update so cached copies (ETags) are invalidated
+        profile.updated_at = datetime.datetime.utcnow()
+        etag = profile_etag(user.id, profile.updated_at, user.updated_at)
+
+        await session.commit()
+
+    await invalidate_cached_user(g.user_id)
+    return jsonify({"message": "Profile updated successfully"}), 200, {'ETag': f'"{etag}"'}
+
+
+@app.route('/profile/picture', methods=['PUT'])
+@require_auth
+async def upload_profile_picture():
+    too_large = {"error": f"Profile pictures are limited to {storage.max_bytes} bytes"}
+    if request.content_length is not None and request.content_length > storage.max_bytes:
+        MEDIA_UPLOADS.inc('too_large')
+        return jsonify(too_large), 413
+
+    # storage.save reads a blocking stream: spool the body as it arrives (to disk past a
+    # few chunks), then store it from the executor
+    with tempfile.SpooledTemporaryFile(max_size=4 * CHUNK_SIZE) as body:
+        size = 0
+        async for chunk in request.body:
+            size += len(chunk)
+            if size > storage.max_bytes:
+                MEDIA_UPLOADS.inc('too_large')
+                return jsonify(too_large), 413
+            body.write(chunk)
+        body.seek(0)
+        try:
+            stored = await asyncio.get_running_loop().run_in_executor(None, storage.save, body)
+        except UploadTooLarge:
+            return jsonify(too_large), 413
+        except UnsupportedImage:
+            return jsonify({"error": "Profile pictures must be JPEG, PNG, GIF or WebP images"}), 415
+
+    url = f"{MEDIA_URL_PREFIX}{stored.key}"
+    async with Session() as session:
+        user = (await session.execute(user_with_profile_query(g.user_id))).scalars().first()
+        if not user:
+            return jsonify({"error": "User not found"}), 404
+        profile = user.profile
+        if not profile:
+            return jsonify({"error": "Profile not found"}), 404
+
+        profile.profile_picture = url
+        # Bump updated_at so cached copies (ETags) are invalidated
+        profile.updated_at = datetime.datetime.utcnow()
+        await session.commit()
+
+    await invalidate_cached_user(g.user_id)
+    # Thumbnails are made on the media pool after the response
+    thumbnails.schedule(stored.key)
+
+    return jsonify({
+        "message": "Profile picture uploaded successfully",
+        "profile_picture": url,
+        "profile_picture_thumbnails": thumbnail_urls(url),
+        "size": stored.size,
+        "deduplicated": stored.deduplicated,
+    }), 201
+
+
+async def send_media(path, etag):
+    # Same headers as media.py: the key is the content hash, so the ETag never changes
+    if request.if_none_match.contains_weak(etag):
+        response = await make_response('', 304)
+    else:
+        response = await send_file(path, mimetype=MIMETYPES[path.rsplit('.', 1)[1]], add_etags=False)
+    response.set_etag(etag)
+    return immutable(response)
+
+
+@app.route('/media/<key>', methods=['GET'])
+async def media_object(key):
+    path = stored_object(key)
+    if path is None:
+        return jsonify({"error": "Not found"}), 404
+    return await send_media(path, key.split('.')[0])
+
+
+@app.route('/media/thumbs/<int:size>/<key>', methods=['GET'])
+async def media_thumbnail(size, key):
+    if size not in thumbnail_sizes() or stored_object(key) is None:
+        return jsonify({"error": "Not found"}), 404
+    path = storage.thumbnail_path(key, size)
+    if not os.path.exists(path):
+        # Not made yet (or lost): make it now and send the original meanwhile
+        thumbnails.schedule(key)
+        response = redirect(f"{MEDIA_URL_PREFIX}{key}", code=302)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return await send_media(path, f"{key.split('.')[0]}-{size}")
+
+
+@app.route('/change-password', methods=['PUT'])
+@require_auth
+async def change_password():
+    data = await request.get_json()
+    old_password = data.get('old_password')
+    new_password = data.get('new_password')
+    confirm_password = data.get('confirm_password')
+
+    async with Session() as session:
+        user = await session.get(User, g.user_id)
+        if not user:
+            return jsonify({"error": "User not found"}), 404
+
+        if not old_password or not new_password or not confirm_password:
+            return jsonify({"error": "old_password, new_password, and confirm_password are required"}), 400
+
+        if not await run_hash(hasher.check, user.password_hash, old_password):
+            audit('password_change_failed', user_id=g.user_id, ip=request.remote_addr)
+            return jsonify({"error": "Old password is incorrect"}), 400
+
+        if new_password != confirm_password:
+            return jsonify({"error": "Passwords do not match"}), 400
+
+        user.password_hash = await run_hash(hasher.generate, new_password)
+        # Sign out every session, including this one
+        await run_tokens(session, revoke_user_tokens, g.user_id)
+        await session.commit()
+
+    invalidate_user_tokens(g.user_id)
+    await invalidate_cached_user(g.user_id)
+    audit('password_changed', user_id=g.user_id, ip=request.remote_addr)
+    return jsonify({"message": "Password changed successfully"})
+
+
+@app.route('/forgot-password', methods=['POST'])
+@rate_limit('forgot_password')
+async def forgot_password():
+    data = await request.get_json()
+    email = data.get('email')
+
+    if not email:
+        return jsonify({"error": "Email is required"}), 400
+
+    async with Session() as session:
+        user = await session.scalar(select(User).where(email_matches(email)))
+        if not user:
+            return jsonify({"error": "User with this email does not exist"}), 404
+
+        # Generate a reset token
+        claims = new_reset_token_claims()
+        reset_token = mint_reset_token(user.id, **claims)
+
+        # Store a digest of the token in the database for one-time use
+        user.reset_token_hash = reset_token_digest(reset_token)
+
+        # The email is sent by the outbox worker, which mints the token again; the job commits with the digest
+        session.add(new_job('password_reset_email', password_reset_payload(user, claims)))
+        await session.commit()
+        audit('password_reset_requested', user_id=user.id, ip=request.remote_addr)
+
+    response = {"message": "Password token generated successfully"}
+    if RESET_TOKEN_IN_RESPONSE:
+        response["token"] = reset_token
+    return jsonify(response)
+
+
+@app.route('/reset-password', methods=['POST'])
+async def reset_password():
+    data = await request.get_json()
+    token = data.get('token')
+    new_password = data.get('new_password')
+    confirm_password = data.get('confirm_password')
+
+    if not token or not new_password or not confirm_password:
+        return jsonify({"error": "Token, new_password, and confirm_password are required"}), 400
+
+    if new_password != confirm_password:
+        return jsonify({"error": "Passwords do not match"}), 400
+
+    try:
+        decoded_token = decode_token(token)
+    except jwt.ExpiredSignatureError:
+        return jsonify({"error": "Token has expired"}), 401
+    except jwt.InvalidTokenError:
+        return jsonify({"error": "Invalid token"}), 401
+
+    async with Session() as session:
+        user = await session.scalar(select(User).where(User.reset_token_hash == reset_token_digest(token)))
+        if not user or user.id != decoded_token['user_id']:
+            audit('password_reset_failed', user_id=decoded_token['user_id'], reason='token_not_current',
+                  ip=request.remote_addr)
+            return jsonify({"error": "Invalid or already used token"}), 401
+
+        user.password_hash = await run_hash(hasher.generate, new_password)
+        user.reset_token_hash = None  # Invalidate the token after use
+        await run_tokens(session, revoke_user_tokens, user.id)
+        await session.commit()
+
+    invalidate_user_tokens(user.id)
+    await invalidate_cached_user(user.id)
+    audit('password_reset', user_id=user.id, ip=request.remote_addr)
+    return jsonify({"message": "Password reset successfully"})
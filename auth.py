@@ -0,0 +1,181 @@
+"""Bearer token authentication for the protected routes.
+
+``require_auth`` parses the ``Authorization`` header, verifies the JWT and
+checks that the user exists and that the token hasn't been revoked (see
+``revocation.py``). The result is kept in a bounded LRU/TTL cache keyed
+on a digest of the token, so repeat requests from an active client skip both
+the HMAC verification and the user lookup.
+"""
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+import jwt
+from flask import g, jsonify, request
+from metrics import JWT_SECONDS
+from repository import cached_user_exists
+from revocation import revocations
+
+# Secret key for JWT encoding/decoding
+SECRET_KEY = "your_secret_key"
+
+
+def encode_token(payload):
+    with JWT_SECONDS.time('encode'):
+        return jwt.encode(payload, SECRET_KEY, algorithm='HS256')
+
+
+def decode_token(token):
+    with JWT_SECONDS.time('decode'):
+        return jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+
+
+class TokenCache:
+    def __init__(self, maxsize=None, ttl=None):
+        if maxsize is None:
+            maxsize = int(os.getenv('AUTH_CACHE_SIZE', 10000))
+        if ttl is None:
+            ttl = float(os.getenv('AUTH_CACHE_TTL', 300))
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # digest -> (claims, expires_at)
+        self._by_user = {}  # user_id -> set of digests
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        key = self.key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            claims, expires_at = entry
+            if time.time() >= expires_at:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return claims
+
+    def put(self, token, claims):
+        if self.maxsize <= 0:
+            return
+        # Never keep an entry past the token's own expiry
+        expires_at = time.time() + self.ttl
+        if 'exp' in claims:
+            expires_at = min(expires_at, claims['exp'])
+        key = self.key(token)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (claims, expires_at)
+            self._by_user.setdefault(claims['user_id'], set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in self._by_user.pop(user_id, ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def _remove(self, key):
+        claims, _ = self._entries.pop(key)
+        keys = self._by_user.get(claims['user_id'])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[claims['user_id']]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+token_cache = TokenCache()
+
+# Access tokens carry their id, session and issue time (see tokens.py); reset tokens don't
+ACCESS_TOKEN_CLAIMS = ('user_id', 'jti', 'sid', 'iat')
+
+
+def decode_access_token(token):
+    """Verify an access token; returns ``(claims, None)`` or ``(None, error)`` for a 401.
+
+    Shared with the ASGI ``require_auth``, which also checks ``revocations.is_revoked``.
+    """
+    try:
+        claims = decode_token(token)
+    except jwt.ExpiredSignatureError:
+        return None, "Token has expired"
+    except jwt.InvalidTokenError:
+        return None, "Invalid token"
+    if any(name not in claims for name in ACCESS_TOKEN_CLAIMS):
+        return None, "Invalid token"
+    return claims, None
+
+
+def require_auth(view):
+    """Authenticate the request and expose ``g.user_id`` and ``g.token_claims``."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        auth_header = request.headers.get('Authorization')
+
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return jsonify({"error": "Bearer token is missing or invalid"}), 401
+
+        token = auth_header.split(' ')[1]  # Extract the token part
+
+        claims = token_cache.get(token)
+        if claims is None:
+            claims, error = decode_access_token(token)
+            if error:
+                return jsonify({"error": error}), 401
+
+            # Only tokens for existing users are cached
+            if not cached_user_exists(claims['user_id']):
+                return jsonify({"error": "User not found"}), 404
+
+            token_cache.put(token, claims)
+
+        # Checked on cache hits too: logout doesn't clear the cache in other workers
+        if revocations.is_revoked(claims):
+            return jsonify({"error": "Token has been revoked"}), 401
+
+        g.user_id = claims['user_id']
+        g.token_claims = claims
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def reset_token_digest(token):
+    """Fixed-size digest stored (and indexed) in place of the raw reset token."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def new_reset_token_claims():
+    """``exp`` (Unix time) and ``jti`` for a reset token issued now."""
+    return {'exp': int(time.time()) + 60 * int(os.getenv('RESET_TOKEN_EXPIRATION_MINUTES', 5)),
+            'jti': secrets.token_hex(16)}
+
+
+def mint_reset_token(user_id, exp, jti):
+    """Password reset token for ``user_id`` with the given claims.
+
+    The same arguments always give the same token, so the reset email job only
+    stores the claims and the outbox worker mints the token again.
+    """
+    return encode_token({'user_id': user_id, 'exp': exp, 'jti': jti})
+
+
+def invalidate_user_tokens(user_id):
+    """Drop cached verifications for ``user_id`` (password change, reset, ...)."""
+    token_cache.invalidate_user(user_id)
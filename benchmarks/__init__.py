@@ -0,0 +1,13 @@
+"""Load tests and micro-benchmarks.
+
+Run a benchmark as a module from the project root, e.g.::
+
+    python -m benchmarks.endpoints --users 10000 --concurrency 32 --requests 2000
+    python -m benchmarks.micro
+
+``python -m benchmarks`` runs both with their defaults. Results are written as
+JSON under ``benchmarks/results/`` (named after the current commit) so runs can
+be diffed between commits.
+
+Without ``DATABASE_URL`` set the benchmarks use a temporary SQLite database.
+"""
@@ -0,0 +1,9 @@
+"""Run the endpoint load test and the micro-benchmarks with default settings."""
+import sys
+from benchmarks import endpoints, micro
+
+if __name__ == '__main__':
+    argv = sys.argv
+    for module in (micro, endpoints):
+        sys.argv = [argv[0]]
+        module.main()
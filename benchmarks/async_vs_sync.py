@@ -0,0 +1,64 @@
+"""Compare the threaded Flask app with the asyncio (ASGI) app under concurrency."""
+import argparse
+import json
+import os
+import sys
+from benchmarks.common import load_app, run_concurrent
+from benchmarks.http import request, start_server, stop_server, python_server
+
+SYNC_SERVER = (
+    "from werkzeug.serving import run_simple; import api; "
+    "run_simple('127.0.0.1', {port}, api.app, threaded=True)"
+)
+
+
+def seed(app):
+    client = app.test_client()
+    client.post('/signup', json={
+        "firstname": "Bench", "lastname": "User", "email": "async-bench@example.com",
+        "password": "bench-password", "entity": "bench",
+    })
+    token = client.post('/signin', json={
+        "email": "async-bench@example.com", "password": "bench-password",
+    }).get_json()['token']
+    return {"Authorization": f"Bearer {token}"}
+
+
+def drive(port, headers, concurrency, total):
+    return {
+        "health": run_concurrent(
+            lambda: request(port, 'GET', '/health')[0] == 200, concurrency, total),
+        "get_profile": run_concurrent(
+            lambda: request(port, 'GET', '/profile', headers=headers)[0] == 200, concurrency, total),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--sync-port', type=int, default=5101)
+    parser.add_argument('--async-port', type=int, default=5102)
+    args = parser.parse_args()
+
+    headers = seed(load_app())
+    env = dict(os.environ)
+
+    results = {}
+    servers = {
+        "sync": (python_server(SYNC_SERVER.format(port=args.sync_port)), args.sync_port),
+        "async": ([sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(args.async_port),
+                   '--log-level', 'warning'], args.async_port),
+    }
+    for name, (command, port) in servers.items():
+        process = start_server(command, port, env=env)
+        try:
+            results[name] = drive(port, headers, args.concurrency, args.requests)
+        finally:
+            stop_server(process)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+import os
+import tempfile
+import threading
+import time
+
+
+def use_local_database():
+    # Fall back to a throwaway SQLite file when no database is configured
+    if not os.getenv('DATABASE_URL'):
+        path = os.path.join(tempfile.mkdtemp(prefix='bit-bench-'), 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    return os.environ['DATABASE_URL']
+
+
+def load_app():
+    use_local_database()
+    from api import create_app
+    from database import db
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def percentiles(samples, points=(50, 95, 99)):
+    ordered = sorted(samples)
+    if not ordered:
+        return {f"p{p}_ms": 0.0 for p in points}
+    return {
+        f"p{p}_ms": ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)] * 1000
+        for p in points
+    }
+
+
+def run_concurrent(fn, concurrency, total):
+    """Call ``fn()`` ``total`` times from ``concurrency`` threads.
+
+    Returns a summary with throughput, latency percentiles and error count;
+    ``fn`` returns a truthy value on success.
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    remaining = [total]
+
+    def worker():
+        local = []
+        failed = 0
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+            start = time.perf_counter()
+            ok = fn()
+            local.append(time.perf_counter() - start)
+            if not ok:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    summary = {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors[0],
+        "seconds": elapsed,
+        "rps": total / elapsed if elapsed else 0.0,
+    }
+    summary.update(percentiles(latencies))
+    return summary
+
+
+def seed_users(app, count, password='bench-password', entity='bench', prefix='seed'):
+    """Insert ``count`` users with profiles and return their ids.
+
+    All seeded users share one password hash so seeding does not spend minutes
+    hashing.
+    """
+    from sqlalchemy import insert, select
+    from werkzeug.security import generate_password_hash
+    from database import db
+    from models import User, Profile
+
+    pwhash = generate_password_hash(password)
+    with app.app_context():
+        existing = db.session.execute(
+            select(User.id).where(User.email.like(f'{prefix}-%@example.com')).order_by(User.id)
+        ).scalars().all()
+        if len(existing) >= count:
+            return existing[:count]
+
+        user_ids = db.session.execute(
+            insert(User).returning(User.id, sort_by_parameter_order=True),
+            [{"email": f"{prefix}-{i}@example.com", "password_hash": pwhash, "entity": entity}
+             for i in range(len(existing), count)],
+        ).scalars().all()
+        db.session.execute(insert(Profile), [
+            {"user_id": user_id, "firstname": f"First{user_id}", "lastname": f"Last{user_id}",
+             "bio": "Seeded for benchmarks"}
+            for user_id in user_ids
+        ])
+        db.session.commit()
+        return existing + user_ids
+
+
+def issue_access_tokens(app, user_ids):
+    """Start a session for each user, as signin would, and return ``{user_id: access token}``."""
+    from database import db
+    from tokens import issue_tokens
+
+    with app.app_context():
+        tokens = {user_id: issue_tokens(user_id)['token'] for user_id in user_ids}
+        db.session.commit()
+    return tokens
+
+
+def git_commit():
+    import subprocess
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True, cwd=os.path.dirname(os.path.dirname(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(name, results, output=None, params=None):
+    """Write ``results`` as JSON with enough metadata to diff runs between commits."""
+    import json
+    import platform
+    from datetime import datetime, timezone
+
+    commit = git_commit()
+    document = {
+        "benchmark": name,
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "database": os.getenv('DATABASE_URL', '').split('://', 1)[0],
+        "params": params or {},
+        "results": results,
+    }
+    if output is None:
+        directory = os.path.join(os.path.dirname(__file__), 'results')
+        os.makedirs(directory, exist_ok=True)
+        output = os.path.join(directory, f"{name}-{commit or 'unknown'}.json")
+    with open(output, 'w') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+    return output
@@ -0,0 +1,59 @@
+"""Compare full and conditional ``GET /profile`` requests.
+
+A polling client that sends back the ETag it was given gets a bodiless 304 as
+long as the profile is unchanged. This reports latency, bytes on the wire
+(status line, headers and body) and SQL statements per request for both cases.
+"""
+import argparse
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from benchmarks.common import issue_access_tokens, load_app, seed_users, write_results
+from benchmarks.micro import measure
+
+
+def response_bytes(response):
+    head = f"HTTP/1.1 {response.status}\r\n" + ''.join(f"{k}: {v}\r\n" for k, v in response.headers.items())
+    return len(head.encode()) + 2 + len(response.get_data())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--output', default=None, help='JSON results file (defaults to benchmarks/results/)')
+    args = parser.parse_args()
+
+    app = load_app()
+    user_id = seed_users(app, 1)[0]
+    token = issue_access_tokens(app, [user_id])[user_id]
+    headers = {"Authorization": f"Bearer {token}"}
+    client = app.test_client()
+    etag = client.get('/profile', headers=headers).headers['ETag']
+
+    cases = {
+        "full": headers,
+        "conditional": {**headers, "If-None-Match": etag},
+    }
+    statements = []
+    listener = lambda *a: statements.append(a[2])
+    results = {}
+    for name, request_headers in cases.items():
+        sample = client.get('/profile', headers=request_headers)
+        event.listen(Engine, 'before_cursor_execute', listener)
+        statements.clear()
+        results[name] = measure(lambda: client.get('/profile', headers=request_headers), args.iterations)
+        event.remove(Engine, 'before_cursor_execute', listener)
+        results[name].update({
+            "status": sample.status_code,
+            "bytes": response_bytes(sample),
+            "sql_statements_per_request": len(statements) / args.iterations,
+        })
+        print(f"{name:12} status {sample.status_code}  {results[name]['bytes']:5} bytes  "
+              f"{results[name]['sql_statements_per_request']:.1f} queries  "
+              f"p50 {results[name]['p50_us']:8.1f} us  p99 {results[name]['p99_us']:8.1f} us")
+
+    path = write_results('conditional_get', results, args.output, params=vars(args))
+    print(f"Results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
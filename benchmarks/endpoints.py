@@ -0,0 +1,157 @@
+"""Load test every API endpoint against a seeded database.
+
+Seeds ``--users`` users with profiles, then drives each endpoint with
+``--requests`` calls from ``--concurrency`` threads and reports throughput and
+p50/p95/p99 latency. Results are written as JSON (see ``--output``).
+"""
+import argparse
+import itertools
+import random
+import threading
+from collections import Counter
+from benchmarks.common import issue_access_tokens, load_app, run_concurrent, seed_users, write_results
+
+PASSWORD = 'bench-password'
+ENDPOINTS = ['health', 'signup', 'signin', 'get_profile', 'update_profile',
+             'change_password', 'forgot_password', 'reset_password']
+
+
+class Scenario:
+    def __init__(self, app, user_ids):
+        self.app = app
+        self.user_ids = user_ids
+        self.emails = {user_id: f"seed-{i}@example.com" for i, user_id in enumerate(user_ids)}
+        self._local = threading.local()
+        self._status_lock = threading.Lock()
+        self.statuses = Counter()
+        self._signup_ids = itertools.count()
+        self.sign_in_all()
+
+    def sign_in_all(self):
+        # Sessions are started directly so the load test does not start with N signins
+        self.tokens = issue_access_tokens(self.app, self.user_ids)
+
+    @property
+    def client(self):
+        # One test client per thread
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        return client
+
+    def _check(self, response, expected=200):
+        # Status codes are tallied so shed load (503) is told apart from failures
+        with self._status_lock:
+            self.statuses[response.status_code] += 1
+        return response.status_code == expected
+
+    def _user(self):
+        user_id = random.choice(self.user_ids)
+        return user_id, {"Authorization": f"Bearer {self.tokens[user_id]}"}
+
+    def health(self):
+        return self._check(self.client.get('/health'), 200)
+
+    def signup(self):
+        n = next(self._signup_ids)
+        return self._check(self.client.post('/signup', json={
+            "firstname": "Load", "lastname": "Test", "email": f"signup-{n}-{random.random()}@example.com",
+            "password": PASSWORD, "entity": "bench",
+        }), 201)
+
+    def signin(self):
+        user_id, _ = self._user()
+        return self._check(self.client.post('/signin', json={
+            "email": self.emails[user_id], "password": PASSWORD,
+        }), 200)
+
+    def get_profile(self):
+        _, headers = self._user()
+        return self._check(self.client.get('/profile', headers=headers), 200)
+
+    def update_profile(self):
+        _, headers = self._user()
+        return self._check(self.client.put('/profile', headers=headers, json={
+            "bio": f"Updated {random.random()}",
+        }), 200)
+
+    def prepare_password_changes(self, count):
+        # A change ends every session of the user, so each call gets a user of its own
+        self._password_users = random.sample(self.user_ids, count)
+        self._password_lock = threading.Lock()
+
+    def change_password(self):
+        # Same old and new password so every seeded user stays usable
+        with self._password_lock:
+            if not self._password_users:
+                return False
+            user_id = self._password_users.pop()
+        headers = {"Authorization": f"Bearer {self.tokens[user_id]}"}
+        return self._check(self.client.put('/change-password', headers=headers, json={
+            "old_password": PASSWORD, "new_password": PASSWORD, "confirm_password": PASSWORD,
+        }), 200)
+
+    def forgot_password(self):
+        user_id, _ = self._user()
+        return self._check(self.client.post('/forgot-password', json={"email": self.emails[user_id]}), 200)
+
+    def prepare_reset_tokens(self, count):
+        # One pending reset token per user, requested up front and not timed
+        self._reset_tokens = []
+        for user_id in self.user_ids[:count]:
+            response = self.client.post('/forgot-password', json={"email": self.emails[user_id]})
+            self._reset_tokens.append(response.get_json()['token'])
+        self._reset_lock = threading.Lock()
+
+    def reset_password(self):
+        with self._reset_lock:
+            if not self._reset_tokens:
+                return False
+            token = self._reset_tokens.pop()
+        return self._check(self.client.post('/reset-password', json={
+            "token": token, "new_password": PASSWORD, "confirm_password": PASSWORD,
+        }), 200)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=ENDPOINTS)
+    parser.add_argument('--output', default=None, help='JSON results file (defaults to benchmarks/results/)')
+    args = parser.parse_args()
+
+    from rate_limit import limiter
+    app = load_app()
+    import routes
+    # Measure the endpoints, not the throttling (benchmarks/rate_limit.py covers the limiter)
+    limiter.enabled = False
+    # reset_password needs the tokens that would otherwise only be emailed
+    routes.RESET_TOKEN_IN_RESPONSE = True
+    scenario = Scenario(app, seed_users(app, args.users))
+
+    results = {}
+    for name in args.endpoints:
+        total = args.requests
+        if name == 'change_password':
+            total = min(total, len(scenario.user_ids))
+            scenario.prepare_password_changes(total)
+        if name == 'reset_password':
+            total = min(total, len(scenario.user_ids))
+            scenario.prepare_reset_tokens(total)
+        scenario.statuses.clear()
+        results[name] = run_concurrent(getattr(scenario, name), args.concurrency, total)
+        if name in ('change_password', 'reset_password'):
+            # Both end the users' sessions; later endpoints need live tokens
+            scenario.sign_in_all()
+        results[name]["statuses"] = {str(code): count for code, count in sorted(scenario.statuses.items())}
+        print(f"{name:16} {results[name]['rps']:9.1f} req/s  p50 {results[name]['p50_ms']:7.2f} ms  "
+              f"p99 {results[name]['p99_ms']:7.2f} ms  statuses {results[name]['statuses']}")
+
+    path = write_results('endpoints', results, args.output, params=vars(args))
+    print(f"Results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""In-process stand-in for the Redis server behind the shared backends.
+
+Speaks enough of the Redis protocol for the rate limiter (EVAL/EVALSHA of the
+token-bucket script, run with the same ``rate_limit.take`` step the in-memory
+backend uses) and the lookup cache (GET, SET with PX/EX, DEL), plus PING, AUTH,
+SELECT and FLUSHALL. It lets the shared backends be exercised, over real
+sockets and from several processes, without a Redis install.
+"""
+import socketserver
+import threading
+import time
+from rate_limit import TOKEN_BUCKET_SCRIPT, TOKEN_BUCKET_SHA, take
+
+
+def _encode(value):
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, Exception):
+        return f"-{value}\r\n".encode()
+    if isinstance(value, int):
+        return f":{value}\r\n".encode()
+    if isinstance(value, list):
+        return f"*{len(value)}\r\n".encode() + b''.join(_encode(item) for item in value)
+    if value == 'OK' or value == 'PONG':
+        return f"+{value}\r\n".encode()
+    data = str(value).encode()
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+class FakeRedis:
+    def __init__(self):
+        self.buckets = {}
+        self.values = {}  # key -> (value, expires_at or None)
+        self.scripts = set()
+        self.lock = threading.Lock()
+        self.commands = 0
+
+    def token_bucket(self, keys, args):
+        now, cost = float(args[0]), float(args[1])
+        limits = [(float(args[2 + 2 * i]), float(args[3 + 2 * i])) for i in range(len(keys))]
+        with self.lock:
+            allowed, retry_after, states = take([self.buckets.get(key) for key in keys], now, limits, cost)
+            if allowed:
+                self.buckets.update(zip(keys, states))
+        return [int(allowed), repr(retry_after)]
+
+    def execute(self, args):
+        self.commands += 1
+        command = args[0].upper()
+        if command == 'PING':
+            return 'PONG'
+        if command in ('AUTH', 'SELECT'):
+            return 'OK'
+        if command == 'FLUSHALL':
+            with self.lock:
+                self.buckets.clear()
+                self.values.clear()
+            return 'OK'
+        if command == 'GET':
+            with self.lock:
+                value, expires_at = self.values.get(args[1], (None, None))
+                if expires_at is not None and expires_at <= time.monotonic():
+                    del self.values[args[1]]
+                    value = None
+            return value
+        if command == 'SET':
+            expires_at = None
+            options = [arg.upper() for arg in args[3:]]
+            if 'PX' in options:
+                expires_at = time.monotonic() + int(args[4 + options.index('PX')]) / 1000
+            elif 'EX' in options:
+                expires_at = time.monotonic() + int(args[4 + options.index('EX')])
+            with self.lock:
+                self.values[args[1]] = (args[2], expires_at)
+            return 'OK'
+        if command == 'DEL':
+            with self.lock:
+                return sum(self.values.pop(key, None) is not None for key in args[1:])
+        if command == 'SCRIPT' and args[1].upper() == 'LOAD':
+            if args[2] != TOKEN_BUCKET_SCRIPT:
+                return Exception("ERR fake server only knows the token bucket script")
+            self.scripts.add(TOKEN_BUCKET_SHA)
+            return TOKEN_BUCKET_SHA
+        if command in ('EVAL', 'EVALSHA'):
+            script, numkeys = args[1], int(args[2])
+            if command == 'EVAL':
+                if script != TOKEN_BUCKET_SCRIPT:
+                    return Exception("ERR fake server only knows the token bucket script")
+                self.scripts.add(TOKEN_BUCKET_SHA)
+            elif script not in self.scripts:
+                return Exception("NOSCRIPT No matching script. Please use EVAL.")
+            return self.token_bucket(args[3:3 + numkeys], args[3 + numkeys:])
+        return Exception(f"ERR unknown command '{args[0]}'")
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            count = int(line[1:-2])
+            args = []
+            for _ in range(count):
+                length = int(self.rfile.readline()[1:-2])
+                args.append(self.rfile.read(length + 2)[:-2].decode())
+            self.wfile.write(_encode(self.server.fake.execute(args)))
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0):
+        super().__init__((host, port), _Handler)
+        self.fake = FakeRedis()
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f"redis://{host}:{port}/0"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='fake-redis', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,50 @@
+"""Helpers for benchmarks that talk to a real server over HTTP."""
+import http.client
+import json
+import subprocess
+import sys
+import time
+
+PROJECT_ROOT = __file__.rsplit('/benchmarks/', 1)[0]
+
+
+def request(port, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        conn.request(method, path, body=payload, headers=headers)
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def start_server(args, port, env=None, timeout=30):
+    """Start a server subprocess and wait until /health/live answers."""
+    process = subprocess.Popen(args, cwd=PROJECT_ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if request(port, 'GET', '/health/live')[0] == 200:
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"Server {args!r} did not start on port {port}")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def python_server(code):
+    return [sys.executable, '-c', code]
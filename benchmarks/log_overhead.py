@@ -0,0 +1,133 @@
+"""Measure what logging adds to a request.
+
+Four cases:
+
+- ``off``: no access log, the baseline;
+- ``queued``: the access log through the queue handler and background writer
+  (the default, see logs.py);
+- ``sampled``: the same with the endpoint sampled at ``--sample-rate``;
+- ``sync_file``: the same JSON records written by a plain ``FileHandler`` on
+  the request thread, as logging to a file without the queue would.
+
+``record_<case>`` times the access log call on its own, inside a request
+context: the logging cost each request pays. ``<endpoint>_<case>`` times whole
+requests (``GET /health/live`` and an authenticated ``GET /profile``); the
+cases take turns in ``--rounds`` rounds so they see the same machine noise, and
+``overhead_us`` is the p50 difference from ``off``. ``<endpoint>_<case>_concurrent``
+is the throughput from ``--concurrency`` threads.
+"""
+import argparse
+import logging
+import os
+import tempfile
+import threading
+import time
+from benchmarks.common import load_app, percentiles, run_concurrent, seed_users, write_results
+from benchmarks.micro import measure
+
+CASES = ('off', 'queued', 'sampled', 'sync_file')
+
+
+def interleaved(setup, call, iterations, rounds):
+    samples = {case: [] for case in CASES}
+    for _ in range(rounds):
+        for case in CASES:
+            setup(case)
+            for _ in range(iterations // rounds):
+                start = time.perf_counter()
+                call()
+                samples[case].append(time.perf_counter() - start)
+    results = {}
+    for case, values in samples.items():
+        result = {"iterations": len(values), "mean_us": sum(values) / len(values) * 1e6}
+        result.update({key.replace('_ms', '_us'): value * 1000 for key, value in percentiles(values).items()})
+        results[case] = result
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=10000)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--sample-rate', type=float, default=0.1)
+    parser.add_argument('--output', default=None, help='JSON results file (defaults to benchmarks/results/)')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bit-logs-')
+    os.environ['LOG_FILE'] = os.path.join(directory, 'app.log')
+    app = load_app()
+    seed_users(app, 1)
+
+    import logs
+    from flask import g
+    from rate_limit import limiter
+    limiter.enabled = False
+
+    client = app.test_client()
+    token = client.post('/signin', json={"email": "seed-0@example.com", "password": "bench-password"}).get_json()['token']
+    headers = {'Authorization': f'Bearer {token}'}
+    endpoints = {
+        "liveness": ('liveness_check', lambda c: c.get('/health/live')),
+        "profile": ('routes.get_profile', lambda c: c.get('/profile', headers=headers)),
+    }
+
+    root = logging.getLogger()
+    queued_handlers = list(root.handlers)
+    sync_handler = logging.FileHandler(os.path.join(directory, 'sync.log'))
+    sync_handler.setFormatter(logs.JSONFormatter())
+
+    def configure(endpoint):
+        def setup(case):
+            logs.access_logger.disabled = case == 'off'
+            logs.access_log.sample_rates = {endpoint: args.sample_rate} if case == 'sampled' else {}
+            root.handlers = [sync_handler] if case == 'sync_file' else queued_handlers
+        return setup
+
+    results = {}
+    with app.test_request_context('/health/live'):
+        app.preprocess_request()
+        g.pop('access_start', None)
+        setup = configure('liveness_check')
+        for case in CASES:
+            setup(case)
+            results[f"record_{case}"] = measure(lambda: logs.access_log.record(200, 0.5), args.iterations)
+            logs.flush(60)
+            print(f"record    {case:10} p50 {results[f'record_{case}']['p50_us']:8.2f} us  "
+                  f"p99 {results[f'record_{case}']['p99_us']:8.2f} us")
+
+    local = threading.local()
+
+    def thread_client():
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        return local.client
+
+    for name, (endpoint, call) in endpoints.items():
+        setup = configure(endpoint)
+        for case, result in interleaved(setup, lambda: call(client), args.iterations, args.rounds).items():
+            results[f"{name}_{case}"] = result
+        logs.flush(60)
+        for case in CASES:
+            setup(case)
+            results[f"{name}_{case}_concurrent"] = run_concurrent(
+                lambda: call(thread_client()).status_code == 200, args.concurrency, args.requests)
+            # Don't let one case's backlog slow down the next
+            logs.flush(60)
+
+        baseline = results[f"{name}_off"]["p50_us"]
+        for case in CASES:
+            result = results[f"{name}_{case}"]
+            result["overhead_us"] = result["p50_us"] - baseline
+            print(f"{name:9} {case:10} p50 {result['p50_us']:8.1f} us  p99 {result['p99_us']:8.1f} us  "
+                  f"overhead {result['overhead_us']:7.1f} us  "
+                  f"{results[f'{name}_{case}_concurrent']['rps']:8.1f} req/s at concurrency {args.concurrency}")
+    root.handlers = queued_handlers
+
+    path = write_results('log_overhead', results, args.output, params=vars(args))
+    print(f"Results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Measure the user/profile lookup cache.
+
+For each backend (``off``, in-process ``memory``, and ``redis`` against
+``fake_redis``):
+
+- ``get_profile``: GET /profile for random seeded users, with the hit rate and
+  SQL statements per request;
+- ``stampede``: ``--concurrency`` threads requesting the same cold profile at
+  once, counting the SQL statements it took to fill the cache.
+"""
+import argparse
+import random
+import threading
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from benchmarks.common import issue_access_tokens, load_app, run_concurrent, seed_users, write_results
+from benchmarks.fake_redis import FakeRedisServer
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, *args):
+        with self._lock:
+            self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(Engine, 'before_cursor_execute', self)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(Engine, 'before_cursor_execute', self)
+
+
+def cache_counts(cache_name):
+    from metrics import CACHE_REQUESTS
+    return {labels[1]: value for labels, value in CACHE_REQUESTS.snapshot()["samples"]
+            if labels[0] == cache_name}
+
+
+def run(app, user_ids, headers, args):
+    from cache import lookup_cache
+    from repository import invalidate_user_cache
+    from auth import token_cache
+
+    local = threading.local()
+
+    def client():
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        return local.client
+
+    def get_profile():
+        return client().get('/profile', headers=headers[random.choice(user_ids)]).status_code == 200
+
+    results = {}
+    token_cache.clear()
+    before = cache_counts(lookup_cache.name)
+    with StatementCounter() as statements:
+        results["get_profile"] = run_concurrent(get_profile, args.concurrency, args.requests)
+    after = cache_counts(lookup_cache.name)
+    hits = after.get('hit', 0) - before.get('hit', 0)
+    misses = after.get('miss', 0) - before.get('miss', 0)
+    results["get_profile"].update({
+        "hit_rate": hits / (hits + misses) if hits + misses else None,
+        "sql_statements_per_request": statements.count / args.requests,
+    })
+
+    # Every thread asks for the same cold key at the same moment
+    user_id = user_ids[0]
+    invalidate_user_cache(user_id)
+    barrier = threading.Barrier(args.concurrency)
+
+    def stampede():
+        barrier.wait()
+        return client().get('/profile', headers=headers[user_id]).status_code == 200
+
+    with StatementCounter() as statements:
+        results["stampede"] = run_concurrent(stampede, args.concurrency, args.concurrency)
+    results["stampede"]["sql_statements"] = statements.count
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--output', default=None, help='JSON results file (defaults to benchmarks/results/)')
+    args = parser.parse_args()
+
+    from cache import LookupCache, MemoryCache, RedisCache
+    import repository
+
+    app = load_app()
+    user_ids = seed_users(app, args.users)
+    headers = {user_id: {"Authorization": f"Bearer {token}"}
+               for user_id, token in issue_access_tokens(app, user_ids).items()}
+
+    server = FakeRedisServer().start()
+    results = {}
+    try:
+        for name, backend in (("off", None), ("memory", MemoryCache()), ("redis", RedisCache(server.url, timeout=5))):
+            # The cache is looked up through repository, so swap the shared instance there
+            repository.lookup_cache = LookupCache(backend)
+            results[name] = run(app, user_ids, headers, args)
+            profile, stampede = results[name]["get_profile"], results[name]["stampede"]
+            hit_rate = f"{profile['hit_rate']:.1%}" if profile['hit_rate'] is not None else 'n/a'
+            print(f"{name:7} get_profile {profile['rps']:8.1f} req/s  p50 {profile['p50_ms']:6.2f} ms  "
+                  f"p99 {profile['p99_ms']:6.2f} ms  hit rate {hit_rate}  "
+                  f"{profile['sql_statements_per_request']:.2f} queries/req  "
+                  f"stampede of {args.concurrency}: {stampede['sql_statements']} queries")
+    finally:
+        server.stop()
+
+    path = write_results('lookup_cache', results, args.output, params=vars(args))
+    print(f"Results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
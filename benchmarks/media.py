@@ -0,0 +1,91 @@
+"""Measure profile picture uploads and media serving.
+
+- ``upload_new``: PUT /profile/picture with a distinct ``--size`` byte image
+  each time (streamed, hashed and moved into the store);
+- ``upload_duplicate``: the same image again and again, which is only hashed;
+- ``get_media`` / ``get_media_conditional``: GET /media/<key> in full and with
+  ``If-None-Match`` (304, no body);
+- ``save_memory``: peak Python memory of ``storage.save`` on a ``--large-mb``
+  stream against reading the whole body first, as ``request.data`` would.
+"""
+import argparse
+import os
+import tempfile
+import threading
+import tracemalloc
+from benchmarks.common import load_app, run_concurrent, seed_users, write_results
+
+PNG_HEADER = b'\x89PNG\r\n\x1a\n'
+
+
+def image(size):
+    # Uploads are only sniffed, not decoded: a PNG signature and random bytes will do
+    return PNG_HEADER + os.urandom(size - len(PNG_HEADER))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--size', type=int, default=200 * 1024)
+    parser.add_argument('--large-mb', type=int, default=4)
+    parser.add_argument('--output', default=None, help='JSON results file (defaults to benchmarks/results/)')
+    args = parser.parse_args()
+
+    os.environ.setdefault('MEDIA_DIR', tempfile.mkdtemp(prefix='bit-media-'))
+    os.environ.setdefault('MEDIA_MAX_BYTES', str(max(args.size, args.large_mb * 1024 * 1024) + 1))
+    app = load_app()
+    seed_users(app, 1)
+
+    import media
+    from rate_limit import limiter
+    limiter.enabled = False
+
+    client = app.test_client()
+    token = client.post('/signin', json={"email": "seed-0@example.com", "password": "bench-password"}).get_json()['token']
+    headers = {'Authorization': f'Bearer {token}'}
+    duplicate = image(args.size)
+    url = client.put('/profile/picture', headers=headers, data=duplicate).get_json()['profile_picture']
+    etag = client.get(url).headers['ETag']
+
+    local = threading.local()
+
+    def thread_client():
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        return local.client
+
+    cases = {
+        "upload_new": lambda: thread_client().put('/profile/picture', headers=headers,
+                                                  data=image(args.size)).status_code == 201,
+        "upload_duplicate": lambda: thread_client().put('/profile/picture', headers=headers,
+                                                        data=duplicate).status_code == 201,
+        "get_media": lambda: thread_client().get(url).status_code == 200,
+        "get_media_conditional": lambda: thread_client().get(url, headers={'If-None-Match': etag}).status_code == 304,
+    }
+    results = {}
+    for name, call in cases.items():
+        results[name] = run_concurrent(call, args.concurrency, args.requests)
+        print(f"{name:22} {results[name]['rps']:8.1f} req/s  p50 {results[name]['p50_ms']:7.2f} ms  "
+              f"p99 {results[name]['p99_ms']:7.2f} ms")
+
+    # Read from a file, like a request body read from the socket
+    fd, body = tempfile.mkstemp()
+    with os.fdopen(fd, 'wb') as f:
+        f.write(image(args.large_mb * 1024 * 1024))
+    for name, consume in (("streamed", media.storage.save), ("buffered", lambda stream: stream.read())):
+        with open(body, 'rb', buffering=0) as stream:
+            tracemalloc.start()
+            consume(stream)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        results[f"save_memory_{name}"] = {"bytes": args.large_mb * 1024 * 1024, "peak_bytes": peak}
+        print(f"save_memory {name:10} peak {peak / 1024:10.1f} KiB for a {args.large_mb} MiB body")
+    os.remove(body)
+
+    path = write_results('media', results, args.output, params=vars(args))
+    print(f"Results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
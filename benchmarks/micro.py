@@ -0,0 +1,109 @@
+"""Micro-benchmarks for the per-request building blocks.
+
+Times password hashing, JWT encode/decode and JSON handling in isolation,
+without the database or the HTTP stack. The ``/profile`` and ``/health``
+responses and request body parsing are timed with both JSON provider backends
+(``stdlib`` and ``orjson``), plus a ``/profile`` response from the cached,
+already encoded body. ``revocation_check`` is the denylist lookup done on
+every authenticated request, against a set holding 10,000 revocations.
+"""
+import argparse
+import datetime
+import time
+from collections import namedtuple
+from benchmarks.common import load_app, percentiles, write_results
+
+
+def measure(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    total = sum(samples)
+    result = {
+        "iterations": iterations,
+        "ops_per_second": iterations / total if total else 0.0,
+        "mean_us": total / iterations * 1e6,
+    }
+    result.update({key.replace('_ms', '_us'): value * 1000 for key, value in percentiles(samples).items()})
+    return result
+
+
+def cases(app, hash_iterations):
+    from werkzeug.security import generate_password_hash, check_password_hash
+    from auth import encode_token, decode_token
+    from repository import serialize_profile
+    from json_provider import FastJSONProvider, orjson
+    from revocation import RevocationSet
+
+    pwhash = generate_password_hash('bench-password')
+    token = encode_token({'user_id': 1, 'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=1)})
+
+    Row = namedtuple('Row', 'profile_id email firstname lastname bio profile_picture entity')
+    row = Row(1, 'john@example.com', 'John', 'Doe', 'A short bio about John.' * 4,
+              'https://example.com/john.jpg', 'project_name_or_organization')
+    health = {
+        "status": "healthy",
+        "service": "breaking-into-tech-backend",
+        "database": {"status": "healthy", "error": None, "latency_ms": 1.2, "checked_at": "2025-05-15 14:30:43"},
+        "timestamp": "2025-05-15 14:30:45",
+    }
+
+    def in_app(fn):
+        def wrapped():
+            with app.app_context():
+                fn()
+        return wrapped
+
+    revoked = RevocationSet(interval=0)
+    now = time.time()
+    for i in range(5000):
+        revoked.add_jti(f"jti-{i}", now + 900)
+        revoked.add_user(i, now, now + 900)
+    claims = {'user_id': 10 ** 6, 'jti': 'live-token', 'iat': now}
+
+    body = b'{"email": "john@example.com", "password": "a-long-enough-password"}'
+    profile_body = app.json.dumps(serialize_profile(row))
+
+    results = {
+        "hash_generate": (lambda: generate_password_hash('bench-password'), hash_iterations),
+        "hash_check": (lambda: check_password_hash(pwhash, 'bench-password'), hash_iterations),
+        "jwt_encode": (lambda: encode_token({'user_id': 1, 'exp': 4102444800}), None),
+        "jwt_decode": (lambda: decode_token(token), None),
+        "revocation_check": (lambda: revoked.is_revoked(claims), None),
+        "profile_cached_body": (in_app(lambda: app.response_class(profile_body, mimetype='application/json')), None),
+    }
+    for backend in ('stdlib', 'orjson'):
+        provider = FastJSONProvider(app)
+        provider.use_orjson = backend == 'orjson'
+        if provider.use_orjson and orjson is None:
+            continue
+        results.update({
+            f"profile_response_{backend}": (in_app(lambda p=provider: p.response(serialize_profile(row)).get_data()), None),
+            f"health_response_{backend}": (in_app(lambda p=provider: p.response(health).get_data()), None),
+            f"parse_request_{backend}": (lambda p=provider: p.loads(body), None),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=10000)
+    parser.add_argument('--hash-iterations', type=int, default=20)
+    parser.add_argument('--output', default=None, help='JSON results file (defaults to benchmarks/results/)')
+    args = parser.parse_args()
+
+    app = load_app()
+    results = {}
+    for name, (fn, iterations) in cases(app, args.hash_iterations).items():
+        results[name] = measure(fn, iterations or args.iterations)
+        print(f"{name:24} {results[name]['ops_per_second']:12.1f} ops/s  "
+              f"p50 {results[name]['p50_us']:10.2f} us  p99 {results[name]['p99_us']:10.2f} us")
+
+    path = write_results('micro', results, args.output, params=vars(args))
+    print(f"Results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Measure the outbox: request latency with queued delivery and worker throughput.
+
+- ``forgot_password``: POST /forgot-password for random seeded users; the
+  reset email is only queued, so this is the latency the client sees;
+- ``inline_delivery``: the same email sent on the request thread instead
+  (``--smtp-delay-ms`` stands in for the round trips to an SMTP server);
+- ``drain_batch_<n>``: the worker delivering ``--jobs`` queued emails to the
+  file mailer with batches of ``n`` jobs.
+"""
+import argparse
+import random
+import tempfile
+import threading
+import time
+from benchmarks.common import load_app, run_concurrent, seed_users, write_results
+
+
+class SlowMailer:
+    """File mailer with a fixed delay per message, standing in for SMTP."""
+
+    def __init__(self, mailer, delay):
+        self.mailer = mailer
+        self.delay = delay
+
+    def send(self, message, key):
+        time.sleep(self.delay)
+        self.mailer.send(message, key)
+
+    def close(self):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--jobs', type=int, default=2000)
+    parser.add_argument('--batch-sizes', default='1,10,50,200')
+    parser.add_argument('--smtp-delay-ms', type=float, default=50)
+    parser.add_argument('--output', default=None, help='JSON results file (defaults to benchmarks/results/)')
+    args = parser.parse_args()
+
+    import outbox
+    from auth import decode_token, mint_reset_token, new_reset_token_claims, reset_token_digest
+    from database import db
+    from mailer import FileMailer
+    from models import OutboxJob, User
+    from rate_limit import limiter
+
+    app = load_app()
+    user_ids = seed_users(app, args.users)
+    with app.app_context():
+        emails = [email for (email,) in db.session.query(User.email).filter(User.id.in_(user_ids))]
+    limiter.enabled = False
+    # inline_delivery sends the token the response carries
+    import routes
+    routes.RESET_TOKEN_IN_RESPONSE = True
+    outbox.mailer = SlowMailer(FileMailer(tempfile.mkdtemp(prefix='bit-mail-')), args.smtp_delay_ms / 1000)
+
+    local = threading.local()
+
+    def client():
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        return local.client
+
+    def forgot_password():
+        return client().post('/forgot-password', json={"email": random.choice(emails)}).status_code == 200
+
+    def inline_delivery():
+        response = client().post('/forgot-password', json={"email": random.choice(emails)})
+        # What the request would cost if it sent the email itself
+        token = response.get_json()["token"]
+        claims = decode_token(token)
+        payload = {"user_id": claims["user_id"], "email": "inline@example.com", "exp": claims["exp"],
+                   "jti": claims["jti"], "digest": reset_token_digest(token)}
+        with app.app_context():
+            outbox.send_password_reset_email(payload, f"inline-{random.getrandbits(64):x}")
+        return response.status_code == 200
+
+    results = {
+        "forgot_password": run_concurrent(forgot_password, args.concurrency, args.requests),
+        "inline_delivery": run_concurrent(inline_delivery, args.concurrency, args.requests),
+    }
+    for name in ("forgot_password", "inline_delivery"):
+        print(f"{name:16} {results[name]['rps']:8.1f} req/s  p50 {results[name]['p50_ms']:7.2f} ms  "
+              f"p99 {results[name]['p99_ms']:7.2f} ms")
+
+    # Drained jobs all carry one live reset request, so the worker sends every email
+    with app.app_context():
+        user = db.session.get(User, user_ids[0])
+        claims = dict(new_reset_token_claims(), exp=int(time.time()) + 3600)
+        user.reset_token_hash = reset_token_digest(mint_reset_token(user.id, **claims))
+        payload = outbox.password_reset_payload(user, claims)
+        db.session.commit()
+
+    for batch_size in (int(size) for size in args.batch_sizes.split(',')):
+        with app.app_context():
+            db.session.query(OutboxJob).delete()
+            for i in range(args.jobs):
+                outbox.enqueue('password_reset_email', payload)
+            db.session.commit()
+        # Delivery time is the same whatever the batch; measure the queue overhead
+        outbox.mailer.delay = 0
+        worker = outbox.OutboxWorker(app, batch_size=batch_size)
+        start = time.perf_counter()
+        while worker.run_once():
+            pass
+        elapsed = time.perf_counter() - start
+        results[f"drain_batch_{batch_size}"] = {"jobs": args.jobs, "seconds": elapsed,
+                                                "jobs_per_second": args.jobs / elapsed}
+        print(f"drain batch {batch_size:4} {args.jobs / elapsed:9.1f} jobs/s")
+
+    path = write_results('outbox', results, args.output, params=vars(args))
+    print(f"Results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
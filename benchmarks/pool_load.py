@@ -0,0 +1,38 @@
+"""Drive DB-backed endpoints concurrently and report latency and pool usage."""
+import argparse
+import json
+from benchmarks.common import load_app, run_concurrent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    app = load_app()
+    client = app.test_client()
+
+    client.post('/signup', json={
+        "firstname": "Bench", "lastname": "User", "email": "pool-bench@example.com",
+        "password": "bench-password", "entity": "bench",
+    })
+    token = client.post('/signin', json={
+        "email": "pool-bench@example.com", "password": "bench-password",
+    }).get_json()['token']
+    headers = {"Authorization": f"Bearer {token}"}
+
+    results = {
+        "health": run_concurrent(
+            lambda: app.test_client().get('/health').status_code == 200,
+            args.concurrency, args.requests),
+        "get_profile": run_concurrent(
+            lambda: app.test_client().get('/profile', headers=headers).status_code == 200,
+            args.concurrency, args.requests),
+        "pool": client.get('/health/pool').get_json()['pool'],
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Measure the rate limiter: backend overhead and the cost of a rejected request.
+
+For each backend (in-process and the shared one, against ``fake_redis``):
+
+- ``check``: one ``limiter.check`` call under a generous limit;
+- ``signin_rejected``: a signin burst from one IP past its limit, counting the
+  password hashes and SQL statements the rejected requests caused (both
+  should be zero);
+- ``signin_accepted``: signins under the limit, for comparison.
+"""
+import argparse
+import itertools
+import os
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from benchmarks.common import load_app, seed_users, write_results
+from benchmarks.fake_redis import FakeRedisServer
+from benchmarks.micro import measure
+
+
+def run(app, limiter, args):
+    from hashing import hasher
+
+    client = app.test_client()
+    keys = itertools.count()
+    results = {
+        "check": measure(lambda: limiter.check('bench', {'ip': f"10.0.{next(keys) % 256}.1"},
+                                               limits={'ip': (1e9, 1e9)}), args.iterations),
+    }
+
+    # Exhaust the IP bucket, then time the rejected requests
+    os.environ['RATE_LIMIT_SIGNIN_IP'] = f"{args.burst}/3600"
+    os.environ['RATE_LIMIT_SIGNIN_EMAIL'] = 'off'
+    body = {"email": "seed-0@example.com", "password": "wrong-password"}
+    for _ in range(args.burst):
+        client.post('/signin', json=body)
+
+    statements = []
+    listener = lambda *a: statements.append(a[2])
+    event.listen(Engine, 'before_cursor_execute', listener)
+    hashes_before = hasher.stats()['calls']
+    statuses = []
+    results["signin_rejected"] = measure(
+        lambda: statuses.append(client.post('/signin', json=body).status_code), args.iterations)
+    event.remove(Engine, 'before_cursor_execute', listener)
+    results["signin_rejected"].update({
+        "statuses": {str(code): statuses.count(code) for code in sorted(set(statuses))},
+        "hashes": hasher.stats()['calls'] - hashes_before,
+        "sql_statements": len(statements),
+    })
+
+    os.environ['RATE_LIMIT_SIGNIN_IP'] = 'off'
+    results["signin_accepted"] = measure(
+        lambda: client.post('/signin', json={"email": "seed-0@example.com", "password": "bench-password"}),
+        args.hash_iterations)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--hash-iterations', type=int, default=20)
+    parser.add_argument('--burst', type=int, default=30)
+    parser.add_argument('--output', default=None, help='JSON results file (defaults to benchmarks/results/)')
+    args = parser.parse_args()
+
+    app = load_app()
+    seed_users(app, 1)
+    from rate_limit import limiter, MemoryBackend, RedisBackend
+
+    server = FakeRedisServer().start()
+    results = {}
+    try:
+        for name, backend in (("memory", MemoryBackend()), ("redis", RedisBackend(server.url))):
+            limiter.backend = backend
+            results[name] = run(app, limiter, args)
+            for case, result in results[name].items():
+                extra = {k: result[k] for k in ('statuses', 'hashes', 'sql_statements') if k in result}
+                print(f"{name:7} {case:16} {result['ops_per_second']:10.1f} ops/s  "
+                      f"p50 {result['p50_us']:9.1f} us  p99 {result['p99_us']:9.1f} us  {extra or ''}")
+    finally:
+        server.stop()
+
+    path = write_results('rate_limit', results, args.output, params=vars(args))
+    print(f"Results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
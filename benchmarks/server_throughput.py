@@ -0,0 +1,47 @@
+"""Compare req/s of the Werkzeug development server with gunicorn."""
+import argparse
+import json
+import os
+import sys
+from benchmarks.async_vs_sync import SYNC_SERVER, seed, drive
+from benchmarks.common import load_app
+from benchmarks.http import start_server, stop_server, python_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--dev-port', type=int, default=5103)
+    parser.add_argument('--gunicorn-port', type=int, default=5104)
+    args = parser.parse_args()
+
+    headers = seed(load_app())
+
+    env = dict(os.environ)
+    env.update({
+        'BIND': f'127.0.0.1:{args.gunicorn_port}',
+        'WEB_CONCURRENCY': str(args.workers),
+        'GUNICORN_THREADS': str(args.threads),
+        'GUNICORN_ERROR_LOG': os.devnull,
+    })
+
+    servers = {
+        "dev_server": (python_server(SYNC_SERVER.format(port=args.dev_port)), args.dev_port),
+        "gunicorn": ([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'api:app'], args.gunicorn_port),
+    }
+    results = {}
+    for name, (command, port) in servers.items():
+        process = start_server(command, port, env=env)
+        try:
+            results[name] = drive(port, headers, args.concurrency, args.requests)
+        finally:
+            stop_server(process)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Measure application startup time in fresh interpreters.
+
+Each run starts a new Python process and times:
+
+- ``import_api``: ``import api``;
+- ``create_app``: ``api.create_app()`` (config validation, blueprints, models);
+- ``first_request``: the first GET /health/live through the test client.
+
+It also runs ``python -X importtime -c "import api; api.create_app()"`` and
+reports the modules with the largest cumulative import time.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from benchmarks.common import use_local_database, write_results
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import api
+imported = time.perf_counter()
+app = api.create_app()
+created = time.perf_counter()
+app.test_client().get('/health/live')
+served = time.perf_counter()
+with open(sys.argv[1], 'w') as f:
+    json.dump({"import_api": imported - start, "create_app": created - imported,
+               "first_request": served - created}, f)
+"""
+
+
+def run_probe(env):
+    # The timings go through a file: the app's background threads also write to stdout
+    with tempfile.NamedTemporaryFile('r', suffix='.json') as f:
+        subprocess.run([sys.executable, '-c', PROBE, f.name], capture_output=True, check=True, cwd=ROOT, env=env)
+        return json.load(f)
+
+
+def import_times(env, top):
+    # importtime lines: "import time: self [us] | cumulative | imported package"
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import api; api.create_app()'],
+                            capture_output=True, text=True, check=True, cwd=ROOT, env=env).stderr
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # Nested imports are indented; a module's cumulative time already includes them
+        if name.startswith('  '):
+            continue
+        modules.append({"module": name.strip(), "self_ms": int(self_us) / 1000,
+                        "cumulative_ms": int(cumulative_us) / 1000})
+    return sorted(modules, key=lambda m: m["cumulative_ms"], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--top', type=int, default=15, help='Slowest imports to report')
+    parser.add_argument('--output', default=None, help='JSON results file (defaults to benchmarks/results/)')
+    args = parser.parse_args()
+
+    use_local_database()
+    env = dict(os.environ)
+    # Warm the bytecode cache so the first run isn't an outlier
+    run_probe(env)
+
+    runs = [run_probe(env) for _ in range(args.runs)]
+    results = {}
+    for phase in ("import_api", "create_app", "first_request"):
+        samples = [run[phase] * 1000 for run in runs]
+        results[phase] = {"median_ms": statistics.median(samples), "min_ms": min(samples),
+                          "max_ms": max(samples)}
+        print(f"{phase:14} median {results[phase]['median_ms']:8.1f} ms  min {results[phase]['min_ms']:8.1f} ms")
+    total = [sum(run.values()) * 1000 for run in runs]
+    results["total"] = {"median_ms": statistics.median(total), "min_ms": min(total), "max_ms": max(total)}
+    print(f"{'total':14} median {results['total']['median_ms']:8.1f} ms")
+
+    results["slowest_imports"] = import_times(env, args.top)
+    print("Slowest imports (cumulative):")
+    for module in results["slowest_imports"]:
+        print(f"  {module['cumulative_ms']:8.1f} ms  {module['module']}")
+
+    path = write_results('startup', results, args.output, params=vars(args))
+    print(f"Results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
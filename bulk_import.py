@@ -0,0 +1,218 @@
+"""Bulk user import.
+
+Users are read as NDJSON (one JSON object per line) or CSV with the same fields
+as ``/signup``. Rows are processed in batches: one ``IN`` query finds emails that
+already exist, the batch's passwords are hashed in parallel on the hashing pool,
+and users and profiles are written with multi-row INSERTs. A bad row is reported
+with its line number and never aborts the rest of the import.
+
+Available as ``POST /import-users`` (guarded by ``BULK_IMPORT_API_KEY``) and as
+``flask import-users FILE``.
+"""
+import csv
+import hmac
+import io
+import json
+import os
+import click
+from flask import Blueprint, request, jsonify
+from sqlalchemy import select, insert, func
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError, StatementError
+from database import db
+from hashing import hasher
+from models import User, Profile
+
+REQUIRED_FIELDS = ['firstname', 'lastname', 'email', 'password', 'entity']
+STRING_FIELDS = REQUIRED_FIELDS + ['bio', 'profile_picture']
+
+bulk = Blueprint('bulk', __name__, cli_group=None)
+
+
+def read_ndjson(stream):
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError as e:
+            yield line_no, e
+
+
+def read_csv(stream):
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+
+    def error(self, line_no, email, message):
+        self.errors.append({"line": line_no, "email": email, "error": message})
+
+    def to_dict(self):
+        return {"created": self.created, "failed": len(self.errors), "errors": self.errors}
+
+
+def _validate(batch, default_entity, result):
+    """Return the rows of ``batch`` that are well formed and unique within it."""
+    valid = []
+    seen = set()
+    for line_no, data in batch:
+        if isinstance(data, Exception):
+            result.error(line_no, None, f"Malformed row: {data}")
+            continue
+        if not isinstance(data, dict):
+            result.error(line_no, None, "Malformed row: expected an object")
+            continue
+        email = data.get('email') if isinstance(data.get('email'), str) else None
+        # NDJSON values can be anything JSON allows
+        wrong_type = next((f for f in STRING_FIELDS if data.get(f) is not None and not isinstance(data[f], str)), None)
+        if wrong_type:
+            result.error(line_no, email, f"Invalid field: {wrong_type} must be a string")
+            continue
+        if default_entity and not data.get('entity'):
+            data['entity'] = default_entity
+        missing = next((f for f in REQUIRED_FIELDS if not data.get(f)), None)
+        if missing:
+            result.error(line_no, email, f"Missing required field: {missing}")
+            continue
+        if data['email'].lower() in seen:
+            result.error(line_no, data['email'], "Duplicate email in import")
+            continue
+        seen.add(data['email'].lower())
+        valid.append((line_no, data))
+    return valid
+
+
+def _insert_rows(rows, hashes):
+    user_ids = db.session.execute(
+        insert(User).returning(User.id, sort_by_parameter_order=True),
+        [
+            {"email": data['email'], "password_hash": pwhash, "entity": data['entity']}
+            for (_, data), pwhash in zip(rows, hashes)
+        ],
+    ).scalars().all()
+    db.session.execute(insert(Profile), [
+        {
+            "user_id": user_id,
+            "firstname": data['firstname'],
+            "lastname": data['lastname'],
+            "bio": data.get('bio'),
+            "profile_picture": data.get('profile_picture'),
+        }
+        for (_, data), user_id in zip(rows, user_ids)
+    ])
+
+
+def _is_row_error(e):
+    # Caused by a row's data (duplicate, too long, unbindable value) rather than the database being down
+    return isinstance(e, (IntegrityError, DataError)) or not isinstance(e, DBAPIError)
+
+
+def _import_batch(batch, default_entity, result):
+    rows = _validate(batch, default_entity, result)
+    if not rows:
+        return
+
+    # One IN query for the whole batch instead of one lookup per user
+    lowered = func.lower(User.email)
+    existing = set(db.session.execute(
+        select(lowered).where(lowered.in_([data['email'].lower() for _, data in rows]))
+    ).scalars())
+    new_rows = []
+    for line_no, data in rows:
+        if data['email'].lower() in existing:
+            result.error(line_no, data['email'], "Email already registered")
+        else:
+            new_rows.append((line_no, data))
+    if not new_rows:
+        return
+
+    hashes = hasher.generate_many([data['password'] for _, data in new_rows])
+
+    try:
+        _insert_rows(new_rows, hashes)
+        db.session.commit()
+        result.created += len(new_rows)
+        return
+    except StatementError as e:
+        db.session.rollback()
+        if not _is_row_error(e):
+            raise
+
+    # Something raced us (e.g. a concurrent signup) or a row has bad data; retry row by row
+    for row, pwhash in zip(new_rows, hashes):
+        try:
+            with db.session.begin_nested():
+                _insert_rows([row], [pwhash])
+            result.created += 1
+        except StatementError as e:
+            if not _is_row_error(e):
+                raise
+            result.error(row[0], row[1]['email'], f"Could not insert row: {e.orig}")
+    db.session.commit()
+
+
+def import_users(rows, default_entity=None, batch_size=None):
+    """Import ``(line_no, data)`` rows and return an ``ImportResult``."""
+    if batch_size is None:
+        batch_size = int(os.getenv('BULK_IMPORT_BATCH_SIZE', 500))
+    result = ImportResult()
+    for batch in _batches(rows, batch_size):
+        _import_batch(batch, default_entity, result)
+    return result
+
+
+def _reader_for(fmt):
+    return read_csv if fmt == 'csv' else read_ndjson
+
+
+@bulk.route('/import-users', methods=['POST'])
+def import_users_endpoint():
+    api_key = os.getenv('BULK_IMPORT_API_KEY')
+    provided = request.headers.get('X-Import-Key', '')
+    if not api_key or not hmac.compare_digest(provided, api_key):
+        return jsonify({"error": "Invalid or missing import key"}), 403
+
+    fmt = request.args.get('format')
+    if fmt is None:
+        fmt = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+
+    # Read the body as a stream instead of loading it into memory
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    result = import_users(_reader_for(fmt)(stream), default_entity=request.args.get('entity'))
+    return jsonify(result.to_dict())
+
+
+@bulk.cli.command('import-users')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']), default=None,
+              help='Input format (defaults to the file extension).')
+@click.option('--entity', default=None, help='Entity for rows that do not set one.')
+@click.option('--batch-size', type=int, default=None)
+def import_users_command(path, fmt, entity, batch_size):
+    """Import users and profiles from an NDJSON or CSV file."""
+    if fmt is None:
+        fmt = 'csv' if path.endswith('.csv') else 'ndjson'
+    with open(path, encoding='utf-8', newline='') as f:
+        result = import_users(_reader_for(fmt)(f), default_entity=entity, batch_size=batch_size)
+    for error in result.errors:
+        click.echo(f"line {error['line']}: {error['email']}: {error['error']}", err=True)
+    click.echo(f"Created {result.created} users, {len(result.errors)} failed")
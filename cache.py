@@ -0,0 +1,175 @@
+"""Read-through cache for user and profile lookups.
+
+``lookup_cache.get_or_load(key, loader)`` returns the cached value for ``key``
+or calls ``loader()`` and caches its result. Concurrent misses for the same key
+in one process are coalesced: one thread runs the loader and the others wait
+for its result, so a stampede on a cold key costs a single query.
+
+Backends (``LOOKUP_CACHE_BACKEND``):
+
+- ``memory`` (default): a bounded LRU in each process. Entries expire after
+  ``LOOKUP_CACHE_TTL`` seconds; invalidations only reach the current process,
+  so other workers may serve a stale entry until it expires.
+- ``redis``: shared by every worker through ``LOOKUP_CACHE_REDIS_URL``, so an
+  invalidation is seen everywhere at once. Values are stored as JSON.
+- ``off``: every lookup goes to the database.
+
+Writers call ``invalidate`` after committing. Hits and misses are counted in
+the ``cache_requests_total`` metric.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from metrics import CACHE_REQUESTS
+from redis_client import RedisClient, RedisError
+
+logger = logging.getLogger('cache')
+
+# Distinguishes "not cached" from a cached None
+MISSING = object()
+
+
+class MemoryCache:
+    def __init__(self, maxsize=None, ttl=None):
+        self.maxsize = maxsize if maxsize is not None else int(os.getenv('LOOKUP_CACHE_SIZE', 10000))
+        self.ttl = ttl if ttl is not None else float(os.getenv('LOOKUP_CACHE_TTL', 30))
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisCache:
+    def __init__(self, url=None, ttl=None, prefix='cache:', timeout=None):
+        url = url or os.getenv('LOOKUP_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+        timeout = timeout if timeout is not None else float(os.getenv('LOOKUP_CACHE_REDIS_TIMEOUT', 0.5))
+        self.client = RedisClient(url, timeout)
+        self.ttl = ttl if ttl is not None else float(os.getenv('LOOKUP_CACHE_TTL', 30))
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.execute('GET', self.prefix + key)
+        return MISSING if raw is None else json.loads(raw)
+
+    def set(self, key, value):
+        self.client.execute('SET', self.prefix + key, json.dumps(value), 'PX', int(self.ttl * 1000))
+
+    def delete(self, *keys):
+        self.client.execute('DEL', *(self.prefix + key for key in keys))
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        # Set by invalidate() while loading, so a value read before a write is not cached
+        self.stale = False
+
+
+class LookupCache:
+    def __init__(self, backend=MISSING, name='lookup'):
+        # backend=None disables caching; by default it comes from the environment
+        if backend is MISSING:
+            backend = None
+            kind = os.getenv('LOOKUP_CACHE_BACKEND', 'memory')
+            if kind == 'memory':
+                backend = MemoryCache()
+            elif kind == 'redis':
+                backend = RedisCache()
+        self.backend = backend
+        self.name = name
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._backend_down = False
+
+    def _backend_call(self, method, *args):
+        try:
+            result = getattr(self.backend, method)(*args)
+        except (OSError, ConnectionError, RedisError) as e:
+            # A shared backend outage degrades to uncached lookups
+            if not self._backend_down:
+                logger.warning("Lookup cache backend unavailable: %s", e)
+                self._backend_down = True
+            return MISSING
+        if self._backend_down:
+            logger.info("Lookup cache backend recovered")
+            self._backend_down = False
+        return result
+
+    def get_or_load(self, key, loader):
+        if self.backend is None:
+            return loader()
+
+        value = self._backend_call('get', key)
+        if value is not MISSING:
+            CACHE_REQUESTS.inc(self.name, 'hit')
+            return value
+        CACHE_REQUESTS.inc(self.name, 'miss')
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            CACHE_REQUESTS.inc(self.name, 'coalesced')
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+            if not flight.stale:
+                self._backend_call('set', key, flight.value)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def invalidate(self, *keys):
+        if self.backend is None:
+            return
+        with self._lock:
+            for key in keys:
+                if key in self._flights:
+                    self._flights[key].stale = True
+        self._backend_call('delete', *keys)
+
+
+# Shared instance used for user/profile lookups
+lookup_cache = LookupCache()
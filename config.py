@@ -0,0 +1,126 @@
+"""Application configuration, loaded and validated once at startup.
+
+``load_config`` reads ``.env`` into the environment, checks every setting the
+modules read (``DB_*``, pool sizes, cache sizes, timeouts, ...) and reports
+all problems in a single ``ConfigError`` instead of failing on the first bad
+value somewhere in a module import. It returns the Flask config for
+``api.create_app``.
+"""
+import os
+from dotenv import load_dotenv
+
+INT_SETTINGS = (
+    'AUTH_CACHE_SIZE', 'BULK_EXPORT_CHUNK_SIZE', 'BULK_IMPORT_BATCH_SIZE',
+    'DB_PORT', 'DB_POOL_SIZE', 'DB_MAX_OVERFLOW', 'DB_POOL_RECYCLE', 'DB_STATEMENT_TIMEOUT_MS',
+    'DB_MAX_CONNECTIONS', 'WEB_CONCURRENCY', 'LOOKUP_CACHE_SIZE', 'PASSWORD_HASH_COST',
+    'PASSWORD_HASH_MAX_SCRYPT_N', 'PASSWORD_HASH_QUEUE_SIZE', 'PASSWORD_HASH_RETRY_AFTER',
+    'PASSWORD_HASH_WORKERS', 'PROFILE_CACHE_MAX_AGE', 'RATE_LIMIT_MAX_KEYS',
+    'RESET_TOKEN_EXPIRATION_MINUTES', 'SQL_QUERY_BUDGET', 'OUTBOX_BATCH_SIZE', 'OUTBOX_MAX_ATTEMPTS',
+    'MAIL_SMTP_PORT', 'ACCESS_TOKEN_TTL', 'REFRESH_TOKEN_TTL',
+    'LOG_MAX_BYTES', 'LOG_BACKUP_COUNT', 'LOG_BATCH_SIZE', 'LOG_QUEUE_SIZE',
+    'MEDIA_MAX_BYTES', 'MEDIA_MAX_PIXELS', 'MEDIA_THUMBNAIL_WORKERS', 'MEDIA_THUMBNAIL_QUEUE_SIZE', 'MEDIA_CACHE_MAX_AGE',
+)
+FLOAT_SETTINGS = (
+    'AUTH_CACHE_TTL', 'DB_POOL_TIMEOUT', 'DIRECTORY_INDEX_TTL', 'HEALTH_PROBE_INTERVAL',
+    'HEALTH_PROBE_TIMEOUT', 'HEALTH_STALE_AFTER', 'LOOKUP_CACHE_REDIS_TIMEOUT', 'LOOKUP_CACHE_TTL',
+    'METRICS_FLUSH_INTERVAL', 'PASSWORD_HASH_TARGET_MS', 'PASSWORD_HASH_TIMEOUT',
+    'RATE_LIMIT_REDIS_TIMEOUT', 'SQL_SLOW_QUERY_MS', 'DB_REPLICA_MAX_LAG', 'DB_REPLICA_PIN_SECONDS',
+    'OUTBOX_POLL_INTERVAL', 'OUTBOX_BACKOFF_BASE', 'OUTBOX_BACKOFF_MAX', 'OUTBOX_LEASE_SECONDS', 'MAIL_SMTP_TIMEOUT',
+    'REVOCATION_SYNC_INTERVAL', 'REVOCATION_SYNC_MARGIN', 'LOG_SLOW_REQUEST_MS', 'LOG_FLUSH_INTERVAL',
+)
+CHOICE_SETTINGS = {
+    'PASSWORD_HASH_ALGORITHM': ('scrypt', 'pbkdf2'),
+    'RATE_LIMIT_BACKEND': ('memory', 'redis'),
+    'LOOKUP_CACHE_BACKEND': ('memory', 'redis', 'off'),
+    'JSON_PROVIDER': ('orjson', 'stdlib'),
+    'MAIL_BACKEND': ('file', 'smtp'),
+    'LOG_LEVEL': ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'debug', 'info', 'warning', 'error'),
+}
+
+
+class ConfigError(Exception):
+    pass
+
+
+def env_bool(name, default=False):
+    """Read a boolean setting: 1/true/yes/on (any case) are true, unset or empty is ``default``."""
+    value = os.getenv(name)
+    if value in (None, ''):
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+def validate_environment():
+    """Return a list of problems with the settings in the environment."""
+    errors = []
+    for names, parse, kind in ((INT_SETTINGS, int, 'an integer'), (FLOAT_SETTINGS, float, 'a number')):
+        for name in names:
+            value = os.getenv(name)
+            if value in (None, ''):
+                continue
+            try:
+                parse(value)
+            except ValueError:
+                errors.append(f"{name} must be {kind}, got {value!r}")
+
+    for name, choices in CHOICE_SETTINGS.items():
+        value = os.getenv(name)
+        if value not in (None, '') and value not in choices:
+            errors.append(f"{name} must be one of {', '.join(choices)}, got {value!r}")
+
+    from rate_limit import DEFAULT_LIMITS, parse_limit
+    for endpoint, kinds in DEFAULT_LIMITS.items():
+        for kind in kinds:
+            name = f"RATE_LIMIT_{endpoint.upper()}_{kind.upper()}"
+            try:
+                parse_limit(os.getenv(name))
+            except (ValueError, ZeroDivisionError):
+                errors.append(f"{name} must look like <requests>/<seconds> or 'off', got {os.getenv(name)!r}")
+
+    sizes = os.getenv('MEDIA_THUMBNAIL_SIZES')
+    if sizes and not all(size.strip().isdigit() and int(size) > 0 for size in sizes.split(',')):
+        errors.append(f"MEDIA_THUMBNAIL_SIZES must be a comma separated list of pixel sizes, got {sizes!r}")
+
+    sample_rates = os.getenv('LOG_SAMPLE_RATES')
+    if sample_rates:
+        try:
+            # logs parses LOG_SAMPLE_RATES on import too
+            from logs import parse_sample_rates
+            parse_sample_rates(sample_rates)
+        except ValueError:
+            errors.append(f"LOG_SAMPLE_RATES must look like <endpoint>=<rate>,..., got {sample_rates!r}")
+    return errors
+
+
+def load_config(overrides=None):
+    """Load ``.env``, validate the environment and return the Flask config.
+
+    ``overrides`` is merged last; passing ``SQLALCHEMY_DATABASE_URI`` there
+    makes the ``DB_*`` settings optional (e.g. tests on SQLite).
+    """
+    load_dotenv()
+    overrides = dict(overrides or {})
+    errors = validate_environment()
+
+    uri = overrides.get('SQLALCHEMY_DATABASE_URI')
+    if uri is None:
+        from database import database_uri
+        try:
+            uri = database_uri()
+        except ValueError as e:
+            errors.append(str(e))
+
+    if errors:
+        raise ConfigError("Invalid configuration:\n  " + "\n  ".join(errors))
+
+    from db_pool import engine_options
+    from replicas import replica_binds
+    config = {
+        'SQLALCHEMY_DATABASE_URI': uri,
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SQLALCHEMY_ENGINE_OPTIONS': engine_options(uri),
+        # Read replicas from DB_REPLICA_URLS, see replicas.py
+        'SQLALCHEMY_BINDS': replica_binds(engine_options),
+    }
+    config.update(overrides)
+    return config
@@ -1,3 +1,25 @@
 from flask_sqlalchemy import SQLAlchemy
+import os
+from urllib.parse import quote_plus
+from replicas import RoutingSession
 
-db = SQLAlchemy()
+# Reads inside replicas.replica_reads blocks may go to a read replica
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+# Settings needed to build the Postgres URL when DATABASE_URL is not set
+REQUIRED_DB_SETTINGS = ('DB_USER', 'DB_PASSWORD', 'DB_HOST', 'DB_NAME')
+
+
+def database_uri():
+    # DATABASE_URL overrides the individual settings (e.g. a local SQLite stand-in)
+    database_url = os.getenv('DATABASE_URL')
+    if database_url:
+        return database_url
+
+    missing = [name for name in REQUIRED_DB_SETTINGS if os.getenv(name) is None]
+    if missing:
+        raise ValueError(f"Set DATABASE_URL or {', '.join(missing)}")
+
+    # URL encode the password to handle special characters
+    encoded_password = quote_plus(os.getenv('DB_PASSWORD'))
+    return f"postgresql://{os.getenv('DB_USER')}:{encoded_password}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT', 5432)}/{os.getenv('DB_NAME')}"
@@ -0,0 +1,118 @@
+"""SQLAlchemy connection pool configuration.
+
+Pool settings come from environment variables. ``DB_MAX_CONNECTIONS`` is the
+connection budget for the whole deployment; it is split across the
+``WEB_CONCURRENCY`` worker processes so that ``pool_size + max_overflow`` per
+worker never adds up to more than Postgres will accept.
+"""
+import os
+import threading
+import time
+from collections import deque
+from sqlalchemy.pool import QueuePool
+from config import env_bool
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that records how long callers wait to check out a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._wait_lock = threading.Lock()
+        self._waits = deque(maxlen=1024)
+        self._checkouts = 0
+        self._timeouts = 0
+        self._total_wait = 0.0
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except Exception:
+            with self._wait_lock:
+                self._timeouts += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._wait_lock:
+                self._checkouts += 1
+                self._total_wait += elapsed
+                self._waits.append(elapsed)
+
+    def wait_stats(self):
+        with self._wait_lock:
+            waits = sorted(self._waits)
+            checkouts = self._checkouts
+            stats = {
+                "checkouts": checkouts,
+                "checkout_errors": self._timeouts,
+                "avg_wait_ms": (self._total_wait / checkouts * 1000) if checkouts else 0.0,
+            }
+        for name, q in (("p50_wait_ms", 0.50), ("p99_wait_ms", 0.99)):
+            stats[name] = waits[min(int(len(waits) * q), len(waits) - 1)] * 1000 if waits else 0.0
+        stats["max_wait_ms"] = waits[-1] * 1000 if waits else 0.0
+        return stats
+
+
+def _env_int(name, default=None):
+    value = os.getenv(name)
+    return int(value) if value not in (None, '') else default
+
+
+def _env_float(name, default=None):
+    value = os.getenv(name)
+    return float(value) if value not in (None, '') else default
+
+
+def engine_options(uri):
+    """Build ``SQLALCHEMY_ENGINE_OPTIONS`` for ``uri`` from the environment."""
+    options = {
+        "pool_pre_ping": env_bool('DB_POOL_PRE_PING', True),
+        "pool_recycle": _env_int('DB_POOL_RECYCLE', 1800),
+    }
+
+    # In-memory SQLite uses a single shared connection; there is no pool to size
+    if uri.startswith('sqlite') and (uri in ('sqlite://', 'sqlite:///') or ':memory:' in uri):
+        return options
+
+    pool_size = _env_int('DB_POOL_SIZE', 5)
+    max_overflow = _env_int('DB_MAX_OVERFLOW', 10)
+
+    max_connections = _env_int('DB_MAX_CONNECTIONS')
+    if max_connections:
+        workers = max(_env_int('WEB_CONCURRENCY', 1), 1)
+        per_worker = max(max_connections // workers, 1)
+        pool_size = min(pool_size, per_worker)
+        max_overflow = min(max_overflow, per_worker - pool_size)
+
+    options.update({
+        "poolclass": MeteredQueuePool,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": _env_float('DB_POOL_TIMEOUT', 30.0),
+    })
+
+    statement_timeout = _env_int('DB_STATEMENT_TIMEOUT_MS')
+    if statement_timeout and uri.startswith('postgresql'):
+        options["connect_args"] = {"options": f"-c statement_timeout={statement_timeout}"}
+
+    return options
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        capacity = pool.size() + max(pool._max_overflow, 0)
+        checked_out = pool.checkedout()
+        stats.update({
+            "size": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "checked_out": checked_out,
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "saturation": checked_out / capacity if capacity else 0.0,
+        })
+    if isinstance(pool, MeteredQueuePool):
+        stats.update(pool.wait_stats())
+    return stats
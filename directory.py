@@ -0,0 +1,260 @@
+"""Member directory: filter by entity, search by name or bio, keyset pagination.
+
+Results are ordered newest first on ``(created_at, id)`` and paged with an opaque
+cursor holding the last row's key, so every page is an index range scan no
+matter how deep the client pages: ``ix_users_created_at_id``, or
+``ix_users_entity_created_at_id`` when filtered by entity, which keeps pages of
+a small entity from scanning past the rows of every other one.
+
+On Postgres the search uses the ``pg_trgm`` and full-text indexes added in
+migration ``0a7e3c5d91b2``. Other databases (the SQLite stand-in) use
+``SearchIndex``, an in-process trigram/word index over the profiles.
+"""
+import base64
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from flask import Blueprint, request, jsonify
+from sqlalchemy import select, func, or_, tuple_, event
+from auth import require_auth
+from database import db
+from media import thumbnail_urls
+from models import User, Profile
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# pg_trgm's default similarity threshold
+SIMILARITY_THRESHOLD = 0.3
+
+DIRECTORY_COLUMNS = (
+    User.id.label('user_id'),
+    User.created_at,
+    User.entity,
+    Profile.firstname,
+    Profile.lastname,
+    Profile.bio,
+    Profile.profile_picture,
+)
+
+directory = Blueprint('directory', __name__)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, user_id):
+    raw = json.dumps([created_at.isoformat(), user_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, user_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(user_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(str(e))
+
+
+def trigrams(text):
+    # Same padding as pg_trgm: two spaces before each word, one after
+    grams = set()
+    for word in text.lower().split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class SearchIndex:
+    """In-process search index used when the database has no trigram support.
+
+    Keeps trigrams of first/last names and the words of each bio. It is built
+    lazily, kept current by ORM events in this process and rebuilt every
+    ``ttl`` seconds to pick up writes that bypass the ORM (bulk imports, other
+    workers).
+    """
+
+    def __init__(self, ttl=None):
+        if ttl is None:
+            ttl = float(os.getenv('DIRECTORY_INDEX_TTL', 60))
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._built_at = None
+        self._names = {}  # user_id -> (firstname, lastname)
+        self._grams = defaultdict(set)  # trigram -> user_ids
+        self._words = defaultdict(set)  # bio word -> user_ids
+        self._user_words = {}  # user_id -> bio words
+
+    def _add(self, user_id, firstname, lastname, bio):
+        self._names[user_id] = (firstname.lower(), lastname.lower())
+        for gram in trigrams(f"{firstname} {lastname}"):
+            self._grams[gram].add(user_id)
+        words = set((bio or '').lower().split())
+        self._user_words[user_id] = words
+        for word in words:
+            self._words[word].add(user_id)
+
+    def _discard(self, user_id):
+        names = self._names.pop(user_id, None)
+        if names is not None:
+            for gram in trigrams(' '.join(names)):
+                self._grams[gram].discard(user_id)
+        for word in self._user_words.pop(user_id, ()):
+            self._words[word].discard(user_id)
+
+    def rebuild(self):
+        rows = db.session.execute(
+            select(Profile.user_id, Profile.firstname, Profile.lastname, Profile.bio)
+        ).all()
+        with self._lock:
+            self._names.clear()
+            self._grams.clear()
+            self._words.clear()
+            self._user_words.clear()
+            for row in rows:
+                self._add(*row)
+            self._built_at = time.monotonic()
+
+    def update(self, user_id, firstname, lastname, bio):
+        with self._lock:
+            if self._built_at is None:
+                return
+            self._discard(user_id)
+            self._add(user_id, firstname, lastname, bio)
+
+    def remove(self, user_id):
+        with self._lock:
+            self._discard(user_id)
+
+    def search(self, query):
+        """Return the ids of users whose name or bio matches ``query``."""
+        if self._built_at is None or time.monotonic() - self._built_at > self.ttl:
+            self.rebuild()
+
+        query = query.lower().strip()
+        query_grams = trigrams(query)
+        words = query.split()
+        with self._lock:
+            # Candidates share at least one trigram with the query
+            counts = defaultdict(int)
+            for gram in query_grams:
+                for user_id in self._grams.get(gram, ()):
+                    counts[user_id] += 1
+
+            matches = set()
+            for user_id, shared in counts.items():
+                firstname, lastname = self._names[user_id]
+                if firstname.startswith(query) or lastname.startswith(query):
+                    matches.add(user_id)
+                    continue
+                for name in (firstname, lastname):
+                    name_grams = trigrams(name)
+                    common = len(query_grams & name_grams)
+                    if common / len(query_grams | name_grams) >= SIMILARITY_THRESHOLD:
+                        matches.add(user_id)
+                        break
+
+            if words:
+                bio_matches = set(self._words.get(words[0], ()))
+                for word in words[1:]:
+                    bio_matches &= self._words.get(word, set())
+                matches |= bio_matches
+        return matches
+
+
+search_index = SearchIndex()
+
+
+@event.listens_for(Profile, 'after_insert')
+@event.listens_for(Profile, 'after_update')
+def _index_profile(mapper, connection, profile):
+    search_index.update(profile.user_id, profile.firstname, profile.lastname, profile.bio)
+
+
+@event.listens_for(Profile, 'after_delete')
+def _unindex_profile(mapper, connection, profile):
+    search_index.remove(profile.user_id)
+
+
+def search_clause(query):
+    """WHERE clause for ``query`` on Postgres, served by the trigram/tsvector indexes."""
+    lowered = query.lower()
+    firstname = func.lower(Profile.firstname)
+    lastname = func.lower(Profile.lastname)
+    return or_(
+        firstname.startswith(lowered, autoescape=True),
+        lastname.startswith(lowered, autoescape=True),
+        firstname.op('%')(lowered),
+        lastname.op('%')(lowered),
+        func.to_tsvector('simple', func.coalesce(Profile.bio, '')).op('@@')(
+            func.plainto_tsquery('simple', query)
+        ),
+    )
+
+
+def directory_page(entity=None, query=None, cursor=None, limit=DEFAULT_LIMIT):
+    """Return ``(rows, next_cursor)`` for one page of the directory."""
+    stmt = (
+        select(*DIRECTORY_COLUMNS)
+        .join(Profile, Profile.user_id == User.id)
+        .order_by(User.created_at.desc(), User.id.desc())
+        .limit(limit + 1)
+    )
+    if entity:
+        stmt = stmt.where(User.entity == entity)
+    if cursor:
+        created_at, user_id = decode_cursor(cursor)
+        stmt = stmt.where(tuple_(User.created_at, User.id) < (created_at, user_id))
+    if query:
+        if db.engine.dialect.name == 'postgresql':
+            stmt = stmt.where(search_clause(query))
+        else:
+            stmt = stmt.where(User.id.in_(search_index.search(query)))
+
+    rows = db.session.execute(stmt).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].user_id)
+    return rows, next_cursor
+
+
+def serialize_member(row):
+    return {
+        "user_id": row.user_id,
+        "firstname": row.firstname,
+        "lastname": row.lastname,
+        "bio": row.bio,
+        "profile_picture": row.profile_picture,
+        "profile_picture_thumbnails": thumbnail_urls(row.profile_picture),
+        "entity": row.entity,
+    }
+
+
+@directory.route('/users', methods=['GET'])
+@require_auth
+def list_users():
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    try:
+        rows, next_cursor = directory_page(
+            entity=request.args.get('entity'),
+            query=request.args.get('q'),
+            cursor=request.args.get('cursor'),
+            limit=limit,
+        )
+    except InvalidCursor:
+        return jsonify({"error": "Invalid cursor"}), 400
+
+    return jsonify({
+        "users": [serialize_member(row) for row in rows],
+        "next_cursor": next_cursor,
+    })
@@ -2,8 +2,16 @@
 
 APP_NAME="flask_app"
 PID_FILE="/tmp/${APP_NAME}.pid"
-LOG_FILE="/tmp/${APP_NAME}.log"
+# JSON logs, written and rotated by the app (see logs.py)
+LOG_FILE="${LOG_FILE:-/tmp/${APP_NAME}.log}"
+# Anything written to stdout/stderr outside the logs (startup errors, crashes)
+CONSOLE_FILE="/tmp/${APP_NAME}.console.log"
 FLASK_APP="api.py"
+WSGI_APP="api:app"
+GUNICORN_CONF="gunicorn.conf.py"
+WORKER_PID_FILE="/tmp/${APP_NAME}_worker.pid"
+WORKER_LOG_FILE="/tmp/${APP_NAME}_worker.log"
+WORKER_CONSOLE_FILE="/tmp/${APP_NAME}_worker.console.log"
 
 start() {
     if [ -f "$PID_FILE" ]; then
@@ -17,10 +25,25 @@ start() {
     fi
 
     echo "Starting Flask application..."
-    # Start the Flask application
-    nohup python3 $FLASK_APP > "$LOG_FILE" 2>&1 &
-    
-    # Save the PID
+    # Start the Flask application under gunicorn (workers/threads in gunicorn.conf.py)
+    GUNICORN_PIDFILE="$PID_FILE" LOG_FILE="$LOG_FILE" nohup gunicorn -c "$GUNICORN_CONF" "$WSGI_APP" > "$CONSOLE_FILE" 2>&1 &
+
+    # gunicorn writes the master PID itself; wait for it to appear
+    for _ in $(seq 1 50); do
+        [ -f "$PID_FILE" ] && break
+        sleep 0.1
+    done
+    if [ ! -f "$PID_FILE" ]; then
+        echo "Application failed to start, see $CONSOLE_FILE"
+        return 1
+    fi
+    echo "Application started with PID: $(cat $PID_FILE)"
+    echo "Logs are being written to $LOG_FILE"
+}
+
+start_dev() {
+    echo "Starting Flask development server..."
+    LOG_FILE="$LOG_FILE" nohup python3 $FLASK_APP > "$CONSOLE_FILE" 2>&1 &
     echo $! > "$PID_FILE"
     echo "Application started with PID: $(cat $PID_FILE)"
     echo "Logs are being written to $LOG_FILE"
@@ -31,8 +54,12 @@ stop() {
         PID=$(cat "$PID_FILE")
         if ps -p $PID > /dev/null; then
             echo "Stopping Flask application (PID: $PID)..."
+            # SIGTERM lets gunicorn finish in-flight requests (graceful_timeout)
             kill $PID
-            rm "$PID_FILE"
+            while ps -p $PID > /dev/null; do
+                sleep 0.5
+            done
+            rm -f "$PID_FILE"
             echo "Application stopped"
         else
             echo "Process not running but PID file exists. Cleaning up..."
@@ -57,6 +84,49 @@ status() {
     fi
 }
 
+reload() {
+    if [ -f "$PID_FILE" ] && ps -p $(cat $PID_FILE) > /dev/null; then
+        # SIGHUP starts new workers and retires the old ones gracefully.
+        # With GUNICORN_PRELOAD=true the code is not re-imported; use restart to deploy new code.
+        echo "Reloading Flask application (PID: $(cat $PID_FILE))..."
+        kill -HUP $(cat $PID_FILE)
+        echo "Reload signal sent"
+    else
+        echo "Application is not running"
+        return 1
+    fi
+}
+
+start_worker() {
+    if [ -f "$WORKER_PID_FILE" ] && ps -p $(cat $WORKER_PID_FILE) > /dev/null; then
+        echo "Outbox worker is already running with PID: $(cat $WORKER_PID_FILE)"
+        return 1
+    fi
+
+    echo "Starting outbox worker..."
+    # Delivers queued emails and post-signup hooks (see outbox.py)
+    LOG_FILE="$WORKER_LOG_FILE" nohup python3 outbox.py > "$WORKER_CONSOLE_FILE" 2>&1 &
+    echo $! > "$WORKER_PID_FILE"
+    echo "Outbox worker started with PID: $(cat $WORKER_PID_FILE)"
+    echo "Logs are being written to $WORKER_LOG_FILE"
+}
+
+stop_worker() {
+    if [ -f "$WORKER_PID_FILE" ] && ps -p $(cat $WORKER_PID_FILE) > /dev/null; then
+        PID=$(cat "$WORKER_PID_FILE")
+        echo "Stopping outbox worker (PID: $PID)..."
+        # SIGTERM lets the worker finish its current batch
+        kill $PID
+        while ps -p $PID > /dev/null; do
+            sleep 0.5
+        done
+        echo "Outbox worker stopped"
+    else
+        echo "Outbox worker is not running"
+    fi
+    rm -f "$WORKER_PID_FILE"
+}
+
 restart() {
     stop
     # Give it a moment to stop properly
@@ -74,11 +144,23 @@ case "$1" in
     restart)
         restart
         ;;
+    reload)
+        reload
+        ;;
+    dev)
+        start_dev
+        ;;
     status)
         status
         ;;
+    worker-start)
+        start_worker
+        ;;
+    worker-stop)
+        stop_worker
+        ;;
     *)
-        echo "Usage: $0 {start|stop|restart|status}"
+        echo "Usage: $0 {start|stop|restart|reload|status|dev|worker-start|worker-stop}"
         exit 1
         ;;
 esac
@@ -0,0 +1,79 @@
+"""Gunicorn configuration for production.
+
+Start with ``gunicorn -c gunicorn.conf.py api:app`` (``flask_service.sh start``
+does this); ``'api:create_app()'`` works too. Every setting can be overridden
+through the environment.
+"""
+import gc
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+
+# Pre-forked workers, each serving requests from a pool of threads
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# The app splits the connection budget and hashing processes between the workers (db_pool.py,
+# hashing.py); exported before the app is loaded so they see the same count
+os.environ['WEB_CONCURRENCY'] = str(workers)
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_class = 'gthread'
+
+# Import the app once in the master so forked workers share its memory
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes', 'on')
+
+# Recycle a worker after this many requests (with jitter so they don't all restart at once)
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+pidfile = os.getenv('GUNICORN_PIDFILE')
+accesslog = os.getenv('GUNICORN_ACCESS_LOG')
+errorlog = os.getenv('GUNICORN_ERROR_LOG', '-')
+
+
+def on_starting(server):
+    # Per-worker metric snapshots from a previous run would be merged into /metrics
+    if os.getenv('METRICS_DIR'):
+        from metrics import exporter
+        exporter.clear()
+
+    # Calibrate the password hash cost once so every worker hashes with the same parameters
+    if os.getenv('PASSWORD_HASH_TARGET_MS') and not os.getenv('PASSWORD_HASH_COST'):
+        from password_policy import policy
+        os.environ['PASSWORD_HASH_COST'] = str(policy.calibrate())
+
+
+def when_ready(server):
+    # Move the preloaded app out of the collector's reach so collections in the
+    # workers don't write to (and un-share) the pages inherited from the master
+    if preload_app:
+        gc.freeze()
+
+
+def worker_exit(server, worker):
+    # Write the counts since the last periodic snapshot before the worker goes
+    if os.getenv('METRICS_DIR'):
+        from metrics import exporter
+        try:
+            exporter.flush()
+        except OSError:
+            pass
+
+
+def child_exit(server, worker):
+    # Fold the exited worker's snapshot into one file instead of keeping one per pid
+    if os.getenv('METRICS_DIR'):
+        from metrics import exporter
+        exporter.fold(worker.pid)
+
+
+def post_fork(server, worker):
+    # Connections opened by the master must not be shared with the workers
+    if preload_app:
+        from api import app
+        from database import db
+        with app.app_context():
+            db.engine.dispose(close=False)
@@ -0,0 +1,172 @@
+"""Password hashing service.
+
+Password hashing is deliberately slow, CPU-bound work. Running it inline on the
+request thread holds the GIL and stalls every other endpoint, so the routes hand
+it to a process pool sized to the machine's cores instead. The number of calls
+waiting for the pool is bounded; once it is full new calls are rejected with
+``HashingOverloaded`` and the API answers 503 + Retry-After.
+
+New hashes use the algorithm and cost of ``password_policy.policy``.
+"""
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from functools import partial
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, TimeoutError, wait
+from werkzeug.security import generate_password_hash, check_password_hash
+from metrics import HASH_SECONDS, HASH_REJECTED
+from password_policy import policy
+
+
+class HashingOverloaded(Exception):
+    """Raised when the hashing queue is full and the call was shed."""
+
+    def __init__(self, retry_after):
+        super().__init__("Password hashing queue is full")
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    def __init__(self, workers=None, queue_size=None, timeout=None, retry_after=None):
+        if workers is None:
+            # PASSWORD_HASH_WORKERS is for the machine: each of the WEB_CONCURRENCY processes gets a share
+            total = int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+            web_workers = max(int(os.getenv('WEB_CONCURRENCY') or 1), 1)
+            workers = max(total // web_workers, 1) if total > 0 else 0
+        if queue_size is None:
+            queue_size = int(os.getenv('PASSWORD_HASH_QUEUE_SIZE', max(workers, 1) * 4))
+        if timeout is None:
+            timeout = float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+        if retry_after is None:
+            retry_after = int(os.getenv('PASSWORD_HASH_RETRY_AFTER', 1))
+
+        # workers=0 hashes inline on the calling thread (useful for tests and scripts)
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.retry_after = retry_after
+
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+
+        self._calls = 0
+        self._rejected = 0
+        self._in_flight = 0
+        self._total_seconds = 0.0
+        self._max_seconds = 0.0
+        self._samples = deque(maxlen=1024)
+
+    def _get_pool(self):
+        # The pool is created lazily and per process, so a pool created before
+        # a fork (e.g. a preloading master) is never shared with the children.
+        pid = os.getpid()
+        if self._pool is None or self._pool_pid != pid:
+            with self._lock:
+                if self._pool is None or self._pool_pid != pid:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                    self._pool_pid = pid
+        return self._pool
+
+    @contextmanager
+    def _admitted(self, operation):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            HASH_REJECTED.inc()
+            raise HashingOverloaded(self.retry_after)
+
+        with self._lock:
+            self._in_flight += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._slots.release()
+            HASH_SECONDS.observe(elapsed, operation)
+            with self._lock:
+                self._in_flight -= 1
+                self._calls += 1
+                self._total_seconds += elapsed
+                self._max_seconds = max(self._max_seconds, elapsed)
+                self._samples.append(elapsed)
+
+    def _run(self, fn, *args):
+        with self._admitted(fn.__name__):
+            if self.workers <= 0:
+                return fn(*args)
+            future = self._get_pool().submit(fn, *args)
+            try:
+                return future.result(timeout=self.timeout)
+            except TimeoutError:
+                # The pool is saturated; treat it the same as a full queue
+                future.cancel()
+                raise HashingOverloaded(self.retry_after)
+
+    def generate(self, password):
+        return self._run(generate_password_hash, password, policy.method)
+
+    def check(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def generate_many(self, passwords):
+        """Hash a batch of passwords spread over all pool processes.
+
+        Meant for bulk paths; the whole batch takes a single queue slot so
+        interactive logins are still admitted alongside it. At most one hash
+        per pool process is queued at a time, so a login submitted meanwhile
+        waits behind a few hashes, not the rest of the batch.
+        """
+        generate = partial(generate_password_hash, method=policy.method)
+        with self._admitted('generate_many'):
+            if self.workers <= 0:
+                return [generate(p) for p in passwords]
+            pool = self._get_pool()
+            hashes = [None] * len(passwords)
+            remaining = enumerate(passwords)
+            running = {pool.submit(generate, password): index
+                       for index, password in itertools.islice(remaining, self.workers)}
+            while running:
+                done, _ = wait(running, timeout=self.timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    for future in running:
+                        future.cancel()
+                    raise HashingOverloaded(self.retry_after)
+                for future in done:
+                    hashes[running.pop(future)] = future.result()
+                    for index, password in itertools.islice(remaining, 1):
+                        running[pool.submit(generate, password)] = index
+            return hashes
+
+    def stats(self):
+        with self._lock:
+            samples = sorted(self._samples)
+            calls = self._calls
+            stats = {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "in_flight": self._in_flight,
+                "calls": calls,
+                "rejected": self._rejected,
+                "avg_ms": (self._total_seconds / calls * 1000) if calls else 0.0,
+                "max_ms": self._max_seconds * 1000,
+            }
+        for name, q in (("p50_ms", 0.50), ("p99_ms", 0.99)):
+            stats[name] = samples[min(int(len(samples) * q), len(samples) - 1)] * 1000 if samples else 0.0
+        return stats
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            self._pool_pid = None
+
+
+# Shared instance used by the routes
+hasher = PasswordHasher()
@@ -0,0 +1,165 @@
+"""Background database prober for the health endpoints.
+
+A daemon thread runs ``SELECT 1`` on a fixed interval and keeps the last result
+in memory, so ``/health`` never touches the database itself. Each probe runs on
+a helper thread with a hard timeout: if the database hangs the status flips to
+unhealthy after ``timeout`` seconds instead of waiting for the TCP timeout.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from sqlalchemy import text
+
+logger = logging.getLogger('health')
+
+
+class DBProber:
+    # Names the database in log messages
+    label = "Database"
+
+    def __init__(self, interval=None, timeout=None, stale_after=None, bind_key=None):
+        if interval is None:
+            interval = float(os.getenv('HEALTH_PROBE_INTERVAL', 5))
+        if timeout is None:
+            timeout = float(os.getenv('HEALTH_PROBE_TIMEOUT', 2))
+        if stale_after is None:
+            stale_after = float(os.getenv('HEALTH_STALE_AFTER', interval * 3))
+        self.interval = interval
+        self.timeout = timeout
+        self.stale_after = stale_after
+        # Flask-SQLAlchemy bind to probe; None is the primary database
+        self.bind_key = bind_key
+
+        self.engine = None
+        self._app = None
+        self._db = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pid = None
+        self._thread = None
+        self._executor = None
+        self._pending = None
+
+        # Cached result of the last probe
+        self.available = None
+        self.error = None
+        self.checked_at = None
+        self.latency_ms = None
+
+    def init_app(self, app, db):
+        self._app = app
+        self._db = db
+
+        @app.before_request
+        def start_db_prober():
+            self.ensure_started()
+
+    def ensure_started(self):
+        # Started lazily and per process so forked workers get their own thread
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            with self._app.app_context():
+                self.engine = self._db.engines[self.bind_key]
+            self._stop.clear()
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-probe')
+            self._pending = None
+            self._thread = threading.Thread(target=self._run, name='db-prober', daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _query(self):
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    def probe(self):
+        # A probe still stuck from a previous round keeps the database unhealthy
+        if self._pending is not None and not self._pending.done():
+            self._record(False, f"Database probe still pending after {self.timeout}s", None)
+            return
+
+        start = time.perf_counter()
+        self._pending = self._executor.submit(self._query)
+        try:
+            self._pending.result(timeout=self.timeout)
+            self._record(True, None, (time.perf_counter() - start) * 1000)
+        except TimeoutError:
+            self._record(False, f"Database probe timed out after {self.timeout}s", None)
+        except Exception as e:
+            self._record(False, str(e), None)
+
+    def _record(self, available, error, latency_ms):
+        if available != self.available:
+            if available:
+                logger.info("%s connection successful", self.label)
+            else:
+                logger.error("%s connection failed: %s; continuing with limited functionality", self.label, error)
+        self.available = available
+        self.error = error
+        self.latency_ms = latency_ms
+        self.checked_at = time.time()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.probe()
+            self._stop.wait(self.interval)
+
+    def is_stale(self):
+        return self.checked_at is None or time.time() - self.checked_at > self.stale_after
+
+    def status(self):
+        if self.available is None:
+            return "unknown"
+        if self.is_stale():
+            return "stale"
+        return "healthy" if self.available else "unhealthy"
+
+    def is_ready(self):
+        return self.status() == "healthy"
+
+
+class AsyncDBProber(DBProber):
+    """DBProber for the asyncio app: probes from a task on the event loop."""
+
+    def start(self, engine):
+        self.engine = engine
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._run_async())
+
+    async def stop_async(self):
+        self._stop.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def _query_async(self):
+        async with self.engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    async def probe_async(self):
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._query_async(), timeout=self.timeout)
+            self._record(True, None, (time.perf_counter() - start) * 1000)
+        except asyncio.TimeoutError:
+            self._record(False, f"Database probe timed out after {self.timeout}s", None)
+        except Exception as e:
+            self._record(False, str(e), None)
+
+    async def _run_async(self):
+        while not self._stop.is_set():
+            await self.probe_async()
+            await asyncio.sleep(self.interval)
+
+
+db_prober = DBProber()
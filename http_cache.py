@@ -0,0 +1,31 @@
+"""HTTP caching helpers for conditional GETs.
+
+A resource's ETag is derived from the ``updated_at`` columns of the rows it is
+built from, so it changes whenever one of them is written and revalidating it
+only needs those columns, not the full rows. Responses are ``private`` (they
+depend on the bearer token) and must be revalidated unless
+``PROFILE_CACHE_MAX_AGE`` allows clients to reuse them for a few seconds.
+"""
+import hashlib
+import os
+
+PROFILE_CACHE_MAX_AGE = int(os.getenv('PROFILE_CACHE_MAX_AGE', 0))
+
+
+def make_etag(*parts):
+    raw = ':'.join('' if part is None else str(part) for part in parts)
+    return hashlib.sha1(raw.encode()).hexdigest()[:20]
+
+
+def profile_etag(user_id, profile_updated_at, user_updated_at):
+    """ETag of ``GET /profile``."""
+    return make_etag('profile', user_id, profile_updated_at, user_updated_at)
+
+
+def cache_headers(etag, max_age=None):
+    max_age = PROFILE_CACHE_MAX_AGE if max_age is None else max_age
+    return {
+        'ETag': f'"{etag}"',
+        'Cache-Control': f"private, max-age={max_age}" if max_age > 0 else 'private, no-cache',
+        'Vary': 'Authorization',
+    }
@@ -0,0 +1,83 @@
+"""JSON provider for the Flask app.
+
+``jsonify``, ``request.get_json`` and ``current_app.json`` all go through the
+app's JSON provider. ``FastJSONProvider`` uses orjson when it is installed
+(``JSON_PROVIDER=orjson``, the default) and the stdlib ``json`` module
+otherwise (or with ``JSON_PROVIDER=stdlib``). Both produce the same documents:
+
+- keys are sorted, as with Flask's default provider;
+- datetimes and dates are ISO 8601; naive datetimes are UTC (the models store
+  ``datetime.utcnow()``) and get a ``+00:00`` offset;
+- UUIDs and decimals become strings, dataclasses become objects.
+
+Non-ASCII text is written as UTF-8 rather than ``\\u`` escapes.
+"""
+import dataclasses
+import decimal
+import os
+import uuid
+from datetime import date, datetime, timezone
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(o):
+    if isinstance(o, datetime):
+        if o.tzinfo is None:
+            o = o.replace(tzinfo=timezone.utc)
+        return o.isoformat()
+    if isinstance(o, date):
+        return o.isoformat()
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o):
+        return dataclasses.asdict(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    default = staticmethod(_default)
+    ensure_ascii = False
+
+    def __init__(self, app):
+        super().__init__(app)
+        backend = os.getenv('JSON_PROVIDER', 'orjson')
+        self.use_orjson = backend == 'orjson' and orjson is not None
+
+    def _orjson_options(self, indent=False):
+        options = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps_bytes(self, obj, indent=False):
+        """Serialize ``obj`` to UTF-8 bytes, skipping the str round trip orjson doesn't need."""
+        if self.use_orjson:
+            return orjson.dumps(obj, default=self.default, option=self._orjson_options(indent))
+        return (self.dumps(obj, indent=2) if indent else self.dumps(obj)).encode()
+
+    def dumps(self, obj, **kwargs):
+        # Calls asking for stdlib-only options (cls, indent, ...) keep the stdlib path
+        if not kwargs:
+            if self.use_orjson:
+                return self.dumps_bytes(obj).decode()
+            kwargs['separators'] = (',', ':')
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if self.use_orjson and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self.dumps_bytes(obj, indent) + b'\n', mimetype=self.mimetype)
@@ -0,0 +1,338 @@
+"""Structured JSON logging that stays off the request path.
+
+Every log record becomes one JSON object per line. Loggers hand records to a
+``LogQueueHandler``, which only resolves the message and appends the record
+to an in-memory queue; it never blocks and wakes nothing. A ``log-writer``
+thread (one per process, started lazily so forked gunicorn workers get their
+own) wakes every ``LOG_FLUSH_INTERVAL`` seconds, formats what has queued up
+and writes it ``LOG_BATCH_SIZE`` records per ``write`` call. When
+``LOG_QUEUE_SIZE`` records are waiting, new ones are dropped;
+``log_records_total`` counts the records written, dropped and sampled out by
+writer (``app`` or ``audit``).
+
+``LOG_FILE`` (stdout when unset) is rotated when it reaches ``LOG_MAX_BYTES``,
+keeping ``LOG_BACKUP_COUNT`` old files. Workers append to the same file: the
+rotation is done under a lock file and the other workers reopen the new file
+before their next write.
+
+Three streams, told apart by the ``logger`` key:
+
+- ``access``: one record per request, with its endpoint, status, duration and
+  SQL query count. Endpoints listed in ``LOG_SAMPLE_RATES``
+  (``endpoint=rate,...``) are sampled; errors and requests slower than
+  ``LOG_SLOW_REQUEST_MS`` are always kept. Query strings are not logged.
+- ``audit``: security events from ``audit()`` (signins, password changes and
+  resets, ...). Never sampled; written to ``AUDIT_LOG_FILE`` when it is set.
+- everything else (``health``, ``outbox``, ``sql.profiler``, ...).
+"""
+import atexit
+import fcntl
+import json
+import logging
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import deque
+from logging.handlers import QueueHandler
+from flask import g, has_request_context, request
+from metrics import LOG_RECORDS
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DEFAULT_SAMPLE_RATES = 'health_check=0.01,liveness_check=0.01,readiness_check=0.01,metrics_endpoint=0.01'
+
+# Request ids taken from the client are echoed back, so only safe ones are kept
+REQUEST_ID = re.compile(r'[A-Za-z0-9._-]{1,64}')
+
+access_logger = logging.getLogger('access')
+audit_logger = logging.getLogger('audit')
+
+# Writers started by configure(), flushed at exit
+writers = []
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        if orjson is not None:
+            return orjson.dumps(entry, default=str).decode()
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class LogWriter:
+    """Writes queued records in batches from a background thread."""
+
+    def __init__(self, path=None, stream='app', max_bytes=None, backup_count=None, batch_size=None, queue_size=None,
+                 flush_interval=None):
+        self.path = path
+        self.stream = stream
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv('LOG_MAX_BYTES', 50 * 1024 * 1024))
+        self.backup_count = backup_count if backup_count is not None else int(os.getenv('LOG_BACKUP_COUNT', 5))
+        self.batch_size = batch_size or int(os.getenv('LOG_BATCH_SIZE', 512))
+        self.queue_size = queue_size or int(os.getenv('LOG_QUEUE_SIZE', 20000))
+        self.flush_interval = flush_interval or float(os.getenv('LOG_FLUSH_INTERVAL', 0.2))
+        self.formatter = JSONFormatter()
+        # deque.append/popleft are atomic: no lock or wakeup on the logging thread
+        self._records = deque()
+        self._wake = threading.Event()
+        self._pid = None
+        self._lock = threading.Lock()
+        self._fd = None
+        self._failing = False
+
+    def put(self, record):
+        if self._pid != os.getpid():
+            self.ensure_started()
+        if len(self._records) >= self.queue_size:
+            LOG_RECORDS.inc(self.stream, 'dropped')
+            return
+        self._records.append(record)
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Records or a file inherited from the parent process are not ours to write
+            self._records = deque()
+            self._wake = threading.Event()
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            threading.Thread(target=self._run, name='log-writer', daemon=True).start()
+            self._pid = os.getpid()
+
+    def flush(self, timeout=5):
+        """Wait until the records queued so far are written."""
+        if self._pid != os.getpid():
+            return True
+        done = threading.Event()
+        self._records.append(done)
+        self._wake.set()
+        return done.wait(timeout)
+
+    def _run(self):
+        wake = self._wake
+        while True:
+            wake.wait(self.flush_interval)
+            wake.clear()
+            self._drain()
+
+    def _drain(self):
+        pending = self._records
+        while pending:
+            batch = []
+            while pending and len(batch) < self.batch_size:
+                batch.append(pending.popleft())
+            records = [item for item in batch if isinstance(item, logging.LogRecord)]
+            if records:
+                self._write(records)
+            # flush() markers: everything queued before them is written
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+
+    def _write(self, records):
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.formatter.format(record))
+            except Exception:
+                LOG_RECORDS.inc(self.stream, 'dropped')
+        data = ('\n'.join(lines) + '\n').encode()
+        try:
+            if self.path is None:
+                sys.stdout.buffer.write(data)
+                sys.stdout.flush()
+            else:
+                self._write_file(data)
+        except OSError as e:
+            LOG_RECORDS.inc(self.stream, 'dropped', amount=len(lines))
+            if not self._failing:
+                sys.stderr.write(f"Could not write log file {self.path}: {e}\n")
+                self._failing = True
+            return
+        self._failing = False
+        LOG_RECORDS.inc(self.stream, 'written', amount=len(lines))
+
+    def _write_file(self, data):
+        # Another worker may have rotated the file: follow it to the new one
+        if self._fd is None or not self._is_current():
+            self._reopen()
+        os.write(self._fd, data)
+        if self.max_bytes and os.fstat(self._fd).st_size >= self.max_bytes:
+            self._rotate()
+
+    def _is_current(self):
+        try:
+            current = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        opened = os.fstat(self._fd)
+        return (current.st_dev, current.st_ino) == (opened.st_dev, opened.st_ino)
+
+    def _reopen(self):
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _rotate(self):
+        with open(f"{self.path}.lock", 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Re-checked under the lock: another worker may have just rotated it
+            if self._is_current() and os.fstat(self._fd).st_size >= self.max_bytes:
+                for index in range(self.backup_count - 1, 0, -1):
+                    if os.path.exists(f"{self.path}.{index}"):
+                        os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+                if self.backup_count > 0:
+                    os.replace(self.path, f"{self.path}.1")
+                else:
+                    os.remove(self.path)
+            self._reopen()
+
+
+class LogQueueHandler(QueueHandler):
+    """Hands records to a ``LogWriter`` without blocking the caller."""
+
+    def __init__(self, writer):
+        super().__init__(None)
+        self.writer = writer
+
+    def prepare(self, record):
+        # Resolve the message and traceback now: the arguments may change once the call returns.
+        # In place, as the result is the same for any other handler
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.writer.formatter.formatException(record.exc_info)
+        return record
+
+    def enqueue(self, record):
+        self.writer.put(record)
+
+
+def parse_sample_rates(value):
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        endpoint, _, rate = item.partition('=')
+        rates[endpoint.strip()] = float(rate)
+    return rates
+
+
+class AccessLog:
+    def __init__(self, sample_rates=None, slow_ms=None):
+        if sample_rates is None:
+            sample_rates = parse_sample_rates(os.getenv('LOG_SAMPLE_RATES', DEFAULT_SAMPLE_RATES))
+        self.sample_rates = sample_rates
+        self.slow_ms = slow_ms if slow_ms is not None else float(os.getenv('LOG_SLOW_REQUEST_MS', 1000))
+
+    def init_app(self, app):
+        @app.before_request
+        def start_access_log():
+            request_id = request.headers.get('X-Request-ID')
+            g.request_id = request_id if request_id and REQUEST_ID.fullmatch(request_id) else secrets.token_hex(8)
+            g.access_start = time.perf_counter()
+
+        @app.after_request
+        def write_access_log(response):
+            start = g.pop('access_start', None)
+            if start is None:
+                return response
+            response.headers['X-Request-ID'] = g.request_id
+            self.record(response.status_code, (time.perf_counter() - start) * 1000)
+            return response
+
+    def record(self, status, duration_ms):
+        if not access_logger.isEnabledFor(logging.INFO):
+            return
+        # Each access through the request/g proxies is a context lookup: resolve them once
+        req = request._get_current_object()
+        endpoint = req.endpoint or 'unmatched'
+        # Decided before anything is built, so a sampled-out request costs one random()
+        rate = self.sample_rates.get(endpoint, 1.0)
+        if rate < 1.0 and status < 400 and duration_ms < self.slow_ms and random.random() >= rate:
+            LOG_RECORDS.inc('app', 'sampled_out')
+            return
+        ctx = g._get_current_object()
+        # makeRecord/handle rather than info(): skips the caller lookup, which costs more than the rest
+        record = access_logger.makeRecord('access', logging.INFO, __file__, 0, "%s %s %s",
+                                          (req.method, req.path, status), None)
+        record.fields = {
+            "request_id": ctx.request_id,
+            "method": req.method,
+            "path": req.path,
+            "endpoint": endpoint,
+            "status": status,
+            "duration_ms": round(duration_ms, 2),
+            "db_queries": ctx.get('db_queries', 0),
+            "user_id": ctx.get('user_id'),
+            "ip": req.remote_addr,
+            "sample_rate": rate,
+        }
+        access_logger.handle(record)
+
+
+access_log = AccessLog()
+
+
+def audit(event, **fields):
+    """Record a security event (never sampled). Pass ids, never secrets."""
+    if has_request_context():
+        fields.setdefault('request_id', g.get('request_id'))
+        fields.setdefault('ip', request.remote_addr)
+    audit_logger.info(event, extra={'fields': {"event": event, **fields}})
+
+
+def configure():
+    """Send every logger through the queue handlers; safe to call more than once."""
+    root = logging.getLogger()
+    if any(isinstance(handler, LogQueueHandler) for handler in root.handlers):
+        return
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    # processName isn't logged; looking it up costs a little on every record
+    logging.logMultiprocessing = False
+
+    writer = LogWriter(os.getenv('LOG_FILE') or None)
+    root.addHandler(LogQueueHandler(writer))
+    writers.append(writer)
+
+    audit_file = os.getenv('AUDIT_LOG_FILE')
+    if audit_file:
+        audit_writer = LogWriter(audit_file, stream='audit')
+        audit_logger.addHandler(LogQueueHandler(audit_writer))
+        audit_logger.propagate = False
+        writers.append(audit_writer)
+
+    # The writer threads are daemons: write what is queued before the process exits
+    atexit.register(flush)
+
+
+def flush(timeout=5):
+    for writer in writers:
+        writer.flush(timeout)
+
+
+def init_app(app):
+    configure()
+    access_log.init_app(app)
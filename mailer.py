@@ -0,0 +1,85 @@
+"""Outgoing email, sent by the outbox worker.
+
+``MAIL_BACKEND`` picks the transport:
+
+- ``file`` (default): each message is written to ``MAIL_DIR`` as
+  ``<key>.eml``. A stand-in for SMTP in development and tests; delivering the
+  same message again overwrites its file.
+- ``smtp``: sent through ``MAIL_SMTP_HOST``:``MAIL_SMTP_PORT`` over one
+  connection kept open between messages, with STARTTLS and login when
+  ``MAIL_SMTP_USER`` is set.
+
+Messages get a ``Message-ID`` built from their key, so a message delivered
+twice after a retry can be recognised as a duplicate.
+"""
+import os
+import smtplib
+from email.message import EmailMessage
+
+
+def build_message(to, subject, body, key):
+    message = EmailMessage()
+    message['From'] = os.getenv('MAIL_FROM', 'no-reply@localhost')
+    message['To'] = to
+    message['Subject'] = subject
+    message['Message-ID'] = f"<{key}@{os.getenv('MAIL_DOMAIN', 'localhost')}>"
+    message.set_content(body)
+    return message
+
+
+class FileMailer:
+    def __init__(self, directory=None):
+        self.directory = directory or os.getenv('MAIL_DIR', '/tmp/bit-mail')
+
+    def send(self, message, key):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{key}.eml")
+        tmp = f"{path}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(message.as_bytes())
+        os.replace(tmp, path)
+
+    def close(self):
+        pass
+
+
+class SMTPMailer:
+    def __init__(self, host=None, port=None, user=None, password=None, timeout=None):
+        self.host = host or os.getenv('MAIL_SMTP_HOST', 'localhost')
+        self.port = port or int(os.getenv('MAIL_SMTP_PORT', 587))
+        self.user = user or os.getenv('MAIL_SMTP_USER')
+        self.password = password or os.getenv('MAIL_SMTP_PASSWORD')
+        self.timeout = timeout or float(os.getenv('MAIL_SMTP_TIMEOUT', 10))
+        self._smtp = None
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.user:
+            smtp.starttls()
+            smtp.login(self.user, self.password)
+        return smtp
+
+    def send(self, message, key):
+        if self._smtp is None:
+            self._smtp = self._connect()
+        try:
+            self._smtp.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            # The server closed the idle connection; reconnect once
+            self._smtp = self._connect()
+            self._smtp.send_message(message)
+        except OSError:
+            # Don't reuse a connection in an unknown state for the next message
+            self._smtp = None
+            raise
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except smtplib.SMTPException:
+                pass
+            self._smtp = None
+
+
+mailer = SMTPMailer() if os.getenv('MAIL_BACKEND', 'file') == 'smtp' else FileMailer()
@@ -0,0 +1,299 @@
+"""Profile picture storage, thumbnails and serving.
+
+``PUT /profile/picture`` (in routes.py and asgi.py) takes the image as the raw
+request body (JPEG, PNG, GIF or WebP, at most ``MEDIA_MAX_BYTES``). The body is
+streamed to a temporary file in ``MEDIA_DIR`` in ``CHUNK_SIZE`` pieces while it
+is hashed, so an upload never sits in memory. Objects are content-addressed: the key is the SHA-256 of
+the bytes plus the image type's extension, and uploading an image that is
+already stored keeps the existing file. The profile's ``profile_picture``
+becomes ``/media/<key>``.
+
+Square thumbnails (``MEDIA_THUMBNAIL_SIZES`` pixels) are made after the
+response is sent, on a process pool of ``MEDIA_THUMBNAIL_WORKERS``, and need
+Pillow. Until a thumbnail exists (or without Pillow) its URL redirects to the
+original.
+
+Objects never change once stored, so ``GET /media/...`` serves them as
+``public, max-age=MEDIA_CACHE_MAX_AGE, immutable``. In production the web
+server can serve ``MEDIA_DIR`` directly with the same headers.
+"""
+import hashlib
+import importlib.util
+import logging
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from flask import Blueprint, jsonify, redirect, send_file
+from metrics import MEDIA_THUMBNAILS, MEDIA_UPLOADS
+
+CHUNK_SIZE = 64 * 1024
+
+# Leading bytes of the accepted image types -> extension
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+MIMETYPES = {'jpg': 'image/jpeg', 'png': 'image/png', 'gif': 'image/gif', 'webp': 'image/webp'}
+KEY = re.compile(r'[0-9a-f]{64}\.(jpg|png|gif|webp)')
+MEDIA_URL_PREFIX = '/media/'
+
+logger = logging.getLogger('media')
+
+media = Blueprint('media', __name__)
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UnsupportedImage(Exception):
+    pass
+
+
+def sniff_extension(head):
+    for signature, extension in SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def thumbnail_sizes():
+    return [int(size) for size in os.getenv('MEDIA_THUMBNAIL_SIZES', '64,256').split(',') if size.strip()]
+
+
+def thumbnail_extension(extension):
+    # Animated GIFs and WebPs get a still PNG thumbnail
+    return extension if extension in ('jpg', 'png') else 'png'
+
+
+def media_key(url):
+    """The object key of a ``/media/<key>`` URL, or None for any other URL."""
+    if url and url.startswith(MEDIA_URL_PREFIX) and KEY.fullmatch(url[len(MEDIA_URL_PREFIX):]):
+        return url[len(MEDIA_URL_PREFIX):]
+    return None
+
+
+def thumbnail_urls(url):
+    """``{size: url}`` for a stored profile picture, None for external URLs."""
+    key = media_key(url)
+    if key is None:
+        return None
+    return {str(size): f"{MEDIA_URL_PREFIX}thumbs/{size}/{key}" for size in thumbnail_sizes()}
+
+
+class StoredObject:
+    def __init__(self, key, size, deduplicated):
+        self.key = key
+        self.size = size
+        self.deduplicated = deduplicated
+
+
+class FileSystemStorage:
+    """Content-addressed objects under ``root``: ``objects/ab/<key>`` and ``thumbs/<size>/ab/<key>``."""
+
+    def __init__(self, root=None, max_bytes=None):
+        self.root = root or os.getenv('MEDIA_DIR', '/tmp/bit-media')
+        self.max_bytes = max_bytes or int(os.getenv('MEDIA_MAX_BYTES', 5 * 1024 * 1024))
+
+    def path(self, key):
+        return os.path.join(self.root, 'objects', key[:2], key)
+
+    def thumbnail_path(self, key, size):
+        stem = key.rsplit('.', 1)[0]
+        extension = thumbnail_extension(key.rsplit('.', 1)[1])
+        return os.path.join(self.root, 'thumbs', str(size), key[:2], f"{stem}.{extension}")
+
+    def save(self, stream):
+        """Copy ``stream`` into the store and return a ``StoredObject``.
+
+        Raises ``UnsupportedImage`` or ``UploadTooLarge``; nothing is kept then.
+        """
+        tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        head = b''
+        extension = None
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        MEDIA_UPLOADS.inc('too_large')
+                        raise UploadTooLarge()
+                    if extension is None:
+                        head += chunk[:12 - len(head)]
+                        # Known from the first 12 bytes: don't read the rest of a non-image
+                        extension = sniff_extension(head)
+                        if extension is None and len(head) >= 12:
+                            MEDIA_UPLOADS.inc('unsupported')
+                            raise UnsupportedImage()
+                    digest.update(chunk)
+                    f.write(chunk)
+
+            if extension is None:
+                MEDIA_UPLOADS.inc('unsupported')
+                raise UnsupportedImage()
+
+            key = f"{digest.hexdigest()}.{extension}"
+            path = self.path(key)
+            if os.path.exists(path):
+                os.remove(tmp)
+                MEDIA_UPLOADS.inc('deduplicated')
+                return StoredObject(key, size, True)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp, path)
+            MEDIA_UPLOADS.inc('stored')
+            return StoredObject(key, size, False)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+
+storage = FileSystemStorage()
+
+
+def make_thumbnails(source, targets, max_pixels):
+    """Write square thumbnails of ``source``: ``targets`` is ``[(size, path), ...]``.
+
+    Runs in a pool process. The image is decoded once, at the smallest scale
+    the largest thumbnail allows.
+    """
+    from PIL import Image, ImageOps
+
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    with Image.open(source) as image:
+        largest = max(size for size, _ in targets)
+        # JPEG can decode straight to a fraction of its size
+        image.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+        for size, path in sorted(targets, reverse=True):
+            thumbnail = ImageOps.fit(image, (size, size), Image.LANCZOS)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            if path.endswith('.jpg'):
+                thumbnail.convert('RGB').save(tmp, 'JPEG', quality=85, optimize=True)
+            else:
+                thumbnail.save(tmp, 'PNG', optimize=True)
+            os.replace(tmp, path)
+    return len(targets)
+
+
+class ThumbnailPool:
+    def __init__(self, storage, workers=None, queue_size=None, max_pixels=None):
+        self.storage = storage
+        # workers=0 makes thumbnails inline on the calling thread (useful for tests and scripts)
+        self.workers = workers if workers is not None else int(os.getenv('MEDIA_THUMBNAIL_WORKERS', 2))
+        self.queue_size = queue_size or int(os.getenv('MEDIA_THUMBNAIL_QUEUE_SIZE', 64))
+        self.max_pixels = max_pixels or int(os.getenv('MEDIA_MAX_PIXELS', 40_000_000))
+        self.available = importlib.util.find_spec('PIL') is not None
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+
+    def _get_pool(self):
+        # Per process, so a pool created before a fork is never shared with the children
+        pid = os.getpid()
+        if self._pool is None or self._pool_pid != pid:
+            with self._lock:
+                if self._pool is None or self._pool_pid != pid:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                    self._pool_pid = pid
+                    self._pending = set()
+        return self._pool
+
+    def schedule(self, key):
+        """Queue the missing thumbnails of ``key``; returns False if they can't be made now."""
+        if not self.available:
+            return False
+        targets = [(size, self.storage.thumbnail_path(key, size)) for size in thumbnail_sizes()]
+        targets = [(size, path) for size, path in targets if not os.path.exists(path)]
+        if not targets:
+            return True
+        if self.workers <= 0:
+            self._finish(key, lambda: make_thumbnails(self.storage.path(key), targets, self.max_pixels))
+            return True
+
+        pool = self._get_pool()
+        with self._lock:
+            # The same picture uploaded twice (or requested while pending) is made once
+            if key in self._pending:
+                return True
+            if len(self._pending) >= self.queue_size:
+                MEDIA_THUMBNAILS.inc('shed')
+                return False
+            self._pending.add(key)
+        future = pool.submit(make_thumbnails, self.storage.path(key), targets, self.max_pixels)
+        future.add_done_callback(lambda done: self._finish(key, done.result))
+        return True
+
+    def _finish(self, key, result):
+        try:
+            result()
+            MEDIA_THUMBNAILS.inc('made')
+        except Exception as e:
+            MEDIA_THUMBNAILS.inc('failed')
+            logger.warning("Thumbnails for %s failed: %s", key, e)
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+
+thumbnails = ThumbnailPool(storage)
+
+
+def stored_object(key):
+    """Path of the stored object ``key``, or None if the key is malformed or unknown."""
+    path = storage.path(key) if KEY.fullmatch(key) else None
+    return path if path is not None and os.path.exists(path) else None
+
+
+def immutable(response):
+    # send_file marks responses no-cache unless given a max_age
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = int(os.getenv('MEDIA_CACHE_MAX_AGE', 365 * 24 * 3600))
+    response.cache_control.immutable = True
+    return response
+
+
+@media.route('/media/<key>', methods=['GET'])
+def media_object(key):
+    path = stored_object(key)
+    if path is None:
+        return jsonify({"error": "Not found"}), 404
+    # The key is the content hash: a strong ETag that never changes
+    response = send_file(path, mimetype=MIMETYPES[key.rsplit('.', 1)[1]], conditional=True,
+                         etag=key.split('.')[0], max_age=None)
+    return immutable(response)
+
+
+@media.route('/media/thumbs/<int:size>/<key>', methods=['GET'])
+def media_thumbnail(size, key):
+    if size not in thumbnail_sizes() or stored_object(key) is None:
+        return jsonify({"error": "Not found"}), 404
+    path = storage.thumbnail_path(key, size)
+    if not os.path.exists(path):
+        # Not made yet (or lost): make it now and send the original meanwhile
+        thumbnails.schedule(key)
+        response = redirect(f"{MEDIA_URL_PREFIX}{key}", code=302)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    extension = path.rsplit('.', 1)[1]
+    response = send_file(path, mimetype=MIMETYPES[extension], conditional=True,
+                         etag=f"{key.split('.')[0]}-{size}", max_age=None)
+    return immutable(response)
@@ -0,0 +1,386 @@
+"""Prometheus-style metrics.
+
+Counters, gauges and histograms live in process memory and are rendered in the
+Prometheus text format by ``GET /metrics``. Recording a sample is a dict lookup
+and a few additions under a lock, so it is cheap enough for every request.
+
+Under gunicorn each worker only sees its own requests. When ``METRICS_DIR`` is
+set, every worker writes a snapshot of its metrics there every
+``METRICS_FLUSH_INTERVAL`` seconds and ``/metrics`` merges the snapshots of all
+workers with its own live values. Gauges of workers that have exited are dropped;
+their counters and histograms are kept so totals never go backwards. When
+gunicorn reaps a worker, its snapshot is folded into ``exited.json`` so workers
+recycled by ``max_requests`` don't leave a file each behind.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('metrics')
+
+# Per-worker snapshots in METRICS_DIR; anything else there is ignored
+SNAPSHOT_FILE = re.compile(r'(\d+)\.json')
+# Counters and histograms of the workers that have exited
+EXITED_FILE = 'exited.json'
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def snapshot(self):
+        return {metric.name: metric.snapshot() for metric in self.metrics}
+
+
+registry = Registry()
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def snapshot(self):
+        with self._lock:
+            samples = [[list(labels), self._copy(value)] for labels, value in self._values.items()]
+        return {"type": self.kind, "help": self.documentation,
+                "labelnames": list(self.labelnames), "samples": samples}
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        # Counts are stored per bucket and made cumulative when rendering
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def snapshot(self):
+        data = super().snapshot()
+        data["buckets"] = list(self.buckets)
+        return data
+
+    @staticmethod
+    def _copy(value):
+        return [list(value[0]), value[1], value[2]]
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        self.histogram.observe(self.elapsed, *self.labels)
+
+
+# Metrics recorded across the app
+REQUESTS = Counter('http_requests_total', 'HTTP requests by endpoint and status', ('method', 'endpoint', 'status'))
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'HTTP request latency', ('method', 'endpoint'))
+IN_FLIGHT = Gauge('http_requests_in_flight', 'HTTP requests currently being served')
+DB_SECONDS = Histogram('db_query_duration_seconds', 'Time spent executing SQL statements')
+HASH_SECONDS = Histogram('password_hash_duration_seconds', 'Password hashing latency including queueing', ('operation',))
+HASH_REJECTED = Counter('password_hash_rejected_total', 'Password hashing calls shed because the queue was full')
+CACHE_REQUESTS = Counter('cache_requests_total', 'Lookup cache requests by result (hit, miss, coalesced)', ('cache', 'result'))
+DB_READ_ROUTES = Counter('db_read_routes_total', 'Replica-eligible reads by the database that served them', ('target',))
+OUTBOX_JOBS = Counter('outbox_jobs_total', 'Outbox jobs run by the worker by result (delivered, retried, failed)', ('kind', 'result'))
+RATE_LIMITED = Counter('rate_limited_total', 'Requests rejected by the rate limiter', ('endpoint',))
+MEDIA_UPLOADS = Counter('media_uploads_total', 'Profile picture uploads by result (stored, deduplicated, too_large, unsupported)', ('result',))
+MEDIA_THUMBNAILS = Counter('media_thumbnails_total', 'Thumbnail jobs by result (made, failed, shed)', ('result',))
+LOG_RECORDS = Counter('log_records_total', 'Log records by writer and result (written, dropped, sampled_out)', ('stream', 'result'))
+JWT_SECONDS = Histogram('jwt_duration_seconds', 'JWT encode/decode latency', ('operation',),
+                        buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005, 0.01))
+
+
+def merge_snapshots(snapshots, live_pids=None):
+    """Merge per-worker snapshots; ``live_pids`` limits which workers' gauges count."""
+    merged = {}
+    for pid, snapshot in snapshots:
+        for name, data in snapshot.items():
+            if data["type"] == 'gauge' and live_pids is not None and pid not in live_pids:
+                continue
+            target = merged.setdefault(name, {key: value for key, value in data.items() if key != 'samples'})
+            values = target.setdefault("values", {})
+            for labels, value in data["samples"]:
+                key = tuple(labels)
+                if data["type"] == 'histogram':
+                    current = values.setdefault(key, [[0] * len(value[0]), 0.0, 0])
+                    current[0] = [a + b for a, b in zip(current[0], value[0])]
+                    current[1] += value[1]
+                    current[2] += value[2]
+                else:
+                    values[key] = values.get(key, 0) + value
+    return merged
+
+
+def to_snapshot(merged):
+    """Turn ``merge_snapshots`` output back into the snapshot format."""
+    snapshot = {}
+    for name, data in merged.items():
+        entry = {key: value for key, value in data.items() if key != 'values'}
+        entry["samples"] = [[list(labels), value] for labels, value in data.get("values", {}).items()]
+        snapshot[name] = entry
+    return snapshot
+
+
+def _label_text(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def render(merged):
+    lines = []
+    for name, data in merged.items():
+        lines.append(f"# HELP {name} {data['help']}")
+        lines.append(f"# TYPE {name} {data['type']}")
+        names = data["labelnames"]
+        for labels, value in data.get("values", {}).items():
+            if data["type"] == 'histogram':
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(data["buckets"] + ['+Inf'], counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_label_text(names, labels, ('le', bound))} {cumulative}")
+                lines.append(f"{name}_sum{_label_text(names, labels)} {total}")
+                lines.append(f"{name}_count{_label_text(names, labels)} {count}")
+            else:
+                lines.append(f"{name}{_label_text(names, labels)} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsExporter:
+    """Shares this worker's metrics with the others through ``METRICS_DIR``."""
+
+    def __init__(self, directory=None, interval=None):
+        self.directory = directory if directory is not None else os.getenv('METRICS_DIR')
+        self.interval = interval if interval is not None else float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if not self.directory or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='metrics-exporter', daemon=True).start()
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f"{pid}.json")
+
+    def _write(self, path, data):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def _read(self, path):
+        with open(path) as f:
+            return json.load(f)
+
+    def flush(self):
+        self._write(self._path(os.getpid()), registry.snapshot())
+
+    def clear(self):
+        """Remove the snapshots of a previous run (gunicorn on_starting)."""
+        if not self.directory or not os.path.isdir(self.directory):
+            return
+        for filename in os.listdir(self.directory):
+            if SNAPSHOT_FILE.fullmatch(filename) or filename == EXITED_FILE:
+                os.remove(os.path.join(self.directory, filename))
+
+    def fold(self, pid):
+        """Merge the snapshot of exited worker ``pid`` into ``exited.json`` (gunicorn child_exit)."""
+        if not self.directory:
+            return
+        path = self._path(pid)
+        try:
+            snapshot = self._read(path)
+        except FileNotFoundError:
+            return
+        except ValueError:
+            os.remove(path)
+            return
+        exited_path = os.path.join(self.directory, EXITED_FILE)
+        try:
+            exited = self._read(exited_path)
+        except (OSError, ValueError):
+            exited = {"folded": [], "metrics": {}}
+
+        # Gauges are dropped: no pid is live
+        merged = merge_snapshots([(None, exited["metrics"]), (pid, snapshot)], live_pids=set())
+        # collect() skips the snapshots listed here, so between the two writes below
+        # the worker is counted once, never twice or not at all
+        folded = [other for other in exited["folded"] if os.path.exists(self._path(other))] + [pid]
+        self._write(exited_path, {"folded": folded, "metrics": to_snapshot(merged)})
+        os.remove(path)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except OSError as e:
+                logger.warning("Could not write metrics snapshot: %s", e)
+
+    @staticmethod
+    def _alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def collect(self):
+        pid = os.getpid()
+        snapshots = [(pid, registry.snapshot())]
+        live = {pid}
+        if self.directory and os.path.isdir(self.directory):
+            # Read before listing the snapshots: see fold()
+            folded = set()
+            try:
+                exited = self._read(os.path.join(self.directory, EXITED_FILE))
+                snapshots.append((None, exited["metrics"]))
+                folded.update(exited["folded"])
+            except (OSError, ValueError, KeyError):
+                pass
+            for filename in os.listdir(self.directory):
+                match = SNAPSHOT_FILE.fullmatch(filename)
+                if not match:
+                    continue
+                other = int(match.group(1))
+                if other == pid or other in folded:
+                    continue
+                try:
+                    with open(os.path.join(self.directory, filename)) as f:
+                        snapshots.append((other, json.load(f)))
+                except (OSError, ValueError):
+                    continue
+                if self._alive(other):
+                    live.add(other)
+        return render(merge_snapshots(snapshots, live))
+
+
+exporter = MetricsExporter()
+
+
+# Called as hook(statement, parameters, executemany, elapsed) after every statement,
+# so other instrumentation (query_profiler.py) doesn't time each statement again
+statement_hooks = []
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    DB_SECONDS.observe(elapsed)
+    if has_app_context():
+        g.db_seconds = g.get('db_seconds', 0.0) + elapsed
+        g.db_queries = g.get('db_queries', 0) + 1
+    for hook in statement_hooks:
+        hook(statement, parameters, executemany, elapsed)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute; drop its start time
+    # so the connection's next statement isn't timed from this one's
+    if context.connection is not None and context.execution_context is not None:
+        starts = context.connection.info.get('query_start')
+        if starts:
+            starts.pop()
+
+
+def init_app(app):
+    @app.before_request
+    def start_request_timer():
+        exporter.ensure_started()
+        g.request_start = time.perf_counter()
+        IN_FLIGHT.inc()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop('request_start', None)
+        if start is not None:
+            endpoint = request.endpoint or 'unmatched'
+            REQUEST_SECONDS.observe(time.perf_counter() - start, request.method, endpoint)
+            REQUESTS.inc(request.method, endpoint, str(response.status_code))
+            IN_FLIGHT.dec()
+        return response
@@ -0,0 +1,39 @@
+"""Add the entity page index, trigram and full-text indexes for the member directory
+
+Revision ID: 0a7e3c5d91b2
+Revises: fc1b0be439a8
+Create Date: 2026-10-18 10:15:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0a7e3c5d91b2'
+down_revision = 'fc1b0be439a8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Entity-filtered pages walk this index in order instead of filtering ix_users_created_at_id
+    op.create_index('ix_users_entity_created_at_id', 'users', ['entity', 'created_at', 'id'], unique=False)
+
+    # Only Postgres has pg_trgm; other databases use the in-process index in directory.py
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE INDEX ix_profiles_firstname_trgm ON profiles USING gin (lower(firstname) gin_trgm_ops)")
+    op.execute("CREATE INDEX ix_profiles_lastname_trgm ON profiles USING gin (lower(lastname) gin_trgm_ops)")
+    op.execute("CREATE INDEX ix_profiles_bio_tsv ON profiles USING gin (to_tsvector('simple', coalesce(bio, '')))")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_profiles_bio_tsv', table_name='profiles')
+        op.drop_index('ix_profiles_lastname_trgm', table_name='profiles')
+        op.drop_index('ix_profiles_firstname_trgm', table_name='profiles')
+
+    op.drop_index('ix_users_entity_created_at_id', table_name='users')
@@ -0,0 +1,41 @@
+"""Add lookup indexes and store a hash of the reset token
+
+Revision ID: fc1b0be439a8
+Revises: b56539e842d4
+Create Date: 2026-10-18 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'fc1b0be439a8'
+down_revision = 'b56539e842d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Pending reset tokens are dropped: they expire within minutes anyway and
+    # the raw token is no longer stored.
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('reset_token_hash', sa.String(length=64), nullable=True))
+        batch_op.drop_column('reset_token')
+        batch_op.create_index('ix_users_reset_token_hash', ['reset_token_hash'], unique=False)
+        batch_op.create_index('ix_users_entity', ['entity'], unique=False)
+        batch_op.create_index('ix_users_created_at_id', ['created_at', 'id'], unique=False)
+
+    # Case-insensitive email lookups (signin, signup, forgot-password)
+    op.create_index('ix_users_email_lower', 'users', [sa.text('lower(email)')], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_users_email_lower', table_name='users')
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index('ix_users_created_at_id')
+        batch_op.drop_index('ix_users_entity')
+        batch_op.drop_index('ix_users_reset_token_hash')
+        batch_op.add_column(sa.Column('reset_token', sa.String(length=500), nullable=True))
+        batch_op.drop_column('reset_token_hash')
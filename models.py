@@ -20,12 +20,55 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(328), nullable=False)
-    reset_token = db.Column(db.String(500), nullable=True)  # Add this column
+    reset_token_hash = db.Column(db.String(64), nullable=True, index=True)  # SHA-256 of the pending reset token
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    entity = db.Column(db.String(100), nullable=False)  # Represents the project or organization
+    entity = db.Column(db.String(100), nullable=False, index=True)  # Represents the project or organization
 
     profile = db.relationship('Profile', uselist=False, back_populates='user', cascade='all, delete-orphan')
 
     def __repr__(self):
         return f'<User {self.email}>'
+
+class RefreshToken(db.Model):
+    """A refresh token (only its SHA-256 digest is stored); see tokens.py."""
+    __tablename__ = 'refresh_tokens'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    token_hash = db.Column(db.String(64), nullable=False, unique=True)
+    session_id = db.Column(db.String(32), nullable=False, index=True)  # Shared by the tokens rotated from one signin
+    access_jti = db.Column(db.String(32), nullable=False)  # The access token issued with it
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    used_at = db.Column(db.DateTime, nullable=True)  # Rotated or revoked
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class RevokedToken(db.Model):
+    """An access token (jti) or all of a user's access tokens issued before a time; see revocation.py."""
+    __tablename__ = 'revoked_tokens'
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(32), nullable=True)
+    user_id = db.Column(db.Integer, nullable=True)
+    issued_before = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)  # Workers poll on it
+
+class OutboxJob(db.Model):
+    """A side effect (email, hook) saved with the transaction that caused it; see outbox.py."""
+    __tablename__ = 'outbox_jobs'
+    # Ids key the emails (Message-ID), so SQLite must not reuse those of deleted jobs
+    __table_args__ = {'sqlite_autoincrement': True}
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending or failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # next attempt, or end of a worker's lease
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Emails are looked up case-insensitively; created_at/id back the keyset pagination
+db.Index('ix_users_email_lower', db.func.lower(User.email))
+db.Index('ix_users_created_at_id', User.created_at, User.id)
+db.Index('ix_users_entity_created_at_id', User.entity, User.created_at, User.id)
+# The worker polls for due jobs
+db.Index('ix_outbox_jobs_status_available_at', OutboxJob.status, OutboxJob.available_at)
@@ -0,0 +1,224 @@
+"""Transactional outbox for the side effects of a request.
+
+A view calls ``enqueue(kind, payload)`` before it commits, so the job is saved
+in the same transaction as the change that caused it: both are stored or
+neither is. The view returns without waiting for email or any other slow I/O.
+
+The worker (``python outbox.py``, or ``./flask_service.sh worker-start``) claims
+due jobs in batches of ``OUTBOX_BATCH_SIZE`` and runs the handler registered
+for each kind. Delivered jobs are deleted. A job that raises is retried with
+exponential backoff (``OUTBOX_BACKOFF_BASE`` seconds, doubling up to
+``OUTBOX_BACKOFF_MAX``, with jitter) and is kept with status ``failed`` after
+``OUTBOX_MAX_ATTEMPTS`` attempts.
+
+Claiming a job moves its ``available_at`` ``OUTBOX_LEASE_SECONDS`` ahead, so
+if a worker dies mid-batch its jobs are picked up again when the lease ends.
+On Postgres several workers claim disjoint batches (``FOR UPDATE SKIP
+LOCKED``). Delivery is at least once: handlers get a key that is stable across
+retries (emails use it as their Message-ID).
+"""
+import datetime
+import logging
+import os
+import random
+import signal
+import threading
+import time
+from sqlalchemy import delete, select, update
+from auth import mint_reset_token, reset_token_digest
+from config import env_bool
+from database import db
+from mailer import build_message, mailer
+from metrics import OUTBOX_JOBS
+from models import OutboxJob, User
+
+logger = logging.getLogger('outbox')
+
+# kind -> handler(payload, key)
+HANDLERS = {}
+
+# Functions run (in order) by the worker after each signup: hook(payload, key)
+SIGNUP_HOOKS = []
+
+
+# Also return the reset token from POST /forgot-password. Anyone can call it for any email,
+# so this hands out account takeovers; only for development and tests
+RESET_TOKEN_IN_RESPONSE = env_bool('RESET_TOKEN_IN_RESPONSE')
+
+
+def handler(kind):
+    def decorator(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+def new_job(kind, payload, delay=0):
+    return OutboxJob(kind=kind, payload=payload,
+                     available_at=datetime.datetime.utcnow() + datetime.timedelta(seconds=delay))
+
+
+def enqueue(kind, payload, delay=0):
+    """Add a job to the current transaction; it is saved when the caller commits."""
+    job = new_job(kind, payload, delay)
+    db.session.add(job)
+    return job
+
+
+def password_reset_payload(user, claims):
+    # Never the token itself: the worker mints it again from the claims
+    return {"user_id": user.id, "email": user.email, "exp": claims['exp'], "jti": claims['jti'],
+            "digest": user.reset_token_hash}
+
+
+def signup_payload(user, profile):
+    return {"user_id": user.id, "email": user.email, "firstname": profile.firstname}
+
+
+@handler('password_reset_email')
+def send_password_reset_email(payload, key):
+    token = mint_reset_token(payload['user_id'], payload['exp'], payload['jti'])
+    if reset_token_digest(token) != payload['digest']:
+        raise ValueError("Minted reset token does not match the requested one (was SECRET_KEY changed?)")
+    if payload['exp'] <= time.time():
+        logger.info("Skipping password reset email for user %s: token expired", payload['user_id'])
+        return
+    current = db.session.scalar(select(User.reset_token_hash).where(User.id == payload['user_id']))
+    if current != payload['digest']:
+        logger.info("Skipping password reset email for user %s: token used or replaced", payload['user_id'])
+        return
+
+    minutes = int(os.getenv('RESET_TOKEN_EXPIRATION_MINUTES', 5))
+    url = os.getenv('RESET_PASSWORD_URL')
+    action = url.format(token=token) if url else f"Your reset token: {token}"
+    body = (f"We received a request to reset your password.\n\n{action}\n\n"
+            f"The link expires in {minutes} minutes. If you didn't ask for it, ignore this email.\n")
+    mailer.send(build_message(payload['email'], "Reset your password", body, key), key)
+
+
+@handler('user_signed_up')
+def run_signup_hooks(payload, key):
+    for hook in SIGNUP_HOOKS:
+        hook(payload, f"{key}-{hook.__name__}")
+
+
+def send_welcome_email(payload, key):
+    body = f"Hi {payload['firstname']},\n\nWelcome to Breaking Into Tech!\n"
+    mailer.send(build_message(payload['email'], "Welcome to Breaking Into Tech", body, key), key)
+
+
+SIGNUP_HOOKS.append(send_welcome_email)
+
+
+class OutboxWorker:
+    def __init__(self, app, batch_size=None, poll_interval=None, max_attempts=None, lease_seconds=None,
+                 backoff_base=None, backoff_max=None):
+        self.app = app
+        self.batch_size = batch_size or int(os.getenv('OUTBOX_BATCH_SIZE', 50))
+        self.poll_interval = poll_interval if poll_interval is not None else float(os.getenv('OUTBOX_POLL_INTERVAL', 1))
+        self.max_attempts = max_attempts or int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8))
+        self.lease_seconds = lease_seconds or float(os.getenv('OUTBOX_LEASE_SECONDS', 60))
+        self.backoff_base = backoff_base if backoff_base is not None else float(os.getenv('OUTBOX_BACKOFF_BASE', 2))
+        self.backoff_max = backoff_max if backoff_max is not None else float(os.getenv('OUTBOX_BACKOFF_MAX', 600))
+        self._stop = threading.Event()
+
+    def backoff(self, attempts):
+        # Exponential, with jitter so failed jobs don't all come back at once
+        delay = min(self.backoff_base * 2 ** (attempts - 1), self.backoff_max)
+        return delay * random.uniform(0.5, 1.0)
+
+    def claim(self):
+        """Lease up to ``batch_size`` due jobs in one statement and return them."""
+        now = datetime.datetime.utcnow()
+        due = (
+            select(OutboxJob.id)
+            .where(OutboxJob.status == 'pending', OutboxJob.available_at <= now)
+            .order_by(OutboxJob.available_at, OutboxJob.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        # Re-checking available_at makes a job claimed by another worker in the meantime drop out
+        statement = (
+            update(OutboxJob)
+            .where(OutboxJob.id.in_(due), OutboxJob.available_at <= now)
+            .values(available_at=now + datetime.timedelta(seconds=self.lease_seconds),
+                    attempts=OutboxJob.attempts + 1)
+            .returning(OutboxJob.id, OutboxJob.kind, OutboxJob.payload, OutboxJob.attempts)
+            .execution_options(synchronize_session=False)
+        )
+        jobs = db.session.execute(statement).all()
+        db.session.commit()
+        return jobs
+
+    def run_once(self):
+        """Claim and run one batch; returns the number of jobs claimed."""
+        with self.app.app_context():
+            jobs = self.claim()
+            if not jobs:
+                return 0
+
+            delivered, retries, failures = [], [], []
+            for job in jobs:
+                try:
+                    run = HANDLERS.get(job.kind)
+                    if run is None:
+                        raise LookupError(f"No handler for outbox job kind {job.kind!r}")
+                    run(job.payload, f"{job.kind}-{job.id}")
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                    if job.attempts >= self.max_attempts:
+                        logger.error("Outbox job %s (%s) failed after %s attempts: %s", job.id, job.kind, job.attempts, error)
+                        failures.append({"id": job.id, "status": 'failed', "last_error": error})
+                        OUTBOX_JOBS.inc(job.kind, 'failed')
+                    else:
+                        retry_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=self.backoff(job.attempts))
+                        retries.append({"id": job.id, "available_at": retry_at, "last_error": error})
+                        OUTBOX_JOBS.inc(job.kind, 'retried')
+                else:
+                    delivered.append(job.id)
+                    OUTBOX_JOBS.inc(job.kind, 'delivered')
+
+            # Record the whole batch in one transaction
+            if delivered:
+                db.session.execute(delete(OutboxJob).where(OutboxJob.id.in_(delivered)))
+            for changes in (retries, failures):
+                if changes:
+                    db.session.execute(update(OutboxJob), changes)
+            db.session.commit()
+            return len(jobs)
+
+    def run(self):
+        logger.info("Outbox worker started (batch %s, polling every %ss)", self.batch_size, self.poll_interval)
+        while not self._stop.is_set():
+            try:
+                claimed = self.run_once()
+            except Exception as e:
+                # e.g. the database is down: keep polling until it's back
+                logger.exception("Outbox worker error: %s", e)
+                claimed = 0
+            # A full batch means more jobs are probably due: don't wait
+            if claimed < self.batch_size:
+                self._stop.wait(self.poll_interval)
+        mailer.close()
+        logger.info("Outbox worker stopped")
+
+    def stop(self):
+        self._stop.set()
+
+
+def main():
+    from api import create_app
+    from metrics import exporter
+
+    app = create_app()
+    worker = OutboxWorker(app)
+    # Finish the current batch on SIGTERM/SIGINT, then exit
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: worker.stop())
+    # Job counters are merged into /metrics when METRICS_DIR is set
+    exporter.ensure_started()
+    worker.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""Password hashing parameters and transparent rehashing.
+
+The algorithm and cost come from the environment:
+
+- ``PASSWORD_HASH_ALGORITHM``: ``scrypt`` (memory-hard, default) or ``pbkdf2``
+- ``PASSWORD_HASH_COST``: scrypt ``N`` or pbkdf2 iterations
+- ``PASSWORD_HASH_TARGET_MS``: when no cost is given, ``calibrate()`` picks the
+  cost whose hash takes about this long on this machine
+
+Hashes record the parameters they were made with. After a successful signin,
+``schedule_rehash`` upgrades a hash made with outdated parameters on a background
+thread, so the cost can be raised (or the algorithm changed) without forcing
+password resets and without slowing down the signin response.
+"""
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash
+
+logger = logging.getLogger('password_policy')
+
+# Werkzeug's defaults, also used as the floor for calibration
+DEFAULT_COST = {
+    'scrypt': 2 ** 15,
+    'pbkdf2': 1_000_000,
+}
+MIN_COST = {
+    'scrypt': 2 ** 14,
+    'pbkdf2': 600_000,
+}
+# scrypt needs 128 * N * r bytes per hash; 2**17 with r=8 is 128 MiB
+MAX_SCRYPT_N = int(os.getenv('PASSWORD_HASH_MAX_SCRYPT_N', 2 ** 17))
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+
+class PasswordPolicy:
+    def __init__(self, algorithm=None, cost=None, target_ms=None):
+        if algorithm is None:
+            algorithm = os.getenv('PASSWORD_HASH_ALGORITHM', 'scrypt')
+        if algorithm not in DEFAULT_COST:
+            raise ValueError(f"Unsupported password hash algorithm: {algorithm}")
+        if cost is None and os.getenv('PASSWORD_HASH_COST'):
+            cost = int(os.getenv('PASSWORD_HASH_COST'))
+        if target_ms is None and os.getenv('PASSWORD_HASH_TARGET_MS'):
+            target_ms = float(os.getenv('PASSWORD_HASH_TARGET_MS'))
+
+        self.algorithm = algorithm
+        self.target_ms = target_ms
+        self.calibrated = False
+        self.cost = cost if cost is not None else DEFAULT_COST[algorithm]
+        self._explicit_cost = cost is not None
+
+    def method_for(self, cost):
+        if self.algorithm == 'scrypt':
+            return f"scrypt:{cost}:{SCRYPT_R}:{SCRYPT_P}"
+        return f"pbkdf2:sha256:{cost}"
+
+    @property
+    def method(self):
+        """Werkzeug ``method`` string; every hash records it before the first ``$``."""
+        return self.method_for(self.cost)
+
+    def _time_hash(self, cost):
+        start = time.perf_counter()
+        generate_password_hash('calibration-password', self.method_for(cost))
+        return (time.perf_counter() - start) * 1000
+
+    def calibrate(self):
+        """Choose the cost closest to ``target_ms`` per hash on this machine."""
+        if self._explicit_cost or not self.target_ms or self.calibrated:
+            return self.cost
+
+        base = MIN_COST[self.algorithm]
+        elapsed = self._time_hash(base)
+        # Hashing time grows linearly with the cost for both algorithms
+        cost = base * self.target_ms / max(elapsed, 0.001)
+        if self.algorithm == 'scrypt':
+            # N must be a power of two
+            cost = min(2 ** max(round(math.log2(cost)), 1), MAX_SCRYPT_N)
+        cost = max(int(cost), MIN_COST[self.algorithm])
+
+        self.cost = cost
+        self.calibrated = True
+        logger.info("Password hashing calibrated to %s (~%.0f ms per hash, target %.0f ms)",
+                    self.method, elapsed * cost / base, self.target_ms)
+        return cost
+
+    def needs_rehash(self, pwhash):
+        """True when ``pwhash`` uses another algorithm or a lower cost than the policy.
+
+        Hashes with a higher cost are left alone, so workers calibrated to
+        slightly different costs don't keep rehashing each other's work.
+        """
+        parts = pwhash.split('$', 1)[0].split(':')
+        try:
+            if self.algorithm == 'scrypt' and parts[0] == 'scrypt':
+                n, r, p = (int(x) for x in parts[1:4])
+                return (r, p) != (SCRYPT_R, SCRYPT_P) or n < self.cost
+            if self.algorithm == 'pbkdf2' and parts[:2] == ['pbkdf2', 'sha256']:
+                return int(parts[2]) < self.cost
+        except (IndexError, ValueError):
+            pass
+        return True
+
+
+policy = PasswordPolicy()
+
+# Upgrades run one at a time, off the request path
+_rehash_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='rehash')
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def _rehash(app, user_id, old_hash, password):
+    from sqlalchemy import update
+    from database import db
+    from hashing import hasher, HashingOverloaded
+    from models import User
+
+    try:
+        new_hash = hasher.generate(password)
+        with app.app_context():
+            # Only replace the hash we verified; a concurrent password change wins
+            db.session.execute(
+                update(User)
+                .where(User.id == user_id, User.password_hash == old_hash)
+                .values(password_hash=new_hash)
+            )
+            db.session.commit()
+    except HashingOverloaded:
+        pass  # Busy; the next signin tries again
+    except Exception as e:
+        logger.warning("Password rehash for user %s failed: %s", user_id, e)
+    finally:
+        with _pending_lock:
+            _pending.discard(user_id)
+
+
+def schedule_rehash(app, user_id, old_hash, password):
+    """Upgrade ``old_hash`` to the current policy in the background if it is outdated."""
+    if not policy.needs_rehash(old_hash):
+        return False
+    with _pending_lock:
+        if user_id in _pending:
+            return False
+        _pending.add(user_id)
+    _rehash_executor.submit(_rehash, app, user_id, old_hash, password)
+    return True
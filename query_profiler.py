@@ -0,0 +1,138 @@
+"""Opt-in SQL profiling.
+
+Enabled with ``SQL_PROFILING=true``. While on, every statement timed by the
+cursor listeners in metrics.py (``metrics.statement_hooks``) is also checked
+here, and:
+
+- statements slower than ``SQL_SLOW_QUERY_MS`` are logged with the shape of
+  their parameters (types, never values) and the route that issued them;
+- responses carry a ``Server-Timing`` header with the request's DB time and
+  query count;
+- requests issuing more queries than their budget are logged, or answered with
+  a 500 when ``SQL_QUERY_BUDGET_ENFORCE`` is set (meant for test runs).
+
+The default budget is ``SQL_QUERY_BUDGET``; a view can set its own with the
+``query_budget`` decorator. ``assert_max_queries`` checks a block of code
+directly.
+"""
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context, jsonify, request
+from config import env_bool
+from metrics import statement_hooks
+
+logger = logging.getLogger('sql.profiler')
+
+# Longer statements are truncated in the slow-query log
+MAX_LOGGED_STATEMENT = 2000
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(max_queries):
+    """Set the maximum number of SQL statements a view may issue per request."""
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def parameter_shape(parameters, executemany=False):
+    """Describe bound parameters by type so no values end up in the logs."""
+    if executemany:
+        rows = list(parameters or ())
+        return f"{len(rows)} x {parameter_shape(rows[0]) if rows else '()'}"
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f"{key}: {type(value).__name__}" for key, value in parameters.items()) + '}'
+    if isinstance(parameters, (list, tuple)):
+        # Runs of the same type are collapsed, e.g. a long IN list becomes "int x 300"
+        runs = []
+        for value in parameters:
+            name = type(value).__name__
+            if runs and runs[-1][0] == name:
+                runs[-1][1] += 1
+            else:
+                runs.append([name, 1])
+        return '(' + ', '.join(name if count == 1 else f"{name} x {count}" for name, count in runs) + ')'
+    return type(parameters).__name__
+
+
+# Blocks wrapped in assert_max_queries on the current thread
+_local = threading.local()
+
+
+class QueryProfiler:
+    def __init__(self):
+        self.enabled = env_bool('SQL_PROFILING')
+        self.slow_query_ms = float(os.getenv('SQL_SLOW_QUERY_MS', 100))
+        default_budget = os.getenv('SQL_QUERY_BUDGET')
+        self.default_budget = int(default_budget) if default_budget else None
+        self.enforce = env_bool('SQL_QUERY_BUDGET_ENFORCE')
+        self._listening = False
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+        self.listen()
+
+        @app.after_request
+        def finish_query_profile(response):
+            # Counted per request by metrics.py
+            queries = g.get('db_queries', 0)
+            seconds = g.get('db_seconds', 0.0)
+            response.headers.add('Server-Timing', f'db;dur={seconds * 1000:.2f};desc="{queries} queries"')
+
+            budget = self._budget_for_request()
+            if budget is not None and queries > budget:
+                message = f"{request.method} {request.path} issued {queries} SQL queries (budget {budget})"
+                if self.enforce:
+                    error = jsonify({"error": "Query budget exceeded", "detail": message})
+                    error.status_code = 500
+                    return error
+                logger.warning(message)
+            return response
+
+    def listen(self):
+        if not self._listening:
+            statement_hooks.append(self._check)
+            self._listening = True
+
+    def _budget_for_request(self):
+        view = current_app.view_functions.get(request.endpoint) if request.endpoint else None
+        return getattr(view, 'query_budget', self.default_budget)
+
+    def _check(self, statement, parameters, executemany, elapsed):
+        for counter in getattr(_local, 'counters', ()):
+            counter.append(statement)
+
+        if elapsed * 1000 >= self.slow_query_ms:
+            route = f"{request.method} {request.endpoint or request.path}" if has_request_context() else None
+            logger.warning(
+                "Slow query (%.1f ms) in %s: %s params=%s",
+                elapsed * 1000, route or 'no request', ' '.join(statement.split())[:MAX_LOGGED_STATEMENT],
+                parameter_shape(parameters, executemany),
+            )
+
+
+profiler = QueryProfiler()
+
+
+@contextmanager
+def assert_max_queries(max_queries):
+    """Fail with ``QueryBudgetExceeded`` if the block issues more than ``max_queries`` statements."""
+    profiler.listen()
+    statements = []
+    counters = getattr(_local, 'counters', [])
+    _local.counters = counters + [statements]
+    try:
+        yield statements
+    finally:
+        _local.counters = counters
+    if len(statements) > max_queries:
+        raise QueryBudgetExceeded(
+            f"{len(statements)} SQL queries issued (budget {max_queries}):\n" + '\n'.join(statements)
+        )
@@ -0,0 +1,243 @@
+"""Token-bucket rate limiting for the unauthenticated endpoints.
+
+Each limited endpoint has buckets keyed by client IP and, where the request
+carries them, by email and entity. A request takes one token from every bucket
+it maps to; if any bucket is empty nothing is taken and the request is answered
+with 429 + Retry-After before the view runs, so rejected requests never reach
+password hashing or the database.
+
+Limits are ``<requests>/<seconds>`` strings: the bucket holds ``requests``
+tokens and refills at ``requests / seconds`` tokens per second. Defaults are in
+``DEFAULT_LIMITS``; each can be overridden with ``RATE_LIMIT_<ENDPOINT>_<KEY>``
+(e.g. ``RATE_LIMIT_SIGNIN_EMAIL=5/60``) and ``off`` disables one.
+
+Buckets live in process memory by default. With ``RATE_LIMIT_BACKEND=redis``
+they live in Redis (or anything speaking its protocol) at ``RATE_LIMIT_REDIS_URL``
+so limits hold across workers and hosts. If Redis is unreachable requests are
+let through (``RATE_LIMIT_FAIL_OPEN``, default on) rather than locking every
+user out.
+"""
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import request
+from config import env_bool
+from metrics import RATE_LIMITED
+from redis_client import RedisClient, RedisError
+
+logger = logging.getLogger('rate_limit')
+
+DEFAULT_LIMITS = {
+    'signin': {'ip': '30/60', 'email': '10/300'},
+    'signup': {'ip': '10/3600', 'entity': '200/3600'},
+    'forgot_password': {'ip': '10/3600', 'email': '3/900'},
+}
+
+
+class RateLimited(Exception):
+    """Raised when a request exceeds one of its limits."""
+
+    def __init__(self, retry_after):
+        super().__init__("Rate limit exceeded")
+        self.retry_after = retry_after
+
+
+def parse_limit(value):
+    """``'10/60'`` -> ``(capacity=10, rate=10/60 per second)``; ``'off'`` -> ``None``."""
+    if value is None or value.strip().lower() in ('', 'off', 'none', '0'):
+        return None
+    requests, _, seconds = value.partition('/')
+    capacity = float(requests)
+    return capacity, capacity / float(seconds or 1)
+
+
+def take(states, now, limits, cost=1):
+    """Token-bucket step shared by every backend.
+
+    ``states`` holds ``(tokens, updated_at)`` or ``None`` per bucket and
+    ``limits`` the matching ``(capacity, rate)``. Returns ``(allowed,
+    retry_after, new_states)``; tokens are only taken when every bucket has
+    enough.
+    """
+    refilled = []
+    retry_after = 0.0
+    for state, (capacity, rate) in zip(states, limits):
+        tokens, updated_at = state if state is not None else (capacity, now)
+        tokens = min(capacity, tokens + max(0.0, now - updated_at) * rate)
+        if tokens < cost:
+            retry_after = max(retry_after, (cost - tokens) / rate)
+        refilled.append(tokens)
+    if retry_after:
+        return False, retry_after, None
+    return True, 0.0, [(tokens - cost, now) for tokens in refilled]
+
+
+class MemoryBackend:
+    """Buckets in this process; least recently used buckets are dropped past ``max_keys``."""
+
+    def __init__(self, max_keys=None):
+        if max_keys is None:
+            max_keys = int(os.getenv('RATE_LIMIT_MAX_KEYS', 100000))
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, keys, limits, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            states = [self._buckets.get(key) for key in keys]
+            allowed, retry_after, new_states = take(states, now, limits, cost)
+            if allowed:
+                for key, state in zip(keys, new_states):
+                    self._buckets[key] = state
+                    self._buckets.move_to_end(key)
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+# Same algorithm as take(), run atomically inside Redis.
+# KEYS: bucket keys; ARGV: now, cost, then capacity and rate for each key.
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local refilled = {}
+local retry_after = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[1 + 2 * i])
+    local rate = tonumber(ARGV[2 + 2 * i])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    if tokens < cost then
+        retry_after = math.max(retry_after, (cost - tokens) / rate)
+    end
+    refilled[i] = tokens
+end
+if retry_after > 0 then
+    return {0, tostring(retry_after)}
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[1 + 2 * i])
+    local rate = tonumber(ARGV[2 + 2 * i])
+    redis.call('HSET', key, 'tokens', tostring(refilled[i] - cost), 'ts', tostring(now))
+    redis.call('PEXPIRE', key, math.ceil(capacity / rate * 1000))
+end
+return {1, '0'}
+"""
+TOKEN_BUCKET_SHA = hashlib.sha1(TOKEN_BUCKET_SCRIPT.encode()).hexdigest()
+
+
+class RedisBackend:
+    """Buckets shared through Redis.
+
+    Each request is a single EVALSHA round trip. The clock is the calling
+    worker's wall clock, so hosts sharing a Redis should run NTP.
+    """
+
+    def __init__(self, url=None, prefix='rl:', timeout=None):
+        url = url or os.getenv('RATE_LIMIT_REDIS_URL', 'redis://localhost:6379/0')
+        timeout = timeout if timeout is not None else float(os.getenv('RATE_LIMIT_REDIS_TIMEOUT', 0.5))
+        self.client = RedisClient(url, timeout)
+        self.prefix = prefix
+
+    def _eval(self, keys, args):
+        try:
+            return self.client.execute('EVALSHA', TOKEN_BUCKET_SHA, len(keys), *keys, *args)
+        except RedisError as e:
+            if not str(e).startswith('NOSCRIPT'):
+                raise
+            return self.client.execute('EVAL', TOKEN_BUCKET_SCRIPT, len(keys), *keys, *args)
+
+    def take(self, keys, limits, cost=1):
+        args = [repr(time.time()), cost]
+        for capacity, rate in limits:
+            args += [repr(capacity), repr(rate)]
+        allowed, retry_after = self._eval([self.prefix + key for key in keys], args)
+        return bool(int(allowed)), float(retry_after)
+
+
+class RateLimiter:
+    def __init__(self, backend=None, enabled=None, fail_open=None):
+        if enabled is None:
+            enabled = env_bool('RATE_LIMIT_ENABLED', True)
+        if fail_open is None:
+            fail_open = env_bool('RATE_LIMIT_FAIL_OPEN', True)
+        if backend is None:
+            backend = RedisBackend() if os.getenv('RATE_LIMIT_BACKEND', 'memory') == 'redis' else MemoryBackend()
+        self.enabled = enabled
+        self.fail_open = fail_open
+        self.backend = backend
+        self._backend_down = False
+
+    def limits_for(self, endpoint):
+        limits = {}
+        for kind, default in DEFAULT_LIMITS.get(endpoint, {}).items():
+            limit = parse_limit(os.getenv(f"RATE_LIMIT_{endpoint.upper()}_{kind.upper()}", default))
+            if limit is not None:
+                limits[kind] = limit
+        return limits
+
+    @staticmethod
+    def bucket_key(endpoint, kind, value):
+        # Emails are hashed so they never end up in the backend in clear text
+        digest = hashlib.sha256(str(value).strip().lower().encode()).hexdigest()[:32]
+        return f"{endpoint}:{kind}:{digest}"
+
+    def check(self, endpoint, values, limits=None):
+        """Take a token for each of ``values`` (``{kind: value}``) or raise ``RateLimited``."""
+        if not self.enabled:
+            return
+        limits = limits if limits is not None else self.limits_for(endpoint)
+        kinds = [kind for kind in limits if values.get(kind)]
+        if not kinds:
+            return
+
+        keys = [self.bucket_key(endpoint, kind, values[kind]) for kind in kinds]
+        try:
+            allowed, retry_after = self.backend.take(keys, [limits[kind] for kind in kinds])
+        except (OSError, ConnectionError, RedisError) as e:
+            if not self._backend_down:
+                logger.warning("Rate limit backend unavailable: %s", e)
+                self._backend_down = True
+            if self.fail_open:
+                return
+            raise RateLimited(1)
+        if self._backend_down:
+            logger.info("Rate limit backend recovered")
+            self._backend_down = False
+
+        if not allowed:
+            RATE_LIMITED.inc(endpoint)
+            raise RateLimited(max(1, math.ceil(retry_after)))
+
+    def limit(self, endpoint):
+        """Decorator applying ``endpoint``'s limits before the view runs."""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.enabled:
+                    data = request.get_json(silent=True)
+                    data = data if isinstance(data, dict) else {}
+                    self.check(endpoint, {
+                        'ip': request.remote_addr,
+                        'email': data.get('email'),
+                        'entity': data.get('entity'),
+                    })
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
+
+
+# Shared instance used by the routes
+limiter = RateLimiter()
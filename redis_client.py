@@ -0,0 +1,94 @@
+"""Minimal client for the Redis protocol (RESP2).
+
+The rate limiter and the lookup cache only need a handful of commands, so this
+avoids a dependency on redis-py. Anything speaking the protocol works as the
+server, including ``benchmarks.fake_redis``.
+"""
+import os
+import socket
+import threading
+from urllib.parse import urlparse
+
+
+class RedisError(Exception):
+    """Error reply from the server."""
+
+
+class RedisConnection:
+    def __init__(self, host, port, db=0, password=None, timeout=0.5):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.file = self.sock.makefile('rb')
+        if password:
+            self.execute('AUTH', password)
+        if db:
+            self.execute('SELECT', db)
+
+    def execute(self, *args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self.sock.sendall(b''.join(parts))
+        return self._read()
+
+    def _read(self):
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode()
+        if kind == b'-':
+            raise RedisError(payload.decode())
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self.file.read(length + 2)[:-2]
+            return data.decode()
+        if kind == b'*':
+            length = int(payload)
+            return None if length < 0 else [self._read() for _ in range(length)]
+        raise RedisError(f"Unexpected reply: {line!r}")
+
+    def close(self):
+        try:
+            self.file.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisClient:
+    """Thread-safe client holding one connection per thread and per process."""
+
+    def __init__(self, url, timeout=0.5):
+        parsed = urlparse(url)
+        self.url = url
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.password = parsed.password
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        # Connections never survive a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._local.conn = RedisConnection(self.host, self.port, self.db, self.password, self.timeout)
+            self._local.pid = os.getpid()
+        return conn
+
+    def execute(self, *args):
+        try:
+            return self._connection().execute(*args)
+        except (OSError, ConnectionError):
+            # Drop the broken connection; the next call reconnects
+            conn = getattr(self._local, 'conn', None)
+            if conn is not None:
+                conn.close()
+            self._local.conn = None
+            raise
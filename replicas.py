@@ -0,0 +1,208 @@
+"""Read-replica routing.
+
+Replicas are listed in ``DB_REPLICA_URLS`` (comma separated) and become the
+Flask-SQLAlchemy binds ``replica_0``, ``replica_1``, ... Writes and, by
+default, reads go to the primary database. Read-only lookups opt in::
+
+    with replica_reads(user_cache_key(user_id)) as replica:
+        row = get_profile_row(user_id)
+
+Inside the block the session's SELECTs go to a replica in rotation; ``replica``
+is its bind key, or ``None`` when the reads stayed on the primary. They stay on
+the primary when:
+
+- no replica is in rotation;
+- the session has already written in this request, so it reads its own writes;
+- the block's key was pinned in the last ``DB_REPLICA_PIN_SECONDS``. Writers pin
+  the user they changed (``repository.invalidate_user_cache``), so that user's
+  next requests read the change back from the primary.
+
+A background prober per replica checks it is up and measures its replication
+lag with ``DB_REPLICA_LAG_QUERY`` (Postgres standbys are measured without it).
+A replica that is down or more than ``DB_REPLICA_MAX_LAG`` seconds behind
+leaves the rotation until it catches up. Pins are kept like the lookup cache:
+per process, or shared by every worker with ``LOOKUP_CACHE_BACKEND=redis``.
+
+A replica that is behind can miss rows the primary has, so callers re-read
+misses from the primary.
+"""
+import itertools
+import logging
+import os
+from contextlib import contextmanager
+from flask import current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+from cache import MISSING, MemoryCache, RedisCache
+from health import DBProber
+from metrics import DB_READ_ROUTES
+from redis_client import RedisError
+
+logger = logging.getLogger('replicas')
+
+REPLICA_BIND_PREFIX = 'replica_'
+
+# Seconds since the last replayed transaction; 0 when the standby has replayed
+# everything it received, NULL (0) on a primary
+POSTGRES_LAG_QUERY = (
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+def replica_uris():
+    return [uri.strip() for uri in os.getenv('DB_REPLICA_URLS', '').split(',') if uri.strip()]
+
+
+def replica_binds(engine_options):
+    """Build ``SQLALCHEMY_BINDS`` for the replicas, each with its own pool."""
+    return {f"{REPLICA_BIND_PREFIX}{i}": dict(engine_options(uri), url=uri)
+            for i, uri in enumerate(replica_uris())}
+
+
+class ReplicaProber(DBProber):
+    def __init__(self, bind_key, max_lag, lag_query=None, **kwargs):
+        super().__init__(bind_key=bind_key, **kwargs)
+        self.label = f"Replica {bind_key}"
+        self.max_lag = max_lag
+        self.lag_query = lag_query
+        # Seconds behind the primary; None when the lag can't be measured
+        self.lag = None
+        self._lagging = False
+
+    def _query(self):
+        with self.engine.connect() as conn:
+            query = self.lag_query
+            if query is None and self.engine.dialect.name == 'postgresql':
+                query = POSTGRES_LAG_QUERY
+            if query is None:
+                conn.execute(text("SELECT 1"))
+                return
+            lag = conn.execute(text(query)).scalar()
+            self.lag = float(lag or 0)
+
+    def _record(self, available, error, latency_ms):
+        super()._record(available, error, latency_ms)
+        lagging = self.is_lagging()
+        if lagging != self._lagging:
+            if lagging:
+                logger.warning("%s is %.1fs behind, out of rotation", self.label, self.lag)
+            else:
+                logger.info("%s caught up, back in rotation", self.label)
+            self._lagging = lagging
+
+    def is_lagging(self):
+        return self.lag is not None and self.lag > self.max_lag
+
+    def in_rotation(self):
+        return self.status() == "healthy" and not self.is_lagging()
+
+    def state(self):
+        return {
+            "status": self.status(),
+            "in_rotation": self.in_rotation(),
+            "lag_seconds": self.lag,
+            "latency_ms": self.latency_ms,
+            "error": self.error,
+        }
+
+
+class ReplicaRouter:
+    def __init__(self, max_lag=None, pin_seconds=None, lag_query=None):
+        self.max_lag = max_lag if max_lag is not None else float(os.getenv('DB_REPLICA_MAX_LAG', 5))
+        # Long enough for a replica within max_lag (checked every probe interval) to catch up
+        self.pin_seconds = pin_seconds if pin_seconds is not None else float(
+            os.getenv('DB_REPLICA_PIN_SECONDS', self.max_lag * 2))
+        self.lag_query = lag_query or os.getenv('DB_REPLICA_LAG_QUERY') or None
+        if os.getenv('LOOKUP_CACHE_BACKEND') == 'redis':
+            self._pins = RedisCache(ttl=self.pin_seconds, prefix='pin:')
+        else:
+            self._pins = MemoryCache(ttl=self.pin_seconds)
+        self._pins_down = False
+        self._next = itertools.count()
+        self.probers = []
+
+    def init_app(self, app, db):
+        binds = app.config.get('SQLALCHEMY_BINDS') or {}
+        self.probers = [ReplicaProber(key, self.max_lag, self.lag_query)
+                        for key in sorted(binds) if key.startswith(REPLICA_BIND_PREFIX)]
+        for prober in self.probers:
+            prober.init_app(app, db)
+
+    def _pin_call(self, method, *args):
+        try:
+            result = getattr(self._pins, method)(*args)
+        except (OSError, ConnectionError, RedisError) as e:
+            if not self._pins_down:
+                logger.warning("Replica pin store unavailable, reading from the primary: %s", e)
+                self._pins_down = True
+            return None
+        if self._pins_down:
+            logger.info("Replica pin store recovered")
+            self._pins_down = False
+        return result
+
+    def pin(self, key):
+        """Keep reads for ``key`` on the primary for ``pin_seconds``."""
+        if self.probers:
+            self._pin_call('set', key, True)
+
+    def is_pinned(self, key):
+        # Unknown (pin store down) counts as pinned: the primary is always current
+        return self._pin_call('get', key) is not MISSING
+
+    def choose(self):
+        candidates = [prober for prober in self.probers if prober.in_rotation()]
+        if not candidates:
+            return None
+        return candidates[next(self._next) % len(candidates)].bind_key
+
+    def route(self, session, key=None):
+        """Return the replica bind key for reads in ``session``, or None for the primary."""
+        if not self.probers:
+            return None
+        bind_key = None
+        if not session.info.get('wrote') and (key is None or not self.is_pinned(key)):
+            # One replica per session, so a request never sees data go back in time
+            bind_key = session.info.get('replica_choice')
+            if bind_key is None or not self._prober(bind_key).in_rotation():
+                bind_key = session.info['replica_choice'] = self.choose()
+        DB_READ_ROUTES.inc(bind_key or 'primary')
+        return bind_key
+
+    def _prober(self, bind_key):
+        return next(prober for prober in self.probers if prober.bind_key == bind_key)
+
+    def status(self):
+        return {prober.bind_key: prober.state() for prober in self.probers}
+
+
+class RoutingSession(Session):
+    """Session that sends SELECTs inside ``replica_reads`` blocks to a replica."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or getattr(clause, 'is_dml', False):
+                # Later reads in this session must see the write
+                self.info['wrote'] = True
+            elif (self.info.get('replica') is not None and not self.info.get('wrote')
+                  and getattr(clause, 'is_select', False)):
+                return self._db.engines[self.info['replica']]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@contextmanager
+def replica_reads(key=None):
+    """Send the session's SELECTs to a replica inside the block; yields its bind key or None."""
+    session = current_app.extensions['sqlalchemy'].session()
+    bind_key = replica_router.route(session, key)
+    previous = session.info.get('replica')
+    session.info['replica'] = bind_key
+    try:
+        yield bind_key
+    finally:
+        session.info['replica'] = previous
+
+
+# Shared router; replicas are set up by create_app
+replica_router = ReplicaRouter()
@@ -0,0 +1,141 @@
+"""Query helpers for users and their profiles.
+
+The profile endpoints need a user and its profile together; these helpers load
+both in a single statement instead of one round trip per table. The ``cached_*``
+helpers read through ``cache.lookup_cache`` and load misses from a read replica
+when one is configured; writers call ``invalidate_user_cache`` after committing.
+"""
+from flask import current_app
+from sqlalchemy import select, func
+from sqlalchemy.orm import contains_eager
+from cache import lookup_cache
+from database import db
+from http_cache import profile_etag
+from media import thumbnail_urls
+from models import User, Profile
+from replicas import replica_reads, replica_router
+
+# Columns returned by the profile endpoints, in response order
+PROFILE_COLUMNS = (
+    User.email,
+    Profile.firstname,
+    Profile.lastname,
+    Profile.bio,
+    Profile.profile_picture,
+    User.entity,
+)
+
+# Columns the profile ETag is derived from (see http_cache.profile_etag)
+PROFILE_VERSION_COLUMNS = (
+    Profile.updated_at.label('profile_updated_at'),
+    User.updated_at.label('user_updated_at'),
+)
+
+
+def email_matches(email):
+    # Case-insensitive comparison served by the lower(email) index
+    return func.lower(User.email) == email.lower()
+
+
+def find_user_by_email(email, refresh=False):
+    statement = select(User).where(email_matches(email))
+    if refresh:
+        # Overwrite an instance already loaded (e.g. from a replica) with the current row
+        statement = statement.execution_options(populate_existing=True)
+    return db.session.execute(statement).scalars().first()
+
+
+def profile_row_query(user_id):
+    return (
+        select(Profile.id.label('profile_id'), *PROFILE_COLUMNS, *PROFILE_VERSION_COLUMNS)
+        .select_from(User)
+        .outerjoin(Profile, Profile.user_id == User.id)
+        .where(User.id == user_id)
+    )
+
+
+def profile_version_query(user_id):
+    return (
+        select(Profile.id.label('profile_id'), *PROFILE_VERSION_COLUMNS)
+        .select_from(User)
+        .outerjoin(Profile, Profile.user_id == User.id)
+        .where(User.id == user_id)
+    )
+
+
+def user_with_profile_query(user_id):
+    return (
+        select(User)
+        .outerjoin(User.profile)
+        .options(contains_eager(User.profile))
+        .where(User.id == user_id)
+    )
+
+
+def get_profile_row(user_id):
+    """Return a lightweight row with the profile columns for ``user_id``.
+
+    Returns ``None`` when the user does not exist. When the user exists but has
+    no profile, ``row.profile_id`` is ``None``.
+    """
+    return db.session.execute(profile_row_query(user_id)).first()
+
+
+def serialize_profile(row):
+    return {
+        "email": row.email,
+        "firstname": row.firstname,
+        "lastname": row.lastname,
+        "bio": row.bio,
+        "profile_picture": row.profile_picture,
+        "profile_picture_thumbnails": thumbnail_urls(row.profile_picture),
+        "entity": row.entity,
+    }
+
+
+def get_user_with_profile(user_id):
+    """Return the ``User`` for ``user_id`` with ``user.profile`` already loaded."""
+    return db.session.execute(user_with_profile_query(user_id)).scalars().first()
+
+
+def user_cache_key(user_id):
+    return f"user:{user_id}"
+
+
+def profile_cache_key(user_id):
+    return f"profile:{user_id}"
+
+
+def cached_user_exists(user_id):
+    def load():
+        return db.session.execute(select(User.id).where(User.id == user_id)).first() is not None
+    return lookup_cache.get_or_load(user_cache_key(user_id), load)
+
+
+def cached_profile(user_id):
+    """Return ``GET /profile``'s body and ETag for ``user_id``, cached.
+
+    The value is ``None`` when the user does not exist, otherwise a dict with
+    ``body`` (the encoded JSON, ``None`` when the user has no profile) and
+    ``etag``. Hits are served without serializing anything. The value may be
+    shared with other requests and must not be modified.
+    """
+    def load():
+        with replica_reads(user_cache_key(user_id)) as replica:
+            row = get_profile_row(user_id)
+        if row is None and replica is not None:
+            # A new user may not have reached the replica yet
+            row = get_profile_row(user_id)
+        if row is None:
+            return None
+        return {
+            "body": current_app.json.dumps(serialize_profile(row)) if row.profile_id is not None else None,
+            "etag": profile_etag(user_id, row.profile_updated_at, row.user_updated_at),
+        }
+    return lookup_cache.get_or_load(profile_cache_key(user_id), load)
+
+
+def invalidate_user_cache(user_id):
+    lookup_cache.invalidate(user_cache_key(user_id), profile_cache_key(user_id))
+    # Read the change back from the primary until the replicas have it
+    replica_router.pin(user_cache_key(user_id))
@@ -0,0 +1,181 @@
+"""In-process set of revoked access tokens, synchronized across workers.
+
+Access tokens are short-lived JWTs (``tokens.ACCESS_TOKEN_TTL``), so a
+revocation only has to be remembered until the tokens it covers expire. Two
+kinds are kept:
+
+- a ``jti``: one access token (logout, a refresh token family ended);
+- a user cutoff: every access token issued to the user before a time
+  (password change or reset).
+
+``is_revoked`` is two dict lookups on the verified claims, with no locking and
+no allocation, so it runs on every authenticated request. Entries are grouped
+in buckets by expiry and dropped a bucket at a time once they expire.
+
+The ``revoked_tokens`` table is the source of truth. A revocation is applied
+to the current process at once and written to the table in the caller's
+transaction. Each worker polls the table every ``REVOCATION_SYNC_INTERVAL``
+seconds for rows created since its last poll, minus ``REVOCATION_SYNC_MARGIN``
+seconds to cover transactions that commit late and clock skew.
+"""
+import datetime
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger('revocation')
+
+
+def _timestamp(value):
+    # Naive UTC datetimes (as stored by the models) to epoch seconds
+    return value.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+class RevocationSet:
+    def __init__(self, interval=None, margin=None, bucket_seconds=60, prune_every=300):
+        self.interval = interval if interval is not None else float(os.getenv('REVOCATION_SYNC_INTERVAL', 1))
+        self.margin = margin if margin is not None else float(os.getenv('REVOCATION_SYNC_MARGIN', 5))
+        self.bucket_seconds = bucket_seconds
+        self.prune_every = prune_every
+
+        self._jtis = {}  # jti -> expires_at
+        self._users = {}  # user_id -> tokens issued before this time are revoked
+        self._buckets = {}  # expiry bucket -> [(kind, key, value)]
+        self._lock = threading.Lock()
+
+        self._start_lock = threading.Lock()
+        self._app = None
+        self._db = None
+        self._engine = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._synced_at = None
+        self._pruned_at = time.time()
+        self._sync_failing = False
+
+    def init_app(self, app, db):
+        self._app = app
+        self._db = db
+
+        @app.before_request
+        def start_revocation_sync():
+            self.ensure_started()
+
+    def init_engine(self, engine):
+        """Sync through ``engine`` instead of a Flask app (asgi.py); call ``ensure_started`` to start."""
+        self._engine = engine
+
+    def is_revoked(self, claims):
+        if claims['jti'] in self._jtis:
+            return True
+        issued_before = self._users.get(claims['user_id'])
+        return issued_before is not None and claims['iat'] < issued_before
+
+    def add_jti(self, jti, expires_at):
+        with self._lock:
+            # Polls overlap, so the same row is seen more than once
+            if self._jtis.get(jti) == expires_at:
+                return
+            self._jtis[jti] = expires_at
+            self._bucket(expires_at).append(('jti', jti, expires_at))
+
+    def add_user(self, user_id, issued_before, expires_at):
+        with self._lock:
+            # The latest cutoff covers the earlier ones
+            if issued_before <= self._users.get(user_id, 0):
+                return
+            self._users[user_id] = issued_before
+            self._bucket(expires_at).append(('user', user_id, issued_before))
+
+    def _bucket(self, expires_at):
+        return self._buckets.setdefault(int(expires_at // self.bucket_seconds) + 1, [])
+
+    def expire(self, now=None):
+        """Drop the buckets whose entries have all expired."""
+        current = int((now or time.time()) // self.bucket_seconds)
+        with self._lock:
+            for index in [index for index in self._buckets if index <= current]:
+                for kind, key, value in self._buckets.pop(index):
+                    entries = self._jtis if kind == 'jti' else self._users
+                    # A later revocation of the same key lives in a later bucket
+                    if entries.get(key) == value:
+                        del entries[key]
+
+    def __len__(self):
+        return len(self._jtis) + len(self._users)
+
+    def clear(self):
+        with self._lock:
+            self._jtis.clear()
+            self._users.clear()
+            self._buckets.clear()
+
+    def ensure_started(self):
+        # The first sync runs before the worker's first request is served, then
+        # a thread keeps polling; per process so forked workers get their own
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._synced_at = None
+            self.sync()
+            self._stop.clear()
+            threading.Thread(target=self._run, name='revocation-sync', daemon=True).start()
+            self._pid = os.getpid()
+
+    def stop(self):
+        self._stop.set()
+
+    @contextmanager
+    def _session(self):
+        if self._engine is not None:
+            with Session(self._engine) as session:
+                yield session
+        else:
+            with self._app.app_context():
+                yield self._db.session
+
+    def sync(self):
+        from models import RefreshToken, RevokedToken
+
+        started = time.time()
+        now = datetime.datetime.utcfromtimestamp(started)
+        query = select(RevokedToken).where(RevokedToken.expires_at > now)
+        if self._synced_at is not None:
+            since = datetime.datetime.utcfromtimestamp(self._synced_at - self.margin)
+            query = query.where(RevokedToken.created_at >= since)
+        try:
+            with self._session() as session:
+                for row in session.execute(query).scalars():
+                    if row.jti is not None:
+                        self.add_jti(row.jti, _timestamp(row.expires_at))
+                    else:
+                        self.add_user(row.user_id, _timestamp(row.issued_before), _timestamp(row.expires_at))
+                # Housekeeping: expired revocations and refresh tokens are no longer needed
+                if started - self._pruned_at > self.prune_every:
+                    session.execute(delete(RevokedToken).where(RevokedToken.expires_at < now))
+                    session.execute(delete(RefreshToken).where(RefreshToken.expires_at < now))
+                    session.commit()
+                    self._pruned_at = started
+        except Exception as e:
+            if not self._sync_failing:
+                logger.warning("Token revocation sync failed: %s", e)
+                self._sync_failing = True
+            return
+        if self._sync_failing:
+            logger.info("Token revocation sync recovered")
+            self._sync_failing = False
+        self._synced_at = started
+        self.expire(started)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sync()
+
+
+revocations = RevocationSet()
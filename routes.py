@@ -1,17 +1,43 @@
-from flask import Blueprint, request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Blueprint, current_app, request, jsonify, g
 from database import db
+from hashing import hasher, HashingOverloaded
+from password_policy import schedule_rehash
+from auth import (decode_token, require_auth, invalidate_user_tokens, mint_reset_token, new_reset_token_claims,
+                  reset_token_digest)
+from query_profiler import query_budget
+from rate_limit import limiter, RateLimited
+from repository import cached_profile, get_user_with_profile, find_user_by_email, invalidate_user_cache
+from replicas import replica_reads
+from tokens import issue_tokens, rotate_refresh_token, revoke_session, revoke_user_tokens
+from outbox import enqueue, password_reset_payload, signup_payload, RESET_TOKEN_IN_RESPONSE
+from http_cache import profile_etag, cache_headers
+from logs import audit
+from media import storage, thumbnails, thumbnail_urls, UnsupportedImage, UploadTooLarge, MEDIA_URL_PREFIX
+from metrics import MEDIA_UPLOADS
 from models import User, Profile  # Import Profile model
 import jwt
 import datetime
-import os  # Add this import to access environment variables
-
-# Secret key for JWT encoding/decoding
-SECRET_KEY = "your_secret_key"
 
 routes = Blueprint('routes', __name__)
 
+# App-wide: bulk import hashes through the same pool
+@routes.app_errorhandler(HashingOverloaded)
+def hashing_overloaded(e):
+    response = jsonify({"error": "Server is busy, please retry shortly"})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+@routes.errorhandler(RateLimited)
+def rate_limited(e):
+    response = jsonify({"error": "Too many requests, please retry later"})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
 @routes.route('/signup', methods=['POST'])
+@query_budget(4)
+@limiter.limit('signup')
 def signup():
     data = request.get_json()
     required_fields = ['firstname', 'lastname', 'email', 'password', 'entity']
@@ -20,10 +46,10 @@ def signup():
             return jsonify({'error': f'Missing required field: {field}'}), 400
 
     # Check if user already exists
-    if User.query.filter_by(email=data['email']).first():
+    if find_user_by_email(data['email']):
         return jsonify({'error': 'Email already registered'}), 409
 
-    hashed_password = generate_password_hash(data['password'])
+    hashed_password = hasher.generate(data['password'])
 
     # Create User and Profile entries
     user = User(
@@ -42,11 +68,18 @@ def signup():
         profile_picture=data.get('profile_picture')
     )
     db.session.add(profile)
+
+    # Post-signup hooks run in the outbox worker; the job commits with the user
+    enqueue('user_signed_up', signup_payload(user, profile))
+    # Read before the commit expires it, which would reload the row: 4 statements in all
+    user_id = user.id
     db.session.commit()
 
-    return jsonify({'message': 'User registered successfully', 'user_id': user.id}), 201
+    return jsonify({'message': 'User registered successfully', 'user_id': user_id}), 201
 
 @routes.route('/signin', methods=['POST'])
+@query_budget(3)
+@limiter.limit('signin')
 def signin():
     data = request.get_json()
 
@@ -54,148 +87,191 @@ def signin():
     if not data or not data.get('email') or not data.get('password'):
         return jsonify({"error": "Email and password are required"}), 400
 
-    # Fetch user from the database
-    user = User.query.filter_by(email=data['email']).first()
+    # Always from the primary: a replica behind a password change or reset would
+    # still accept the old password
+    user = find_user_by_email(data['email'])
+    password_ok = user is not None and hasher.check(user.password_hash, data['password'])
 
-    if not user or not check_password_hash(user.password_hash, data['password']):
+    if not password_ok:
+        audit('signin_failed', email=data['email'], user_id=user.id if user else None)
         return jsonify({"error": "Invalid email or password"}), 401
 
-    # Generate JWT token
-    token = jwt.encode({
-        'user_id': user.id,
-        'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)
-    }, SECRET_KEY, algorithm='HS256')
+    # Upgrade a hash made with outdated parameters in the background
+    schedule_rehash(current_app._get_current_object(), user.id, user.password_hash, data['password'])
 
-    return jsonify({"message": "Login successful", "token": token})
+    # Start a session: a short-lived access token and a refresh token
+    tokens = issue_tokens(user.id)
+    db.session.commit()
+    audit('signin', user_id=user.id)
 
-@routes.route('/profile', methods=['GET'])
-def get_profile():
-    auth_header = request.headers.get('Authorization')
-    
-    print(auth_header)
+    return jsonify({"message": "Login successful", **tokens})
 
-    if not auth_header or not auth_header.startswith('Bearer '):
-        return jsonify({"error": "Bearer token is missing or invalid"}), 401
+@routes.route('/token/refresh', methods=['POST'])
+@query_budget(3)
+def refresh_token():
+    data = request.get_json()
+    if not data or not data.get('refresh_token'):
+        return jsonify({"error": "refresh_token is required"}), 400
 
-    token = auth_header.split(' ')[1]  # Extract the token part
+    rotated = rotate_refresh_token(data['refresh_token'])
+    # Also commits the session being ended when a used token comes back
+    db.session.commit()
+    if rotated is None:
+        return jsonify({"error": "Invalid or expired refresh token"}), 401
+
+    _, tokens = rotated
+    return jsonify({"message": "Token refreshed", **tokens})
+
+@routes.route('/logout', methods=['POST'])
+@query_budget(4)
+@require_auth
+def logout():
+    # Ends the session: its refresh token and current access token stop working
+    revoke_session(g.token_claims['sid'])
+    db.session.commit()
+    audit('logout', user_id=g.user_id)
 
-    try:
-        # Decode the JWT token
-        decoded_token = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-        user_id = decoded_token['user_id']
+    return jsonify({"message": "Logged out successfully"})
 
-        # Fetch user and profile details from the database
-        user = User.query.get(user_id)
-        if not user:
-            return jsonify({"error": "User not found"}), 404
-
-        profile = Profile.query.filter_by(user_id=user_id).first()
-        if not profile:
-            return jsonify({"error": "Profile not found"}), 404
-
-        # Return user profile details
-        return jsonify({
-            "email": user.email,
-            "firstname": profile.firstname,
-            "lastname": profile.lastname,
-            "bio": profile.bio,
-            "profile_picture": profile.profile_picture,
-            "entity": user.entity
-        })
+@routes.route('/profile', methods=['GET'])
+@query_budget(3)
+@require_auth
+def get_profile():
+    # Served from the lookup cache; a miss loads user and profile in one query
+    entry = cached_profile(g.user_id)
+    if not entry:
+        return jsonify({"error": "User not found"}), 404
 
-    except jwt.ExpiredSignatureError:
-        return jsonify({"error": "Token has expired"}), 401
-    except jwt.InvalidTokenError:
-        return jsonify({"error": "Invalid token"}), 401
+    if entry["body"] is None:
+        return jsonify({"error": "Profile not found"}), 404
+
+    # The client's copy is current: skip the body
+    if request.if_none_match.contains_weak(entry["etag"]):
+        return '', 304, cache_headers(entry["etag"])
+
+    # Return user profile details, already encoded
+    response = current_app.response_class(entry["body"], mimetype=current_app.json.mimetype)
+    return response, 200, cache_headers(entry["etag"])
 
 @routes.route('/profile', methods=['PUT'])
+@query_budget(3)
+@require_auth
 def update_profile():
-    auth_header = request.headers.get('Authorization')
-
-    if not auth_header or not auth_header.startswith('Bearer '):
-        return jsonify({"error": "Bearer token is missing or invalid"}), 401
+    # Fetch user and profile details from the database in one query
+    user = get_user_with_profile(g.user_id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
 
-    token = auth_header.split(' ')[1]  # Extract the token part
+    profile = user.profile
+    if not profile:
+        return jsonify({"error": "Profile not found"}), 404
 
-    try:
-        # Decode the JWT token
-        decoded_token = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-        user_id = decoded_token['user_id']
+    # Get the updated data from the request
+    data = request.get_json()
 
-        # Fetch user and profile details from the database
-        user = User.query.get(user_id)
-        if not user:
-            return jsonify({"error": "User not found"}), 404
+    # Update profile fields
+    profile.firstname = data.get('firstname', profile.firstname)
+    profile.lastname = data.get('lastname', profile.lastname)
+    profile.bio = data.get('bio', profile.bio)
+    profile.profile_picture = data.get('profile_picture', profile.profile_picture)
 
-        profile = Profile.query.filter_by(user_id=user_id).first()
-        if not profile:
-            return jsonify({"error": "Profile not found"}), 404
+    # Bump updated_at on every update so cached copies (ETags) are invalidated
+    profile.updated_at = datetime.datetime.utcnow()
+    etag = profile_etag(user.id, profile.updated_at, user.updated_at)
 
-        # Get the updated data from the request
-        data = request.get_json()
+    # Commit changes to the database
+    db.session.commit()
+    invalidate_user_cache(g.user_id)
 
-        # Update profile fields
-        profile.firstname = data.get('firstname', profile.firstname)
-        profile.lastname = data.get('lastname', profile.lastname)
-        profile.bio = data.get('bio', profile.bio)
-        profile.profile_picture = data.get('profile_picture', profile.profile_picture)
+    return jsonify({"message": "Profile updated successfully"}), 200, {'ETag': f'"{etag}"'}
 
-        # Commit changes to the database
-        db.session.commit()
+@routes.route('/profile/picture', methods=['PUT'])
+# Cold token: the user lookup, then (after the session is closed) user and profile, and the UPDATE
+@query_budget(3)
+@require_auth
+def upload_profile_picture():
+    too_large = {"error": f"Profile pictures are limited to {storage.max_bytes} bytes"}
+    if request.content_length is not None and request.content_length > storage.max_bytes:
+        MEDIA_UPLOADS.inc('too_large')
+        return jsonify(too_large), 413
 
-        return jsonify({"message": "Profile updated successfully"})
+    # A slow client can take a long time to send the image: give back the connection
+    # require_auth's user lookup may hold, and only check one out once the body is stored
+    db.session.close()
 
-    except jwt.ExpiredSignatureError:
-        return jsonify({"error": "Token has expired"}), 401
-    except jwt.InvalidTokenError:
-        return jsonify({"error": "Invalid token"}), 401
-
-@routes.route('/change-password', methods=['PUT'])
-def change_password():
-    auth_header = request.headers.get('Authorization')
+    # The image body is read from the socket a chunk at a time (request.data would hold it all)
+    try:
+        stored = storage.save(request.stream)
+    except UploadTooLarge:
+        return jsonify(too_large), 413
+    except UnsupportedImage:
+        return jsonify({"error": "Profile pictures must be JPEG, PNG, GIF or WebP images"}), 415
 
-    if not auth_header or not auth_header.startswith('Bearer '):
-        return jsonify({"error": "Bearer token is missing or invalid"}), 401
+    user = get_user_with_profile(g.user_id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+    profile = user.profile
+    if not profile:
+        return jsonify({"error": "Profile not found"}), 404
+
+    url = f"{MEDIA_URL_PREFIX}{stored.key}"
+    profile.profile_picture = url
+    # Bump updated_at so cached copies (ETags) are invalidated
+    profile.updated_at = datetime.datetime.utcnow()
+    db.session.commit()
+    invalidate_user_cache(g.user_id)
 
-    token = auth_header.split(' ')[1]  # Extract the token part
+    # Thumbnails are made on the media pool after the response
+    thumbnails.schedule(stored.key)
 
-    try:
-        # Decode the JWT token
-        decoded_token = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-        user_id = decoded_token['user_id']
-
-        # Fetch user from the database
-        user = User.query.get(user_id)
-        if not user:
-            return jsonify({"error": "User not found"}), 404
+    return jsonify({
+        "message": "Profile picture uploaded successfully",
+        "profile_picture": url,
+        "profile_picture_thumbnails": thumbnail_urls(url),
+        "size": stored.size,
+        "deduplicated": stored.deduplicated,
+    }), 201
 
-        # Get the updated password data from the request
-        data = request.get_json()
-        old_password = data.get('old_password')
-        new_password = data.get('new_password')
-        confirm_password = data.get('confirm_password')
+@routes.route('/change-password', methods=['PUT'])
+# Cold token: user lookup, user, hash UPDATE, refresh_tokens UPDATE, revoked_tokens INSERT
+@query_budget(5)
+@require_auth
+def change_password():
+    # Fetch user from the database
+    user = db.session.get(User, g.user_id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
 
-        if not old_password or not new_password or not confirm_password:
-            return jsonify({"error": "old_password, new_password, and confirm_password are required"}), 400
+    # Get the updated password data from the request
+    data = request.get_json()
+    old_password = data.get('old_password')
+    new_password = data.get('new_password')
+    confirm_password = data.get('confirm_password')
 
-        if not check_password_hash(user.password_hash, old_password):
-            return jsonify({"error": "Old password is incorrect"}), 400
+    if not old_password or not new_password or not confirm_password:
+        return jsonify({"error": "old_password, new_password, and confirm_password are required"}), 400
 
-        if new_password != confirm_password:
-            return jsonify({"error": "Passwords do not match"}), 400
+    if not hasher.check(user.password_hash, old_password):
+        audit('password_change_failed', user_id=g.user_id)
+        return jsonify({"error": "Old password is incorrect"}), 400
 
-        # Update the user's password
-        user.password_hash = generate_password_hash(new_password)
-        db.session.commit()
+    if new_password != confirm_password:
+        return jsonify({"error": "Passwords do not match"}), 400
 
-        return jsonify({"message": "Password changed successfully"})
+    # Update the user's password
+    user.password_hash = hasher.generate(new_password)
+    # Sign out every session, including this one
+    revoke_user_tokens(g.user_id)
+    db.session.commit()
+    audit('password_changed', user_id=g.user_id)
+    invalidate_user_tokens(g.user_id)
+    invalidate_user_cache(g.user_id)
 
-    except jwt.ExpiredSignatureError:
-        return jsonify({"error": "Token has expired"}), 401
-    except jwt.InvalidTokenError:
-        return jsonify({"error": "Invalid token"}), 401
+    return jsonify({"message": "Password changed successfully"})
 
 @routes.route('/forgot-password', methods=['POST'])
+@query_budget(4)
+@limiter.limit('forgot_password')
 def forgot_password():
     data = request.get_json()
     email = data.get('email')
@@ -203,27 +279,34 @@ def forgot_password():
     if not email:
         return jsonify({"error": "Email is required"}), 400
 
-    # Check if user exists
-    user = User.query.filter_by(email=email).first()
+    # Check if user exists, on a read replica first
+    with replica_reads() as replica:
+        user = find_user_by_email(email)
+    if not user and replica is not None:
+        # A new signup may not have reached the replica yet
+        user = find_user_by_email(email)
     if not user:
         return jsonify({"error": "User with this email does not exist"}), 404
 
     # Generate a reset token
-    reset_token = jwt.encode({
-        'user_id': user.id,
-        'exp': datetime.datetime.utcnow() + datetime.timedelta(minutes=int(os.getenv('RESET_TOKEN_EXPIRATION_MINUTES', 5)))  # Default to 5 minutes if not set
-    }, SECRET_KEY, algorithm='HS256')
+    claims = new_reset_token_claims()  # Expires after RESET_TOKEN_EXPIRATION_MINUTES, default 5
+    reset_token = mint_reset_token(user.id, **claims)
+
+    # Store a digest of the token in the database for one-time use
+    user.reset_token_hash = reset_token_digest(reset_token)
 
-    # Store the token in the database for one-time use
-    user.reset_token = reset_token
+    # The email is sent by the outbox worker, which mints the token again; the job commits with the digest
+    enqueue('password_reset_email', password_reset_payload(user, claims))
     db.session.commit()
+    audit('password_reset_requested', user_id=user.id)
 
-    return jsonify({
-        "message": "Password token generated successfully",
-        "token": reset_token
-    })
+    response = {"message": "Password token generated successfully"}
+    if RESET_TOKEN_IN_RESPONSE:
+        response["token"] = reset_token
+    return jsonify(response)
 
 @routes.route('/reset-password', methods=['POST'])
+@query_budget(4)
 def reset_password():
     data = request.get_json()
     token = data.get('token')
@@ -238,18 +321,23 @@ def reset_password():
 
     try:
         # Decode the reset token
-        decoded_token = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+        decoded_token = decode_token(token)
         user_id = decoded_token['user_id']
 
-        # Fetch user from the database
-        user = User.query.get(user_id)
-        if not user or user.reset_token != token:
+        # Look the user up by the token digest (indexed)
+        user = User.query.filter_by(reset_token_hash=reset_token_digest(token)).first()
+        if not user or user.id != user_id:
+            audit('password_reset_failed', user_id=user_id, reason='token_not_current')
             return jsonify({"error": "Invalid or already used token"}), 401
 
         # Update the user's password
-        user.password_hash = generate_password_hash(new_password)
-        user.reset_token = None  # Invalidate the token after use
+        user.password_hash = hasher.generate(new_password)
+        user.reset_token_hash = None  # Invalidate the token after use
+        revoke_user_tokens(user_id)
         db.session.commit()
+        audit('password_reset', user_id=user_id)
+        invalidate_user_tokens(user_id)
+        invalidate_user_cache(user_id)
 
         return jsonify({"message": "Password reset successfully"})
 
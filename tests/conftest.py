@@ -0,0 +1,74 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Settings read at import time: cheap hashes, no throttling, no replicas
+os.environ.setdefault('PASSWORD_HASH_ALGORITHM', 'pbkdf2')
+os.environ.setdefault('PASSWORD_HASH_COST', '1000')
+os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ['DB_REPLICA_URLS'] = ''
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Build an app on a fresh SQLite file; ``config`` overrides settings."""
+    from api import create_app
+    from auth import token_cache
+    from cache import lookup_cache
+    from database import db
+
+    def make(config=None):
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'primary.db'}", **(config or {})})
+        with app.app_context():
+            db.create_all()
+        # Start the background probers and load the revocation set before the test counts anything
+        app.test_client().get('/health/live')
+        return app
+
+    # Caches outlive an app: ids restart at 1 in every test database
+    token_cache.clear()
+    if lookup_cache.backend is not None:
+        lookup_cache.backend.clear()
+    yield make
+    token_cache.clear()
+    if lookup_cache.backend is not None:
+        lookup_cache.backend.clear()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def create_user(app, email='member@example.com', password='password', entity='bit', **profile):
+    """Insert a user with a profile and return its id."""
+    from werkzeug.security import generate_password_hash
+    from database import db
+    from models import Profile, User
+
+    with app.app_context():
+        user = User(email=email, password_hash=generate_password_hash(password), entity=entity)
+        user.profile = Profile(firstname=profile.get('firstname', 'Ada'), lastname=profile.get('lastname', 'Lovelace'),
+                               bio=profile.get('bio'))
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def auth_headers(app, user_id):
+    """Bearer headers with an access token from a new session."""
+    from database import db
+    from tokens import issue_tokens
+
+    with app.app_context():
+        tokens = issue_tokens(user_id)
+        db.session.commit()
+    return {'Authorization': f"Bearer {tokens['token']}"}
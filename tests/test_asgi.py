@@ -0,0 +1,143 @@
+import asyncio
+import pytest
+from conftest import create_user
+from revocation import revocations
+
+
+@pytest.fixture
+def asgi_app(app, tmp_path, monkeypatch):
+    """The ASGI app on the database the Flask ``app`` fixture created."""
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'primary.db'}")
+    import asgi
+    yield asgi.app
+    revocations.init_engine(None)
+    revocations.clear()
+
+
+def run(asgi_app, scenario):
+    async def main():
+        async with asgi_app.test_app() as test_app:
+            await scenario(test_app.test_client())
+    asyncio.run(main())
+
+
+async def signin(client, password='password'):
+    response = await client.post('/signin', json={'email': 'member@example.com', 'password': password})
+    assert response.status_code == 200
+    return await response.get_json()
+
+
+def bearer(tokens):
+    return {'Authorization': f"Bearer {tokens['token']}"}
+
+
+def test_logout_revokes_the_access_and_refresh_tokens(app, asgi_app):
+    create_user(app)
+
+    async def scenario(client):
+        tokens = await signin(client)
+        assert tokens['refresh_token']
+        assert (await client.get('/profile', headers=bearer(tokens))).status_code == 200
+
+        assert (await client.post('/logout', headers=bearer(tokens))).status_code == 200
+        assert (await client.get('/profile', headers=bearer(tokens))).status_code == 401
+        response = await client.post('/token/refresh', json={'refresh_token': tokens['refresh_token']})
+        assert response.status_code == 401
+    run(asgi_app, scenario)
+
+
+def test_refresh_rotates_and_a_reused_refresh_token_ends_the_session(app, asgi_app):
+    create_user(app)
+
+    async def scenario(client):
+        tokens = await signin(client)
+        response = await client.post('/token/refresh', json={'refresh_token': tokens['refresh_token']})
+        assert response.status_code == 200
+        refreshed = await response.get_json()
+        assert (await client.get('/profile', headers=bearer(refreshed))).status_code == 200
+
+        response = await client.post('/token/refresh', json={'refresh_token': tokens['refresh_token']})
+        assert response.status_code == 401
+        assert (await client.get('/profile', headers=bearer(refreshed))).status_code == 401
+    run(asgi_app, scenario)
+
+
+def test_change_password_revokes_every_session(app, asgi_app):
+    create_user(app)
+
+    async def scenario(client):
+        tokens = await signin(client)
+        other = await signin(client)
+        response = await client.put('/change-password', headers=bearer(tokens), json={
+            'old_password': 'password', 'new_password': 'new password', 'confirm_password': 'new password'})
+        assert response.status_code == 200
+
+        for session in (tokens, other):
+            assert (await client.get('/profile', headers=bearer(session))).status_code == 401
+            response = await client.post('/token/refresh', json={'refresh_token': session['refresh_token']})
+            assert response.status_code == 401
+        assert (await client.get('/profile', headers=bearer(await signin(client, 'new password')))).status_code == 200
+    run(asgi_app, scenario)
+
+
+def test_reset_password_revokes_every_session_and_reset_tokens_are_not_access_tokens(app, asgi_app, monkeypatch):
+    monkeypatch.setattr('asgi.RESET_TOKEN_IN_RESPONSE', True)
+    create_user(app)
+
+    async def scenario(client):
+        tokens = await signin(client)
+        response = await client.post('/forgot-password', json={'email': 'member@example.com'})
+        reset_token = (await response.get_json())['token']
+        assert (await client.get('/profile', headers={'Authorization': f"Bearer {reset_token}"})).status_code == 401
+
+        response = await client.post('/reset-password', json={
+            'token': reset_token, 'new_password': 'new password', 'confirm_password': 'new password'})
+        assert response.status_code == 200
+        assert (await client.get('/profile', headers=bearer(tokens))).status_code == 401
+    run(asgi_app, scenario)
+
+
+def test_get_profile_revalidates_a_weakened_etag(app, asgi_app):
+    create_user(app)
+
+    async def scenario(client):
+        headers = bearer(await signin(client))
+        etag = (await client.get('/profile', headers=headers)).headers['ETag']
+        weak = etag if etag.startswith('W/') else f'W/{etag}'
+        response = await client.get('/profile', headers={**headers, 'If-None-Match': weak})
+        assert response.status_code == 304
+    run(asgi_app, scenario)
+
+
+def test_profile_picture_upload_and_media(app, asgi_app, monkeypatch, tmp_path):
+    import media
+    monkeypatch.setattr(media.storage, 'root', str(tmp_path / 'media'))
+    monkeypatch.setattr(media.thumbnails, 'schedule', lambda key: False)
+    create_user(app)
+    png = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+
+    async def scenario(client):
+        headers = {**bearer(await signin(client)), 'Content-Type': 'image/png'}
+        response = await client.put('/profile/picture', headers=headers, data=png)
+        assert response.status_code == 201
+        url = (await response.get_json())['profile_picture']
+        response = await client.get('/profile', headers=headers)
+        assert (await response.get_json())['profile_picture'] == url
+
+        response = await client.get(url)
+        assert response.status_code == 200
+        assert await response.get_data() == png
+        assert 'immutable' in response.headers['Cache-Control']
+        etag = response.headers['ETag']
+        assert (await client.get(url, headers={'If-None-Match': f'W/{etag}'})).status_code == 304
+
+        # No thumbnail yet: the original meanwhile
+        response = await client.get(url.replace('/media/', '/media/thumbs/64/'))
+        assert response.status_code == 302 and response.headers['Location'] == url
+
+        response = await client.put('/profile/picture', headers=headers, data=b'not an image at all')
+        assert response.status_code == 415
+        response = await client.put('/profile/picture', headers=headers, data=png + b'\x00' * media.storage.max_bytes)
+        assert response.status_code == 413
+        assert (await client.get('/media/' + '0' * 64 + '.png')).status_code == 404
+    run(asgi_app, scenario)
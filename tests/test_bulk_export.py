@@ -0,0 +1,20 @@
+from conftest import create_user
+
+
+def test_export_filename_is_sanitized(app, client, monkeypatch):
+    monkeypatch.setenv('BULK_EXPORT_API_KEY', 'key')
+    create_user(app, entity='bit')
+
+    response = client.get('/export-users', headers={'X-Export-Key': 'key'},
+                          query_string={'entity': 'bit', 'format': 'csv'})
+    assert response.status_code == 200
+    assert response.headers['Content-Disposition'] == 'attachment; filename="users-bit.csv"'
+    assert 'member@example.com' in response.get_data(as_text=True)
+
+    response = client.get('/export-users', headers={'X-Export-Key': 'key'},
+                          query_string={'entity': 'x"; filename=../../evil.sh\r\nSet-Cookie: a=b'})
+    assert response.status_code == 200
+    filename = response.headers['Content-Disposition'].removeprefix('attachment; filename="').removesuffix('"')
+    assert filename.startswith('users-x') and filename.endswith('.ndjson')
+    assert not set(filename) & set('"/\\;=: \r\n')
+    assert 'Set-Cookie' not in response.headers
@@ -0,0 +1,67 @@
+import json
+import pytest
+from hashing import HashingOverloaded, hasher
+
+
+@pytest.fixture
+def import_key(monkeypatch):
+    monkeypatch.setenv('BULK_IMPORT_API_KEY', 'import-key')
+    return {'X-Import-Key': 'import-key'}
+
+
+def ndjson(*rows):
+    return '\n'.join(row if isinstance(row, str) else json.dumps(row) for row in rows)
+
+
+def user(email, **fields):
+    return {"firstname": "Ada", "lastname": "Lovelace", "email": email, "password": "password",
+            "entity": "bit", **fields}
+
+
+def test_bad_rows_are_reported_and_the_rest_imported(client, import_key):
+    body = ndjson(
+        user('ok-1@example.com'),
+        user(12345),
+        user('list-name@example.com', lastname=['Love', 'lace']),
+        user('bio@example.com', bio={"text": "nested"}),
+        '{not json',
+        '[1, 2]',
+        user('ok-2@example.com', bio='Hello'),
+    )
+    response = client.post('/import-users', data=body, headers=import_key, content_type='application/x-ndjson')
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result['created'] == 2
+    assert [(error['line'], error['email']) for error in result['errors']] == [
+        (2, None), (3, 'list-name@example.com'), (4, 'bio@example.com'), (5, None), (6, None),
+    ]
+    assert result['errors'][0]['error'] == 'Invalid field: email must be a string'
+
+
+def test_hashing_overload_is_a_503(client, import_key, monkeypatch):
+    def overloaded(passwords):
+        raise HashingOverloaded(retry_after=7)
+    monkeypatch.setattr(hasher, 'generate_many', overloaded)
+
+    response = client.post('/import-users', data=ndjson(user('busy@example.com')), headers=import_key)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '7'
+
+
+def test_rows_the_database_rejects_fall_back_to_row_by_row(client, import_key, monkeypatch):
+    import bulk_import
+    from sqlalchemy.exc import DataError
+    insert_rows = bulk_import._insert_rows
+
+    # What Postgres raises for a value longer than its column
+    def strict_insert(rows, hashes):
+        if any(len(data['lastname']) > 100 for _, data in rows):
+            raise DataError('INSERT', {}, Exception('value too long for type character varying(100)'))
+        insert_rows(rows, hashes)
+    monkeypatch.setattr(bulk_import, '_insert_rows', strict_insert)
+
+    body = ndjson(user('short@example.com'), user('long@example.com', lastname='x' * 101))
+    result = client.post('/import-users', data=body, headers=import_key).get_json()
+    assert result['created'] == 1
+    assert result['errors'][0]['email'] == 'long@example.com'
+    assert 'value too long' in result['errors'][0]['error']
@@ -0,0 +1,35 @@
+import threading
+import time
+from werkzeug.security import check_password_hash, generate_password_hash
+import hashing
+from hashing import PasswordHasher
+from password_policy import PasswordPolicy
+
+
+def test_generate_many_returns_hashes_in_order():
+    hasher = PasswordHasher(workers=2)
+    try:
+        passwords = [f"password-{i}" for i in range(7)]
+        hashes = hasher.generate_many(passwords)
+        assert all(check_password_hash(h, p) for h, p in zip(hashes, passwords))
+    finally:
+        hasher.shutdown()
+
+
+def test_bulk_batch_does_not_starve_interactive_calls(monkeypatch):
+    # About 0.15s a hash: the batch takes well over the timeout, one hash well under it
+    monkeypatch.setattr(hashing, 'policy', PasswordPolicy('pbkdf2', 200_000))
+    hasher = PasswordHasher(workers=1, timeout=1.0)
+    try:
+        pwhash = generate_password_hash('password', 'pbkdf2:sha256:1000')
+        hasher.check(pwhash, 'password')  # Start the pool process
+
+        batch = threading.Thread(target=hasher.generate_many, args=([f"bulk-{i}" for i in range(19)],))
+        batch.start()
+        time.sleep(0.3)  # Let the batch get going first
+        try:
+            assert hasher.check(pwhash, 'password')
+        finally:
+            batch.join()
+    finally:
+        hasher.shutdown()
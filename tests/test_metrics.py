@@ -0,0 +1,86 @@
+import json
+import os
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from metrics import EXITED_FILE, MetricsExporter, registry
+
+COUNTER = 'http_requests_total'
+GAUGE = 'http_requests_in_flight'
+
+
+def snapshot(requests, in_flight):
+    data = registry.snapshot()
+    data[COUNTER]["samples"] = [[["GET", "hello", "200"], requests]]
+    data[GAUGE]["samples"] = [[[], in_flight]]
+    return data
+
+
+def value(text, prefix):
+    lines = [line for line in text.splitlines() if line.startswith(prefix)]
+    return float(lines[0].rsplit(' ', 1)[1]) if lines else 0
+
+
+@pytest.fixture
+def exporter(tmp_path):
+    return MetricsExporter(str(tmp_path), interval=60)
+
+
+# A pid that can't belong to a live process
+DEAD = 2 ** 22 + 1
+
+
+def write(exporter, pid, data):
+    with open(os.path.join(exporter.directory, f"{pid}.json"), 'w') as f:
+        json.dump(data, f)
+
+
+def test_stray_files_are_ignored(exporter):
+    write(exporter, DEAD, snapshot(3, 1))
+    for name in ('notes.json', 'backup.json.tmp', '12a.json'):
+        with open(os.path.join(exporter.directory, name), 'w') as f:
+            f.write('{}')
+    text = exporter.collect()
+    assert value(text, f'{COUNTER}{{method="GET",endpoint="hello",status="200"}}') >= 3
+
+
+def test_exited_workers_are_folded_into_one_file(exporter):
+    label = f'{COUNTER}{{method="GET",endpoint="hello",status="200"}}'
+    before = value(exporter.collect(), label)
+    write(exporter, DEAD, snapshot(3, 1))
+    write(exporter, DEAD + 1, snapshot(4, 1))
+    assert value(exporter.collect(), label) == before + 7
+
+    exporter.fold(DEAD)
+    exporter.fold(DEAD + 1)
+    assert sorted(os.listdir(exporter.directory)) == [EXITED_FILE]
+    text = exporter.collect()
+    assert value(text, label) == before + 7
+    # Only this process's gauge is left
+    own = registry.snapshot()[GAUGE]["samples"]
+    assert value(text, f'{GAUGE} ') == (own[0][1] if own else 0)
+
+    # A later worker with the same metrics adds to the folded totals
+    write(exporter, DEAD + 2, snapshot(5, 0))
+    exporter.fold(DEAD + 2)
+    assert value(exporter.collect(), label) == before + 12
+
+
+def test_a_folded_snapshot_is_not_counted_twice(exporter):
+    label = f'{COUNTER}{{method="GET",endpoint="hello",status="200"}}'
+    before = value(exporter.collect(), label)
+    write(exporter, DEAD, snapshot(3, 0))
+    exporter.fold(DEAD)
+    # As if collect() ran between fold's two writes
+    write(exporter, DEAD, snapshot(3, 0))
+    assert value(exporter.collect(), label) == before + 3
+
+
+def test_failed_statement_does_not_leave_its_start_time():
+    engine = create_engine('sqlite://')
+    with engine.connect() as conn:
+        with pytest.raises(OperationalError):
+            conn.execute(text('SELECT * FROM missing'))
+        assert conn.info['query_start'] == []
+        conn.execute(text('SELECT 1'))
+        assert conn.info['query_start'] == []
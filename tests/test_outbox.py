@@ -0,0 +1,70 @@
+import pytest
+import outbox
+import routes
+from conftest import create_user
+from database import db
+from models import OutboxJob
+
+
+class ListMailer:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message, key):
+        self.sent.append(message)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def reset_token_in_response(monkeypatch):
+    monkeypatch.setattr(routes, 'RESET_TOKEN_IN_RESPONSE', True)
+
+
+@pytest.fixture
+def mailer(monkeypatch):
+    mailer = ListMailer()
+    monkeypatch.setattr(outbox, 'mailer', mailer)
+    return mailer
+
+
+def forgot_password(client):
+    response = client.post('/forgot-password', json={'email': 'member@example.com'})
+    assert response.status_code == 200
+    return response.get_json()['token']
+
+
+def test_reset_job_stores_no_token_and_the_worker_sends_it(app, client, mailer, reset_token_in_response):
+    create_user(app)
+    token = forgot_password(client)
+
+    with app.app_context():
+        payload = db.session.execute(db.select(OutboxJob.payload)).scalar_one()
+    assert token not in str(payload)
+
+    assert outbox.OutboxWorker(app).run_once() == 1
+    assert len(mailer.sent) == 1
+    assert token in mailer.sent[0].get_content()
+
+
+def test_replaced_reset_token_is_not_sent(app, client, mailer, reset_token_in_response):
+    create_user(app)
+    forgot_password(client)
+    token = forgot_password(client)
+
+    assert outbox.OutboxWorker(app).run_once() == 2
+    assert len(mailer.sent) == 1
+    assert token in mailer.sent[0].get_content()
+    with app.app_context():
+        assert db.session.execute(db.select(OutboxJob)).first() is None
+
+
+def test_reset_token_is_only_emailed_by_default(app, client, mailer):
+    create_user(app)
+
+    response = client.post('/forgot-password', json={'email': 'member@example.com'})
+    assert response.status_code == 200
+    assert 'token' not in response.get_json()
+    assert outbox.OutboxWorker(app).run_once() == 1
+    assert len(mailer.sent) == 1
@@ -0,0 +1,46 @@
+import io
+import pytest
+import routes
+from conftest import auth_headers, create_user
+from database import db
+from media import FileSystemStorage
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+
+
+@pytest.fixture
+def storage(monkeypatch, tmp_path):
+    storage = FileSystemStorage(root=str(tmp_path / 'media'))
+    monkeypatch.setattr(routes, 'storage', storage)
+    # Thumbnails are not what these tests look at
+    monkeypatch.setattr(routes.thumbnails, 'schedule', lambda key: None)
+    return storage
+
+
+class CheckedStream(io.BytesIO):
+    """Request body that records how many pool connections are out while it is read."""
+
+    def __init__(self, data, pool):
+        super().__init__(data)
+        self.pool = pool
+        self.checked_out = []
+
+    def read(self, size=-1):
+        self.checked_out.append(self.pool.checkedout())
+        return super().read(size)
+
+    def readinto(self, buffer):
+        self.checked_out.append(self.pool.checkedout())
+        return super().readinto(buffer)
+
+
+def test_upload_holds_no_connection_while_reading_the_body(app, client, storage):
+    headers = auth_headers(app, create_user(app))
+    with app.app_context():
+        body = CheckedStream(PNG, db.engine.pool)
+
+    response = client.put('/profile/picture', headers={**headers, 'Content-Type': 'image/png'},
+                          input_stream=body, content_length=len(PNG))
+    assert response.status_code == 201
+    assert body.checked_out and set(body.checked_out) == {0}
+    assert client.get('/profile', headers=headers).get_json()['profile_picture'] == response.get_json()['profile_picture']
@@ -0,0 +1,55 @@
+from conftest import auth_headers, create_user
+from cache import lookup_cache
+from query_profiler import assert_max_queries
+
+
+def test_get_profile_loads_user_and_profile_in_one_query(app, client):
+    headers = auth_headers(app, create_user(app, bio='Hello'))
+
+    # Cold: the user lookup for the new token, then user and profile together
+    with assert_max_queries(2) as statements:
+        response = client.get('/profile', headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['bio'] == 'Hello'
+    assert 'JOIN profiles' in statements[-1]
+
+    # Served from the lookup cache
+    with assert_max_queries(0):
+        assert client.get('/profile', headers=headers).status_code == 200
+
+
+def test_get_profile_without_cache_issues_one_query_per_request(make_app):
+    backend, lookup_cache.backend = lookup_cache.backend, None
+    try:
+        app = make_app()
+        client = app.test_client()
+        headers = auth_headers(app, create_user(app))
+        client.get('/profile', headers=headers)
+        for _ in range(3):
+            with assert_max_queries(1):
+                assert client.get('/profile', headers=headers).status_code == 200
+    finally:
+        lookup_cache.backend = backend
+
+
+def test_update_profile_loads_and_writes_without_extra_queries(app, client):
+    headers = auth_headers(app, create_user(app))
+    client.get('/profile', headers=headers)
+
+    # One joined select and one UPDATE
+    with assert_max_queries(2) as statements:
+        response = client.put('/profile', headers=headers, json={'bio': 'Updated'})
+    assert response.status_code == 200
+    assert 'JOIN profiles' in statements[0]
+    assert client.get('/profile', headers=headers).get_json()['bio'] == 'Updated'
+
+
+def test_get_profile_revalidates_a_weakened_etag(app, client):
+    headers = auth_headers(app, create_user(app))
+    etag = client.get('/profile', headers=headers).headers['ETag']
+
+    # A compressing proxy hands the client back a weak validator
+    weak = etag if etag.startswith('W/') else f'W/{etag}'
+    with assert_max_queries(0):
+        response = client.get('/profile', headers={**headers, 'If-None-Match': weak})
+    assert response.status_code == 304
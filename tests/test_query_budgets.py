@@ -0,0 +1,74 @@
+import pytest
+import routes
+from auth import token_cache
+from cache import lookup_cache
+from conftest import auth_headers, create_user
+from media import FileSystemStorage
+from query_profiler import profiler
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+
+
+@pytest.fixture
+def app(make_app, monkeypatch, tmp_path):
+    """An app that answers a request over its ``query_budget`` with a 500."""
+    monkeypatch.setattr(profiler, 'enabled', True)
+    monkeypatch.setattr(profiler, 'enforce', True)
+    monkeypatch.setattr(routes, 'RESET_TOKEN_IN_RESPONSE', True)
+    monkeypatch.setattr(routes, 'storage', FileSystemStorage(root=str(tmp_path / 'media')))
+    monkeypatch.setattr(routes.thumbnails, 'schedule', lambda key: None)
+    return make_app()
+
+
+def clear_caches():
+    token_cache.clear()
+    if lookup_cache.backend is not None:
+        lookup_cache.backend.clear()
+
+
+def cold(app, user_id):
+    """Headers with a fresh token and nothing about the user cached: the most queries a request makes."""
+    headers = auth_headers(app, user_id)
+    clear_caches()
+    return headers
+
+
+def check(response, status):
+    # The profiler's 500 names the route and its query count
+    assert response.status_code == status, response.get_json()
+    assert 'db;dur=' in response.headers['Server-Timing']
+
+
+def test_every_endpoint_stays_within_its_budget_with_a_cold_token(app, client):
+    user_id = create_user(app, password='password')
+
+    check(client.post('/signup', json={'firstname': 'Grace', 'lastname': 'Hopper', 'email': 'grace@example.com',
+                                       'password': 'password', 'entity': 'bit'}), 201)
+
+    clear_caches()
+    response = client.post('/signin', json={'email': 'member@example.com', 'password': 'password'})
+    check(response, 200)
+    refresh_token = response.get_json()['refresh_token']
+    check(client.post('/token/refresh', json={'refresh_token': refresh_token}), 200)
+
+    check(client.get('/profile', headers=cold(app, user_id)), 200)
+    check(client.put('/profile', headers=cold(app, user_id), json={'bio': 'Updated'}), 200)
+    check(client.put('/profile/picture', headers={**cold(app, user_id), 'Content-Type': 'image/png'}, data=PNG), 201)
+    check(client.post('/logout', headers=cold(app, user_id)), 200)
+
+    check(client.put('/change-password', headers=cold(app, user_id), json={
+        'old_password': 'password', 'new_password': 'changed', 'confirm_password': 'changed'}), 200)
+
+    clear_caches()
+    response = client.post('/forgot-password', json={'email': 'member@example.com'})
+    check(response, 200)
+    check(client.post('/reset-password', json={'token': response.get_json()['token'], 'new_password': 'reset',
+                                               'confirm_password': 'reset'}), 200)
+
+
+def test_request_over_its_budget_gets_a_500(app, client, monkeypatch):
+    monkeypatch.setattr(app.view_functions['routes.get_profile'], 'query_budget', 1)
+
+    response = client.get('/profile', headers=cold(app, create_user(app)))
+    assert response.status_code == 500
+    assert response.get_json()['error'] == 'Query budget exceeded'
@@ -0,0 +1,86 @@
+"""Every lookup the auth routes make must be served by an index (SQLite ``EXPLAIN QUERY PLAN``)."""
+import re
+import pytest
+from sqlalchemy import event
+from conftest import auth_headers, create_user
+from database import db
+
+# A full scan shows up as "SCAN <table>" without an index
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+
+@pytest.fixture
+def captured(app):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            statements.append((statement, parameters))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    yield statements
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+def query_plans(app, statements, table, where=''):
+    plans = []
+    with app.app_context():
+        for statement, parameters in statements:
+            if f'FROM {table}' not in statement or where not in statement:
+                continue
+            rows = db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)
+            plans.append((statement, [row.detail for row in rows]))
+    assert plans, f"no query on {table} was issued"
+    return plans
+
+
+def assert_indexed(app, statements, table):
+    for statement, plan in query_plans(app, statements, table):
+        scans = [detail for detail in plan if FULL_SCAN.match(detail)]
+        assert not scans, f"full table scan in {plan} for:\n{statement}"
+        assert any('INDEX' in detail or 'PRIMARY KEY' in detail for detail in plan), plan
+
+
+@pytest.mark.parametrize('email', ['member@example.com', 'Member@Example.COM'])
+def test_email_lookups_use_the_lower_email_index(app, client, captured, email):
+    create_user(app)
+    client.post('/signup', json={"firstname": "A", "lastname": "B", "email": email, "password": "pw", "entity": "e"})
+    client.post('/signin', json={"email": email, "password": "password"})
+    client.post('/forgot-password', json={"email": email})
+    for _, plan in query_plans(app, captured, 'users', where='lower(users.email)'):
+        assert any('ix_users_email_lower' in detail for detail in plan), plan
+    assert_indexed(app, captured, 'users')
+
+
+def test_reset_token_lookup_uses_its_index(app, client, captured, monkeypatch):
+    import routes
+    monkeypatch.setattr(routes, 'RESET_TOKEN_IN_RESPONSE', True)
+    create_user(app)
+    token = client.post('/forgot-password', json={"email": "member@example.com"}).get_json()['token']
+    captured.clear()
+    response = client.post('/reset-password', json={"token": token, "new_password": "new-password",
+                                                     "confirm_password": "new-password"})
+    assert response.status_code == 200
+    for _, plan in query_plans(app, captured, 'users', where='reset_token_hash ='):
+        assert any('ix_users_reset_token_hash' in detail for detail in plan), plan
+    assert_indexed(app, captured, 'users')
+
+
+def test_profile_lookup_uses_primary_keys_and_the_user_id_index(app, client, captured):
+    headers = auth_headers(app, create_user(app))
+    assert client.get('/profile', headers=headers).status_code == 200
+    assert_indexed(app, captured, 'users')
+
+
+def test_entity_directory_pages_walk_the_entity_index(app, client, captured):
+    headers = auth_headers(app, create_user(app, entity='rare'))
+    create_user(app, email='rare-2@example.com', entity='rare')
+    for i in range(3):
+        create_user(app, email=f'other-{i}@example.com', entity='common')
+    first = client.get('/users?entity=rare&limit=1', headers=headers).get_json()
+    assert client.get(f"/users?entity=rare&limit=1&cursor={first['next_cursor']}", headers=headers).status_code == 200
+    for _, plan in query_plans(app, captured, 'users', where='users.entity ='):
+        assert any('ix_users_entity_created_at_id' in detail for detail in plan), plan
+        assert not any('TEMP B-TREE' in detail for detail in plan), plan
@@ -0,0 +1,149 @@
+import time
+import pytest
+import routes
+from sqlalchemy import update
+from conftest import auth_headers, create_user
+from database import db
+from models import Profile, User
+from replicas import replica_reads, replica_router
+
+REPLICA = 'replica_0'
+
+
+@pytest.fixture
+def app(make_app, tmp_path):
+    """An app on two SQLite files: the primary and one replica that only changes through ``replicate``."""
+    app = make_app({'SQLALCHEMY_BINDS': {REPLICA: {'url': f"sqlite:///{tmp_path / 'replica.db'}"}}})
+    with app.app_context():
+        db.metadata.create_all(db.engines[REPLICA])
+
+    # The prober was started by make_app; wait for its first probe
+    deadline = time.monotonic() + 5
+    while not all(prober.in_rotation() for prober in replica_router.probers):
+        assert time.monotonic() < deadline, replica_router.status()
+        time.sleep(0.01)
+
+    yield app
+    for prober in replica_router.probers:
+        prober.stop()
+    replica_router._pins.clear()
+
+
+def replicate(app):
+    """Copy the primary's users and profiles to the replica."""
+    tables = (User.__table__, Profile.__table__)
+    with app.app_context(), db.engines[REPLICA].begin() as replica:
+        for table in reversed(tables):
+            replica.execute(table.delete())
+        for table in tables:
+            rows = db.session.execute(table.select()).mappings().all()
+            if rows:
+                replica.execute(table.insert(), [dict(row) for row in rows])
+
+
+def on_replica(app, statement):
+    with app.app_context(), db.engines[REPLICA].begin() as replica:
+        replica.execute(statement)
+
+
+def test_profile_reads_go_to_the_replica(app, client):
+    user_id = create_user(app, bio='On the primary')
+    replicate(app)
+    on_replica(app, update(Profile).values(bio='On the replica'))
+
+    response = client.get('/profile', headers=auth_headers(app, user_id))
+    assert response.status_code == 200
+    assert response.get_json()['bio'] == 'On the replica'
+
+
+def test_lagging_replica_is_out_of_rotation(app, client):
+    user_id = create_user(app, bio='On the primary')
+    replicate(app)
+    on_replica(app, update(Profile).values(bio='On the replica'))
+    replica_router.probers[0].lag = replica_router.max_lag + 1
+
+    response = client.get('/profile', headers=auth_headers(app, user_id))
+    assert response.get_json()['bio'] == 'On the primary'
+
+
+def test_profile_missing_on_the_replica_is_read_from_the_primary(app, client):
+    user_id = create_user(app, bio='Just signed up')
+
+    response = client.get('/profile', headers=auth_headers(app, user_id))
+    assert response.status_code == 200
+    assert response.get_json()['bio'] == 'Just signed up'
+
+
+def test_reads_are_pinned_to_the_primary_after_a_write(app, client):
+    user_id = create_user(app, bio='Before')
+    other_id = create_user(app, email='other@example.com', bio='Other')
+    replicate(app)
+    on_replica(app, update(Profile).values(bio='On the replica'))
+    headers = auth_headers(app, user_id)
+
+    assert client.put('/profile', headers=headers, json={'bio': 'After'}).status_code == 200
+
+    # The replica still has the old row; the writer reads its change back from the primary
+    assert client.get('/profile', headers=headers).get_json()['bio'] == 'After'
+    # Other users keep reading from the replica
+    assert client.get('/profile', headers=auth_headers(app, other_id)).get_json()['bio'] == 'On the replica'
+
+
+def test_session_reads_from_the_primary_after_a_write(app):
+    with app.test_request_context():
+        with replica_reads() as replica:
+            assert replica == REPLICA
+        db.session.add(User(email='new@example.com', password_hash='x', entity='bit'))
+        db.session.flush()
+        with replica_reads() as replica:
+            assert replica is None
+            assert db.session.execute(db.select(User.email)).scalar_one() == 'new@example.com'
+        db.session.rollback()
+
+
+def test_signin_reads_a_new_user_from_the_primary(app, client):
+    create_user(app, email='new@example.com', password='secret')
+
+    response = client.post('/signin', json={'email': 'new@example.com', 'password': 'secret'})
+    assert response.status_code == 200
+    assert response.get_json()['token']
+
+
+def signin_status(client, password):
+    return client.post('/signin', json={'email': 'member@example.com', 'password': password}).status_code
+
+
+def test_old_password_is_rejected_after_a_change_while_the_replica_is_behind(app, client):
+    user_id = create_user(app, password='old password')
+    replicate(app)
+
+    response = client.put('/change-password', headers=auth_headers(app, user_id), json={
+        'old_password': 'old password', 'new_password': 'new password', 'confirm_password': 'new password'})
+    assert response.status_code == 200
+
+    # The replica still has the old hash
+    assert signin_status(client, 'old password') == 401
+    assert signin_status(client, 'new password') == 200
+
+
+def test_old_password_is_rejected_after_a_reset_while_the_replica_is_behind(app, client, monkeypatch):
+    monkeypatch.setattr(routes, 'RESET_TOKEN_IN_RESPONSE', True)
+    create_user(app, password='old password')
+    replicate(app)
+
+    token = client.post('/forgot-password', json={'email': 'member@example.com'}).get_json()['token']
+    response = client.post('/reset-password', json={
+        'token': token, 'new_password': 'new password', 'confirm_password': 'new password'})
+    assert response.status_code == 200
+
+    assert signin_status(client, 'old password') == 401
+    assert signin_status(client, 'new password') == 200
+
+
+def test_forgot_password_falls_back_to_the_primary_for_a_new_user(app, client):
+    create_user(app, email='new@example.com')
+
+    response = client.post('/forgot-password', json={'email': 'new@example.com'})
+    assert response.status_code == 200
+    response = client.post('/forgot-password', json={'email': 'nobody@example.com'})
+    assert response.status_code == 404
@@ -0,0 +1,143 @@
+"""Access and refresh tokens.
+
+Signin starts a session and returns two tokens:
+
+- an access token: a JWT valid for ``ACCESS_TOKEN_TTL`` seconds (default 15
+  minutes) with ``user_id``, ``jti`` (its id), ``sid`` (the session) and
+  ``iat``. It is verified without a database lookup and checked against the
+  in-process revocation set (``revocation.revocations``).
+- a refresh token: an opaque random string valid for ``REFRESH_TOKEN_TTL``
+  seconds (default 30 days). Only its SHA-256 digest is stored, in
+  ``refresh_tokens``.
+
+``POST /token/refresh`` exchanges a refresh token for a new pair and marks the
+old one used. Presenting a used refresh token again means it was copied, so
+the whole session is ended. Logout ends the session the access token belongs
+to; a password change or reset revokes every session of the user.
+
+Each function works on the Flask-SQLAlchemy session unless given another one
+as ``db_session`` (asgi.py passes its async session's sync session).
+"""
+import datetime
+import hashlib
+import os
+import secrets
+import time
+from sqlalchemy import select, update
+from auth import encode_token
+from database import db
+from logs import audit
+from models import RefreshToken, RevokedToken
+from revocation import revocations
+
+ACCESS_TOKEN_TTL = int(os.getenv('ACCESS_TOKEN_TTL', 900))
+REFRESH_TOKEN_TTL = int(os.getenv('REFRESH_TOKEN_TTL', 30 * 24 * 3600))
+
+
+def refresh_token_digest(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _utc(timestamp):
+    return datetime.datetime.utcfromtimestamp(timestamp)
+
+
+def issue_tokens(user_id, session_id=None, db_session=None):
+    """Create an access/refresh token pair; the refresh token is saved with the caller's commit."""
+    db_session = db_session or db.session
+    now = time.time()
+    session_id = session_id or secrets.token_hex(16)
+    jti = secrets.token_hex(16)
+    access_token = encode_token({
+        'user_id': user_id,
+        'jti': jti,
+        'sid': session_id,
+        'iat': now,
+        'exp': int(now) + ACCESS_TOKEN_TTL,
+    })
+    refresh_token = secrets.token_urlsafe(32)
+    db_session.add(RefreshToken(
+        user_id=user_id,
+        token_hash=refresh_token_digest(refresh_token),
+        session_id=session_id,
+        access_jti=jti,
+        expires_at=_utc(now + REFRESH_TOKEN_TTL),
+        created_at=_utc(now),
+    ))
+    return {"token": access_token, "refresh_token": refresh_token, "expires_in": ACCESS_TOKEN_TTL}
+
+
+def rotate_refresh_token(refresh_token, db_session=None):
+    """Exchange ``refresh_token`` for a new pair, or return None if it can't be used.
+
+    The caller commits.
+    """
+    db_session = db_session or db.session
+    row = db_session.execute(
+        select(RefreshToken).where(RefreshToken.token_hash == refresh_token_digest(refresh_token))
+    ).scalars().first()
+    now = datetime.datetime.utcnow()
+    if row is None or row.expires_at <= now:
+        return None
+
+    # Conditional, so of two concurrent refreshes with the same token only one wins
+    claimed = db_session.execute(
+        update(RefreshToken)
+        .where(RefreshToken.id == row.id, RefreshToken.used_at.is_(None))
+        .values(used_at=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not claimed:
+        # A used token came back while the session is live: someone else may hold a copy
+        if revoke_session(row.session_id, db_session):
+            audit('refresh_token_reused', user_id=row.user_id, session_id=row.session_id)
+        return None
+    return row.user_id, issue_tokens(row.user_id, row.session_id, db_session)
+
+
+def revoke_session(session_id, db_session=None):
+    """End a session: its refresh tokens stop working and its live access tokens are revoked.
+
+    Applied to this process at once; the caller commits. Returns False if the
+    session had already ended.
+    """
+    db_session = db_session or db.session
+    now = time.time()
+    ended = db_session.execute(
+        update(RefreshToken)
+        .where(RefreshToken.session_id == session_id, RefreshToken.used_at.is_(None))
+        .values(used_at=_utc(now))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not ended:
+        return False
+
+    # Access tokens issued with the session's refresh tokens in the last ACCESS_TOKEN_TTL may still be valid
+    rows = db_session.execute(
+        select(RefreshToken.access_jti, RefreshToken.created_at)
+        .where(RefreshToken.session_id == session_id,
+               RefreshToken.created_at > _utc(now - ACCESS_TOKEN_TTL - 1))
+    ).all()
+    for jti, created_at in rows:
+        expires_at = created_at.replace(tzinfo=datetime.timezone.utc).timestamp() + ACCESS_TOKEN_TTL + 1
+        revocations.add_jti(jti, expires_at)
+        db_session.add(RevokedToken(jti=jti, expires_at=_utc(expires_at), created_at=_utc(now)))
+    return True
+
+
+def revoke_user_tokens(user_id, db_session=None):
+    """Revoke every session and access token of ``user_id`` issued until now.
+
+    Applied to this process at once; the caller commits.
+    """
+    db_session = db_session or db.session
+    now = time.time()
+    db_session.execute(
+        update(RefreshToken)
+        .where(RefreshToken.user_id == user_id, RefreshToken.used_at.is_(None))
+        .values(used_at=_utc(now))
+        .execution_options(synchronize_session=False)
+    )
+    revocations.add_user(user_id, now, now + ACCESS_TOKEN_TTL + 1)
+    db_session.add(RevokedToken(user_id=user_id, issued_before=_utc(now),
+                                expires_at=_utc(now + ACCESS_TOKEN_TTL + 1), created_at=_utc(now)))